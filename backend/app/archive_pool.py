@@ -0,0 +1,166 @@
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .config import ARCHIVE_POOL_SIZE
+from .metrics import stage
+
+
+class ArchiveChangedError(zipfile.BadZipFile):
+    """El archivo se reemplazó y la versión con la que se indexó ya no está abierta."""
+
+
+class ArchiveHandle:
+    """
+    Descriptor abierto de un archivo de cómic.
+
+    Las lecturas usan os.pread, que no comparte posición de lectura, así que
+    varios hilos pueden leer del mismo descriptor a la vez sin bloquearse.
+    El ZipFile (solo para métodos de compresión poco comunes) sí va con lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        # Huella del archivo abierto, no de la ruta: si se reemplaza justo
+        # entre el stat y el open, el handle describe lo que de verdad lee
+        st = os.fstat(self.fd)
+        self.file_size = st.st_size
+        self.file_mtime = st.st_mtime_ns
+        self.refs = 0
+        self.retired = False
+        self._zip = None
+        self._zip_lock = threading.Lock()
+
+    def matches(self, st: os.stat_result) -> bool:
+        return self.file_size == st.st_size and self.file_mtime == st.st_mtime_ns
+
+    def pread(self, size: int, offset: int) -> bytes:
+        return os.pread(self.fd, size, offset)
+
+    def read_member(self, name: str) -> bytes:
+        with self._zip_lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(os.fdopen(os.dup(self.fd), "rb"))
+            return self._zip.read(name)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        os.close(self.fd)
+
+
+class ArchivePool:
+    """
+    Pool LRU de descriptores abiertos, compartido por todas las peticiones.
+
+    Un handle se invalida si cambia el tamaño o el mtime del archivo. Si se
+    expulsa mientras alguien lo está usando, se cierra al soltarlo.
+    """
+
+    def __init__(self, max_handles: int):
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, ArchiveHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @contextmanager
+    def acquire(self, path: str, fingerprint: tuple[int, int] | None = None):
+        handle = self.checkout(path, fingerprint)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def checkout(self, path: str, fingerprint: tuple[int, int] | None = None) -> ArchiveHandle:
+        """
+        Presta un handle; hay que devolverlo siempre con release().
+
+        Con fingerprint (tamaño y mtime_ns del índice con el que se va a leer)
+        se presta el handle de esa versión aunque el archivo se haya
+        reemplazado después con os.replace: su descriptor sigue leyendo el
+        contenido viejo, así que los offsets del índice siguen valiendo.
+
+        Raises:
+            ArchiveChangedError: si el archivo cambió y esa versión ya no está abierta
+        """
+        if fingerprint is not None:
+            with self._lock:
+                handle = self._handles.get(path)
+                if handle is not None and (handle.file_size, handle.file_mtime) == fingerprint:
+                    self.hits += 1
+                    self._handles.move_to_end(path)
+                    handle.refs += 1
+                    return handle
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            raise
+
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and handle.matches(st):
+                self.hits += 1
+                self._handles.move_to_end(path)
+            else:
+                if handle is not None:
+                    self.invalidations += 1
+                    self._retire(self._handles.pop(path))
+                self.misses += 1
+                with stage("archive_open"):
+                    handle = ArchiveHandle(path)
+                self._handles[path] = handle
+                while len(self._handles) > self.max_handles:
+                    _, oldest = self._handles.popitem(last=False)
+                    self.evictions += 1
+                    self._retire(oldest)
+            if fingerprint is not None and (handle.file_size, handle.file_mtime) != fingerprint:
+                raise ArchiveChangedError(f"{path} cambió desde que se indexó")
+            handle.refs += 1
+            return handle
+
+    def release(self, handle: ArchiveHandle):
+        with self._lock:
+            handle.refs -= 1
+            if handle.retired and handle.refs == 0:
+                handle.close()
+
+    def _retire(self, handle: ArchiveHandle):
+        # Llamar con self._lock tomado
+        handle.retired = True
+        if handle.refs == 0:
+            handle.close()
+
+    def invalidate(self, path: str):
+        with self._lock:
+            handle = self._handles.pop(path, None)
+            if handle is not None:
+                self.invalidations += 1
+                self._retire(handle)
+
+    def close_all(self):
+        with self._lock:
+            while self._handles:
+                _, handle = self._handles.popitem()
+                self._retire(handle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._handles),
+                "max_open": self.max_handles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+archive_pool = ArchivePool(ARCHIVE_POOL_SIZE)
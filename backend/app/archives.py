@@ -0,0 +1,478 @@
+"""
+Lectura de archivos de cómic con acceso directo a la página N.
+
+Módulo sin dependencias fuera de la biblioteca estándar: lo usan tanto el
+backend como el visor Qt (qtapp). Formatos:
+
+- ZIP / CBZ: offsets de cada entrada calculados una vez desde el directorio central.
+- TAR / CBT: sin comprimir, offsets de datos de cada miembro; comprimido
+  (tar.gz...) no admite acceso directo y se extrae una vez.
+- Carpeta de imágenes sueltas.
+- RAR / CBR: con una herramienta externa (unrar o bsdtar). Los RAR sólidos
+  obligarían a descomprimir todo lo anterior en cada página, así que se
+  extraen una vez a una carpeta.
+"""
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import Iterator
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+ARCHIVE_EXTENSIONS = ('.cbz', '.zip', '.cbt', '.tar', '.cbr', '.rar')
+
+# compress_type de las páginas que solo se pueden leer con la herramienta externa
+EXTERNAL = -1
+
+# Cabecera local de cada entrada ZIP: firma + 26 bytes, los dos últimos campos
+# son las longitudes del nombre y del campo extra
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+RAR_SIGNATURE = b"Rar!\x1a\x07"
+
+# Marca de extracción completa dentro de la carpeta de destino
+EXTRACTED_MARKER = ".extracted"
+
+
+class ArchiveError(zipfile.BadZipFile):
+    """Archivo dañado o en un formato que no se puede leer (hereda de BadZipFile)."""
+
+
+def is_page_name(name: str) -> bool:
+    return not name.startswith("__MACOSX") and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def natural_key(name: str) -> list:
+    """Clave de orden natural: "page2.jpg" antes que "page10.jpg"."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+@dataclass(frozen=True)
+class Member:
+    """
+    Página dentro de un archivo. Si data_offset >= 0 los datos (comprimidos
+    según compress_type) empiezan en ese offset de source; si no, solo se
+    pueden leer a través del lector.
+    """
+    name: str
+    source: str
+    data_offset: int
+    compress_size: int
+    file_size: int
+    compress_type: int = zipfile.ZIP_STORED
+    crc: int | None = None
+    header_offset: int = 0
+
+
+class ArchiveReader:
+    """Base: members en orden de lectura; read(n) es acceso directo a la página n."""
+
+    format = ""
+    extracted = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.members: list[Member] = []
+        self._fd = None
+        self._fd_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._fd_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def names(self) -> list[str]:
+        return [member.name for member in self.members]
+
+    def read(self, number: int) -> bytes:
+        member = self.members[number]
+        if member.compress_type == zipfile.ZIP_STORED and member.data_offset >= 0:
+            data = self._pread(member.source, member.data_offset, member.compress_size)
+        else:
+            data = self._read_member(member)
+        if member.crc is not None and zlib.crc32(data) != member.crc:
+            raise ArchiveError(f"CRC incorrecto para '{member.name}' en {self.path}")
+        return data
+
+    def iter_chunks(self, number: int, chunk_size: int) -> Iterator[bytes]:
+        """
+        Bytes de la página por bloques, sin tenerla entera en memoria. No
+        comprueba el CRC: quien recorre los bloques lo calcula.
+        """
+        member = self.members[number]
+        if member.compress_type == zipfile.ZIP_STORED and member.data_offset >= 0:
+            end = member.data_offset + member.compress_size
+            for offset in range(member.data_offset, end, chunk_size):
+                yield self._pread(member.source, offset, min(chunk_size, end - offset))
+        else:
+            yield from self._iter_member(member, chunk_size)
+
+    def _iter_member(self, member: Member, chunk_size: int) -> Iterator[bytes]:
+        yield self._read_member(member)
+
+    def read_prefix(self, number: int, size: int) -> bytes:
+        """Primeros bytes de la página (para el formato y las dimensiones)."""
+        member = self.members[number]
+        if member.compress_type == zipfile.ZIP_STORED and member.data_offset >= 0:
+            return self._pread(member.source, member.data_offset, min(size, member.compress_size))
+        return self.read(number)[:size]
+
+    def _pread(self, source: str, offset: int, size: int) -> bytes:
+        """
+        pread sobre un único descriptor del archivo, abierto la primera vez y
+        compartido por todos los hilos (pread no mueve la posición). Las
+        páginas sueltas (carpetas) se abren y cierran en cada lectura.
+        """
+        if source != self.path:
+            return _pread(source, offset, size)
+        with self._fd_lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDONLY)
+            fd = self._fd
+        data = os.pread(fd, size, offset)
+        if len(data) != size:
+            raise ArchiveError(f"Datos truncados en {source}")
+        return data
+
+    def _read_member(self, member: Member) -> bytes:
+        raise ArchiveError(f"No se puede leer '{member.name}' en {self.path}")
+
+
+def _pread(path: str, offset: int, size: int) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.pread(fd, size, offset)
+    finally:
+        os.close(fd)
+    if len(data) != size:
+        raise ArchiveError(f"Datos truncados en {path}")
+    return data
+
+
+def _pages(names) -> list[str]:
+    return sorted((name for name in names if is_page_name(name)), key=natural_key)
+
+
+class ZipReader(ArchiveReader):
+    format = "zip"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._zip = None
+        self._lock = threading.Lock()
+        try:
+            with open(path, "rb") as f, zipfile.ZipFile(f) as z:
+                infos = {i.filename: i for i in z.infolist() if not i.is_dir()}
+                for name in _pages(infos):
+                    info = infos[name]
+                    f.seek(info.header_offset)
+                    header = f.read(LOCAL_HEADER_SIZE)
+                    if len(header) != LOCAL_HEADER_SIZE or not header.startswith(LOCAL_HEADER_SIGNATURE):
+                        raise ArchiveError(f"Cabecera local inválida para '{name}' en {path}")
+                    name_len, extra_len = struct.unpack("<HH", header[26:30])
+                    self.members.append(Member(
+                        name=name,
+                        source=path,
+                        data_offset=info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len,
+                        compress_size=info.compress_size,
+                        file_size=info.file_size,
+                        compress_type=info.compress_type,
+                        crc=info.CRC,
+                        header_offset=info.header_offset,
+                    ))
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(str(e)) from e
+
+    def read_prefix(self, number: int, size: int) -> bytes:
+        member = self.members[number]
+        if member.compress_type != zipfile.ZIP_DEFLATED:
+            return super().read_prefix(number, size)
+        # Se descomprime solo lo necesario para llegar a size bytes
+        decompressor = zlib.decompressobj(-15)
+        out = b""
+        offset = member.data_offset
+        remaining = member.compress_size
+        try:
+            while len(out) < size and remaining > 0:
+                raw = self._pread(member.source, offset, min(64 * 1024, remaining))
+                offset += len(raw)
+                remaining -= len(raw)
+                out += decompressor.decompress(raw, size - len(out))
+                while decompressor.unconsumed_tail and len(out) < size:
+                    out += decompressor.decompress(decompressor.unconsumed_tail, size - len(out))
+        except zlib.error:
+            pass
+        return out
+
+    def _iter_member(self, member: Member, chunk_size: int) -> Iterator[bytes]:
+        if member.compress_type != zipfile.ZIP_DEFLATED:
+            yield from super()._iter_member(member, chunk_size)
+            return
+        decompressor = zlib.decompressobj(-15)
+        end = member.data_offset + member.compress_size
+        try:
+            for offset in range(member.data_offset, end, chunk_size):
+                data = decompressor.decompress(self._pread(member.source, offset, min(chunk_size, end - offset)))
+                if data:
+                    yield data
+            yield decompressor.flush()
+        except zlib.error as e:
+            raise ArchiveError(f"Error al descomprimir '{member.name}' en {self.path}") from e
+
+    def _read_member(self, member: Member) -> bytes:
+        if member.compress_type == zipfile.ZIP_DEFLATED:
+            raw = self._pread(member.source, member.data_offset, member.compress_size)
+            try:
+                return zlib.decompress(raw, -15)
+            except zlib.error as e:
+                raise ArchiveError(f"Error al descomprimir '{member.name}' en {self.path}") from e
+        # bzip2, lzma...: a través de zipfile
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.path)
+            return self._zip.read(member.name)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        super().close()
+
+
+class TarReader(ArchiveReader):
+    """TAR sin comprimir: los datos de cada miembro son un rango contiguo del archivo."""
+
+    format = "tar"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            with tarfile.open(path, "r:") as tar:
+                files = {m.name: m for m in tar.getmembers() if m.isfile()}
+        except tarfile.TarError as e:
+            raise ArchiveError(str(e)) from e
+        for name in _pages(files):
+            member = files[name]
+            self.members.append(Member(name, path, member.offset_data, member.size, member.size))
+
+
+class FolderReader(ArchiveReader):
+    """Carpeta de imágenes sueltas (incluidas subcarpetas)."""
+
+    format = "dir"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        found = {}
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                full = os.path.join(root, filename)
+                found[os.path.relpath(full, path).replace(os.sep, "/")] = full
+        for name in _pages(found):
+            size = os.path.getsize(found[name])
+            self.members.append(Member(name, found[name], 0, size, size))
+
+
+class ExtractedReader(FolderReader):
+    """Archivo sólido ya extraído a una carpeta: se lee como imágenes sueltas."""
+
+    extracted = True
+
+    def __init__(self, path: str, folder: str, format: str, temporary: bool = False):
+        super().__init__(folder)
+        self.path = path
+        self.folder = folder
+        self.format = format
+        self._temporary = temporary
+
+    def close(self):
+        super().close()
+        if self._temporary:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def rar_tool() -> str | None:
+    """Herramienta para RAR: RAR_TOOL, o la primera de unrar / bsdtar que haya."""
+    configured = os.getenv("RAR_TOOL")
+    if configured:
+        return shutil.which(configured)
+    return shutil.which("unrar") or shutil.which("bsdtar")
+
+
+def _run(args: list[str]) -> bytes:
+    try:
+        result = subprocess.run(args, capture_output=True, check=False)
+    except OSError as e:
+        raise ArchiveError(f"No se pudo ejecutar {args[0]}: {e}") from e
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise ArchiveError(f"{os.path.basename(args[0])} falló: {message[-1] if message else result.returncode}")
+    return result.stdout
+
+
+def _is_unrar(tool: str) -> bool:
+    return os.path.basename(tool).startswith("unrar")
+
+
+def read_external(path: str, name: str, tool: str | None = None) -> bytes:
+    """Extrae una sola entrada de un RAR no sólido (unrar p)."""
+    tool = tool or rar_tool()
+    if tool is None:
+        raise ArchiveError("No hay herramienta para leer RAR (instala unrar o bsdtar)")
+    return _run([tool, "p", "-inul", "-p-", "--", path, name])
+
+
+class RarReader(ArchiveReader):
+    """
+    RAR no sólido leído con unrar: cada página se extrae sola (unrar p).
+    Los sólidos, o si solo hay bsdtar, se extraen enteros (ver open_archive).
+    """
+
+    format = "rar"
+
+    def __init__(self, path: str, tool: str):
+        super().__init__(path)
+        self.tool = tool
+        self.solid = True
+        if not _is_unrar(tool):
+            # bsdtar lee el archivo de forma secuencial: siempre se extrae
+            return
+
+        listing = _run([tool, "lt", "-p-", "--", path]).decode("utf-8", "replace")
+        self.solid = any(line.strip().startswith("Details:") and "solid" in line.lower()
+                         for line in listing.splitlines())
+        files = {}
+        current = {}
+        for line in listing.splitlines() + [""]:
+            key, _, value = line.strip().partition(": ")
+            if key == "Name":
+                current = {"name": value}
+            elif current and key in ("Type", "Size", "CRC32"):
+                current[key] = value
+            elif not line.strip() and current:
+                if current.get("Type") == "File":
+                    files[current["name"]] = current
+                current = {}
+        for name in _pages(files):
+            info = files[name]
+            size = int(info.get("Size", "0") or 0)
+            crc = int(info["CRC32"], 16) if info.get("CRC32") else None
+            self.members.append(Member(name, path, -1, size, size, EXTERNAL, crc))
+
+    def _read_member(self, member: Member) -> bytes:
+        return read_external(self.path, member.name, self.tool)
+
+    def extract_all(self, dest: str):
+        if _is_unrar(self.tool):
+            _run([self.tool, "x", "-o+", "-p-", "-inul", "--", self.path, dest + os.sep])
+        else:
+            _run([self.tool, "-xf", self.path, "-C", dest])
+
+
+def _extract_tar(path: str, dest: str):
+    try:
+        with tarfile.open(path, "r:*") as tar:
+            tar.extractall(dest, members=[m for m in tar.getmembers() if m.isfile()], filter="data")
+    except tarfile.TarError as e:
+        raise ArchiveError(str(e)) from e
+
+
+def extract_once(path: str, folder: str, extract) -> str:
+    """
+    Extrae el archivo en folder si no se hizo ya. Se extrae a una carpeta
+    temporal al lado y se renombra, así una extracción a medias nunca se toma
+    por buena.
+    """
+    if os.path.exists(os.path.join(folder, EXTRACTED_MARKER)):
+        return folder
+    parent = os.path.dirname(os.path.abspath(folder))
+    os.makedirs(parent, exist_ok=True)
+    partial = tempfile.mkdtemp(prefix=".extract-", dir=parent)
+    try:
+        extract(partial)
+        open(os.path.join(partial, EXTRACTED_MARKER), "wb").close()
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(partial, folder)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return folder
+
+
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "dir"
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if head.startswith(RAR_SIGNATURE):
+        return "rar"
+    if tarfile.is_tarfile(path):
+        return "tar"
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".cbz", ".zip"):
+        return "zip"
+    raise ArchiveError(f"Formato de archivo no soportado: {path}")
+
+
+def open_archive(path: str, extract_dir: str | None = None) -> ArchiveReader:
+    """
+    Abre un cómic en cualquiera de los formatos soportados.
+
+    Los que no admiten acceso directo (RAR sólido, tar comprimido) se extraen
+    una vez en extract_dir, que se reutiliza en llamadas siguientes; sin
+    extract_dir se usa una carpeta temporal que se borra al cerrar el lector.
+
+    Raises:
+        FileNotFoundError: si la ruta no existe
+        ArchiveError: si el archivo está dañado o no se puede leer
+    """
+    kind = detect_format(path)
+    if kind == "zip":
+        return ZipReader(path)
+    if kind == "dir":
+        return FolderReader(path)
+
+    if kind == "tar":
+        try:
+            return TarReader(path)
+        except ArchiveError:
+            extract = lambda dest: _extract_tar(path, dest)
+    else:
+        tool = rar_tool()
+        if tool is None:
+            raise ArchiveError("No hay herramienta para leer RAR (instala unrar o bsdtar)")
+        reader = RarReader(path, tool)
+        if not reader.solid:
+            return reader
+        extract = reader.extract_all
+
+    temporary = extract_dir is None
+    folder = tempfile.mkdtemp(prefix="comic-") if temporary else extract_dir
+    try:
+        extract_once(path, folder, extract)
+    except BaseException:
+        if temporary:
+            shutil.rmtree(folder, ignore_errors=True)
+        raise
+    return ExtractedReader(path, folder, kind, temporary)
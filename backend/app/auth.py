@@ -1,7 +1,15 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, UTC
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
+from sqlalchemy import event
+
+from . import models
+from .config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
 
 SECRET_KEY = "cambia-esta-clave-super-secreta-en-produccion-2025"
 ALGORITHM = "HS256"
@@ -20,8 +28,79 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=2
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_token(token: str):
+    return decode_token_claims(token)[0]
+
+def decode_token_claims(token: str):
+    """Devuelve (sub, exp) de un token válido; exp es un timestamp o None."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
+        return payload.get("sub"), payload.get("exp")
     except JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuario autenticado, desligado de la sesión de base de datos."""
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    """
+    Caché LRU de token verificado -> Principal, para no decodificar el JWT ni
+    consultar la tabla de usuarios en cada petición. Cada entrada caduca con
+    el exp del token o a los PRINCIPAL_CACHE_TTL segundos, lo que llegue antes,
+    y se invalida al borrar el usuario.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Principal | None:
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(token)
+            if cached is None or cached[1] <= now:
+                if cached is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return cached[0]
+
+    def put(self, token: str, principal: Principal, exp: float | None = None):
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in [t for t, (p, _) in self._entries.items() if p.id == user_id]:
+                del self._entries[token]
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {"size": size, "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+@event.listens_for(models.User, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    # Solo borrados por el ORM (session.delete); un DELETE masivo no dispara
+    # el evento y la entrada dura como mucho PRINCIPAL_CACHE_TTL
+    principal_cache.invalidate_user(target.id)
\ No newline at end of file
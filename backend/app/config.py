@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+
+
+# Carpeta de cómics (en Docker es el volumen /comics)
+COMICS_DIR = Path(os.getenv("COMICS_DIR", os.path.join(os.path.dirname(__file__), "../../comics")))
+
+# Número de índices de páginas que se mantienen en memoria por proceso
+PAGE_INDEX_MEMO_SIZE = int(os.getenv("PAGE_INDEX_MEMO_SIZE", "256"))
+
+# Máximo de archivos de cómic abiertos a la vez en el pool de descriptores
+ARCHIVE_POOL_SIZE = int(os.getenv("ARCHIVE_POOL_SIZE", "64"))
+
+# Caché en disco (en Docker es el volumen ./cache montado en /app/cache)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), "../cache")))
+
+# Caché en disco compartida por todos los workers del host (ver
+# shared_cache.py): renditions, tiles, miniaturas y páginas descomprimidas.
+# Tamaño máximo total (RENDITION_CACHE_MAX_BYTES es el nombre anterior), cada
+# cuántos segundos se apuntan los accesos en el índice y archivos mapeados
+# (mmap) por proceso
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", os.getenv("RENDITION_CACHE_MAX_BYTES", str(4 * 1024 ** 3))))
+CACHE_TOUCH_INTERVAL = float(os.getenv("CACHE_TOUCH_INTERVAL", "5"))
+CACHE_MAPPED_FILES = int(os.getenv("CACHE_MAPPED_FILES", "256"))
+
+# Ancho máximo de las versiones redimensionadas (WebP/AVIF/JPEG)
+RENDITION_MAX_WIDTH = int(os.getenv("RENDITION_MAX_WIDTH", "4096"))
+
+# Hash de contenido de cada página al indexar (deduplicación entre archivos
+# de las cachés derivadas). Obliga a leer cada página entera en el escaneo;
+# con 0 solo se leen las cabeceras y las cachés usan claves por archivo
+PAGE_CONTENT_HASH = os.getenv("PAGE_CONTENT_HASH", "1") != "0"
+
+# Escaneo de la biblioteca: paralelismo ("thread" o "process") y tamaño de lote
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(min(8, os.cpu_count() or 4))))
+SCAN_EXECUTOR = os.getenv("SCAN_EXECUTOR", "thread")
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "200"))
+
+# Tamaño máximo de un archivo subido
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+
+# Portadas y miniaturas (WebP) generadas en segundo plano
+COVER_WIDTH = int(os.getenv("COVER_WIDTH", "300"))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "160"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Precarga de páginas alrededor de la que se lee
+READAHEAD_PAGES = int(os.getenv("READAHEAD_PAGES", "4"))
+READAHEAD_WORKERS = int(os.getenv("READAHEAD_WORKERS", "2"))
+BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "16"))
+
+# Tamaño máximo de página del listado GET /comics
+LISTING_MAX_LIMIT = int(os.getenv("LISTING_MAX_LIMIT", "500"))
+
+# Lectura de páginas: hilos de I/O, trabajos simultáneos por archivo y cola
+# máxima antes de responder 503 (con Retry-After en segundos)
+PAGE_IO_WORKERS = int(os.getenv("PAGE_IO_WORKERS", "16"))
+PAGE_IO_PER_ARCHIVE = int(os.getenv("PAGE_IO_PER_ARCHIVE", "4"))
+PAGE_IO_MAX_QUEUE = int(os.getenv("PAGE_IO_MAX_QUEUE", "256"))
+PAGE_IO_RETRY_AFTER = int(os.getenv("PAGE_IO_RETRY_AFTER", "1"))
+
+# Progreso de lectura: cada cuántos segundos se vuelca a la base de datos
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "2"))
+PROGRESS_FLUSH_BATCH = int(os.getenv("PROGRESS_FLUSH_BATCH", "500"))
+
+# Procesos de uvicorn (uvicorn --workers toma el mismo valor por defecto). La
+# escritura diferida del progreso es solo para un proceso: el buffer de uno no
+# lo ven los demás, así que con varios cada cambio se escribe al momento
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+PROGRESS_WRITE_BEHIND = WEB_CONCURRENCY <= 1
+
+# SQLite: conexiones del pool y espera máxima cuando la base está bloqueada
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Tokens ya verificados que se recuerdan (y durante cuántos segundos como máximo)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+# Tiras verticales (webtoon/manhwa) por tiles: alto de cada tile y memoria
+# para las tiras ya decodificadas
+TILE_HEIGHT = int(os.getenv("TILE_HEIGHT", "1024"))
+TILE_STRIP_CACHE_BYTES = int(os.getenv("TILE_STRIP_CACHE_BYTES", str(512 * 1024 ** 2)))
+
+# Peticiones de página que tarden más (ms) se registran con su desglose por
+# etapas; 0 lo desactiva
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Sincronización de la biblioteca al vuelo: "auto" (inotify en Linux, si no
+# sondeo), "inotify", "poll" u "off". Los cambios se aplican cuando una ruta
+# lleva WATCH_DEBOUNCE_SECONDS sin eventos; el sondeo recorre la biblioteca
+# cada WATCH_POLL_INTERVAL segundos
+LIBRARY_WATCH = os.getenv("LIBRARY_WATCH", "auto")
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2"))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "30"))
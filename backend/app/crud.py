@@ -1,28 +1,154 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 from . import models, schemas
-from .utils import save_comic_file, extract_pages_list
+from .utils import comic_path, scan_pages
+from .page_index import write_page_indexes
+from .uploads import ReceivedUpload
 import os
 
-def create_comic(db: Session, file_content: bytes, filename: str):
-    filepath = save_comic_file(file_content, filename)
-    pages = extract_pages_list(filepath)
-
-    comic = models.Comic(
-        filename=filename,
-        title=os.path.splitext(filename)[0],
-        pages=len(pages)
-    )
-    db.add(comic)
-    db.commit()
+def create_comic(db: Session, upload: ReceivedUpload):
+    """
+    Da de alta un cómic subido a partir de su archivo temporal.
+
+    Returns:
+        (comic, created): si ya existe un cómic con el mismo contenido se
+        devuelve ese y no se guarda otra copia
+
+    Raises:
+        zipfile.BadZipFile: si el archivo no es un cómic válido (archives.ArchiveError)
+        ValueError: si no contiene imágenes
+        FileExistsError: si ya hay otro archivo con ese nombre
+    """
+    duplicate = db.query(models.Comic).join(
+        models.ArchiveIndex, models.ArchiveIndex.comic_id == models.Comic.id
+    ).filter(models.ArchiveIndex.content_hash == upload.sha256).first()
+    if duplicate:
+        upload.discard()
+        return duplicate, False
+
+    # Validar e indexar desde el temporal; los offsets no cambian al renombrar.
+    # Un archivo sólido se extrae a un temporal aquí y de nuevo (ya en su
+    # carpeta definitiva) la primera vez que se lea
+    scan = scan_pages(upload.temp_path)
+    if not scan.pages:
+        raise ValueError("El archivo no contiene imágenes")
+
+    filepath = comic_path(upload.filename)
+    try:
+        # link() no pisa un archivo existente, a diferencia de rename()
+        os.link(upload.temp_path, filepath)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.exists(filepath):
+            raise FileExistsError(filepath)
+        os.replace(upload.temp_path, filepath)
+    upload.discard()
+
+    try:
+        st = os.stat(filepath)
+        comic = models.Comic(
+            filename=upload.filename,
+            title=os.path.splitext(upload.filename)[0],
+            pages=len(scan.pages)
+        )
+        db.add(comic)
+        db.flush()
+        write_page_indexes(db, [(comic.id, st.st_size, st.st_mtime_ns, scan)], {comic.id: upload.sha256})
+        db.commit()
+    except BaseException:
+        db.rollback()
+        os.unlink(filepath)
+        raise
     db.refresh(comic)
-    return comic
-
-def get_comics(db: Session, skip: int = 0, limit: int = 100):
-    #return db.query(models.Comic).offset(skip).limit(limit).all()
-    return db.query(models.Comic).order_by(
-            models.Comic.series.asc(), 
-            models.Comic.volume.asc()
-        ).offset(skip).limit(limit).all()
+    return comic, True
+
+# Columnas que necesita la cuadrícula de la biblioteca (?view=grid)
+GRID_COLUMNS = (
+    models.Comic.id,
+    models.Comic.title,
+    models.Comic.series,
+    models.Comic.volume,
+    models.Comic.pages,
+    models.Comic.cover_path,
+)
+
+
+def encode_cursor(series, volume, comic_id) -> str:
+    raw = json.dumps([series, volume, comic_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Raises ValueError si el cursor no es uno devuelto por get_comics."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        series, volume, comic_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    if not (series is None or isinstance(series, str)) or not isinstance(volume, int) \
+            or not isinstance(comic_id, int):
+        raise ValueError("Cursor inválido")
+    return series, volume, comic_id
+
+
+def get_comics(db: Session, limit: int = 100, cursor: str | None = None,
+               series: str | None = None, status: str | None = None, user_id: int | None = None,
+               added_after: datetime | None = None, added_before: datetime | None = None,
+               grid: bool = False):
+    """
+    Listado paginado por cursor (keyset) sobre (series, volume, id), que usa el
+    índice compuesto ix_comics_series_volume_id: cada página cuesta lo mismo
+    aunque se esté al final de la biblioteca.
+
+    status (read | reading | unread) se calcula con el progreso de user_id.
+    Con grid=True solo se leen GRID_COLUMNS.
+
+    Returns:
+        (filas, next_cursor); next_cursor es None en la última página
+    """
+    Comic = models.Comic
+    query = db.query(*GRID_COLUMNS) if grid else db.query(Comic)
+
+    if series is not None:
+        query = query.filter(Comic.series == series)
+    if added_after is not None:
+        query = query.filter(Comic.uploaded_at >= added_after)
+    if added_before is not None:
+        query = query.filter(Comic.uploaded_at < added_before)
+
+    if status is not None:
+        Progress = models.ReadingProgress
+        query = query.outerjoin(Progress, and_(Progress.comic_id == Comic.id, Progress.user_id == user_id))
+        current = func.coalesce(Progress.current_page, 0)
+        # Leído es estar en la última página; un cómic de una página cuenta como leído
+        finished = current >= Comic.pages - 1
+        if status == "unread":
+            query = query.filter(current == 0, ~finished)
+        elif status == "reading":
+            query = query.filter(current > 0, ~finished)
+        else:
+            query = query.filter(finished)
+
+    if cursor is not None:
+        last_series, last_volume, last_id = decode_cursor(cursor)
+        after = or_(Comic.volume > last_volume, and_(Comic.volume == last_volume, Comic.id > last_id))
+        # SQLite ordena los NULL primero: los cómics sin serie van antes que el resto
+        if last_series is None:
+            query = query.filter(or_(Comic.series.is_not(None), and_(Comic.series.is_(None), after)))
+        else:
+            query = query.filter(or_(Comic.series > last_series, and_(Comic.series == last_series, after)))
+
+    rows = query.order_by(Comic.series.asc(), Comic.volume.asc(), Comic.id.asc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.series, last.volume, last.id)
 
 def get_comic(db: Session, comic_id: int):
     return db.query(models.Comic).filter(models.Comic.id == comic_id).first()
\ No newline at end of file
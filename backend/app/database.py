@@ -1,8 +1,86 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from .config import DB_BUSY_TIMEOUT_MS, DB_MAX_OVERFLOW, DB_POOL_SIZE
+from .metrics import instrument_engine
+
 SQLITE_DB = "sqlite:///./comics.db"
-engine = create_engine(SQLITE_DB, connect_args={"check_same_thread": False})
+engine = create_engine(
+    SQLITE_DB,
+    connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+instrument_engine(engine)
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, _):
+    # WAL: los lectores no bloquean al escritor y cada commit no hace fsync
+    # de la base entera; synchronous=NORMAL es seguro en WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def reset_stale_tables(*tables):
+    """
+    Elimina tablas derivadas (índices, cachés) cuyo esquema ya no coincide con
+    el modelo, para que create_all las vuelva a crear. Solo para tablas que se
+    pueden reconstruir desde los archivos.
+    """
+    inspector = inspect(engine)
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        if existing != set(table.columns.keys()):
+            table.drop(bind=engine)
+
+
+def create_missing_indexes(*tables):
+    """create_all no añade índices nuevos a tablas que ya existen."""
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def add_missing_columns(*tables):
+    """
+    create_all tampoco añade columnas nuevas a tablas con datos que no se
+    pueden reconstruir; se añaden con su server_default.
+    """
+    inspector = inspect(engine)
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def drop_duplicate_rows(table, *columns):
+    """
+    Deja solo la fila más reciente (id mayor) por cada valor de columns, para
+    poder crear después un índice único sobre ellas.
+    """
+    keep = select(func.max(table.c.id)).group_by(*(table.c[name] for name in columns))
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.id.not_in(keep)))
+
+
+def drop_indexes(*names):
+    """Índices que el modelo ya no declara (sustituidos por otros)."""
+    with engine.begin() as conn:
+        for name in names:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
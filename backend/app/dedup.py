@@ -0,0 +1,158 @@
+"""
+Deduplicación por contenido e informe de lo que ahorra (GET /dedup).
+
+Páginas y archivos se identifican por su hash al indexarse:
+
+- Lo que se deriva de una página (renditions, tiles, miniaturas, portadas y
+  páginas descomprimidas) se guarda una vez por hash y lo comparten todos los
+  cómics que la contienen (créditos o portadas repetidas en cada capítulo).
+- Una subida con el mismo contenido que un cómic existente no se guarda: se
+  devuelve el existente con la cabecera X-Duplicate-Of.
+- Los archivos repetidos que ya están en la biblioteca no se tocan, solo se
+  listan.
+"""
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .readahead import page_cache
+from .renditions import CONTENT_PREFIX, rendition_cache
+
+
+# Grupos de archivos repetidos que se listan en el informe (los que más ocupan)
+REPORT_GROUPS = 20
+
+
+class UploadDedup:
+    """Subidas descartadas por duplicadas desde el arranque."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duplicates = 0
+        self.bytes_saved = 0
+
+    def record(self, size: int):
+        with self._lock:
+            self.duplicates += 1
+            self.bytes_saved += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"duplicates": self.duplicates, "bytes_saved": self.bytes_saved}
+
+
+upload_dedup = UploadDedup()
+
+
+def shared_pages(db: Session) -> dict[str, int]:
+    """Hash -> número de páginas con ese contenido, solo los que se repiten."""
+    page = models.ComicPage
+    return dict(db.execute(
+        select(page.content_hash, func.count())
+        .where(page.content_hash.is_not(None))
+        .group_by(page.content_hash)
+        .having(func.count() > 1)
+    ).all())
+
+
+def _pages_report(db: Session, shared: dict[str, int]) -> dict:
+    page = models.ComicPage
+    total, total_bytes = db.execute(select(func.count(), func.coalesce(func.sum(page.file_size), 0))).one()
+    unique = select(page.content_hash, func.max(page.file_size).label("size")).where(
+        page.content_hash.is_not(None)
+    ).group_by(page.content_hash).subquery()
+    unique_count, unique_bytes = db.execute(
+        select(func.count(), func.coalesce(func.sum(unique.c.size), 0))
+    ).one()
+    # Páginas sin hash (índices antiguos): cuentan como únicas
+    unhashed, unhashed_bytes = db.execute(
+        select(func.count(), func.coalesce(func.sum(page.file_size), 0)).where(page.content_hash.is_(None))
+    ).one()
+    unique_count += unhashed
+    unique_bytes += unhashed_bytes
+    return {
+        "pages": total,
+        "unique": unique_count,
+        "shared_hashes": len(shared),
+        "duplicate_pages": total - unique_count,
+        "bytes": total_bytes,
+        "unique_bytes": unique_bytes,
+        "bytes_saved": total_bytes - unique_bytes,
+    }
+
+
+def _archives_report(db: Session) -> dict:
+    archive = models.ArchiveIndex
+    size = func.max(archive.file_size)
+    groups = db.execute(
+        select(archive.content_hash, func.count().label("copies"), size.label("size"))
+        .where(archive.content_hash.is_not(None))
+        .group_by(archive.content_hash)
+        .having(func.count() > 1)
+        .order_by(((func.count() - 1) * size).desc(), archive.content_hash)
+    ).all()
+    top = groups[:REPORT_GROUPS]
+
+    comics: dict[str, list[dict]] = {}
+    if top:
+        for content_hash, comic_id, filename in db.execute(
+            select(archive.content_hash, models.Comic.id, models.Comic.filename)
+            .join(models.Comic, models.Comic.id == archive.comic_id)
+            .where(archive.content_hash.in_([group.content_hash for group in top]))
+            .order_by(models.Comic.id)
+        ):
+            comics.setdefault(content_hash, []).append({"id": comic_id, "filename": filename})
+
+    return {
+        "duplicate_groups": len(groups),
+        "duplicate_copies": sum(group.copies - 1 for group in groups),
+        # Repetidos que siguen en disco: se podrían borrar
+        "bytes_reclaimable": sum((group.copies - 1) * group.size for group in groups),
+        "groups": [
+            {"content_hash": group.content_hash, "size": group.size, "comics": comics.get(group.content_hash, [])}
+            for group in top
+        ],
+    }
+
+
+def _cache_report(sizes, content_hash, shared: dict[str, int]) -> dict:
+    """
+    Bytes en caché frente a los que ocuparía con una copia por página de
+    cómic: cada entrada de una página compartida por n páginas cuenta n veces.
+    """
+    stored = 0
+    without = 0
+    shared_entries = 0
+    for key, size in sizes:
+        refs = shared.get(content_hash(key), 1)
+        stored += size
+        without += size * refs
+        shared_entries += refs > 1
+    return {
+        "entries": len(sizes),
+        "shared_entries": shared_entries,
+        "bytes": stored,
+        "bytes_without_dedup": without,
+        "bytes_saved": without - stored,
+    }
+
+
+def _content_hash(key: str) -> str | None:
+    # pages/ab/<hash>[-<sufijo>]; los paquetes de miniaturas (pages/thumbs/...) no son de una página
+    parts = key.split("/")
+    if len(parts) != 3 or parts[0] != CONTENT_PREFIX or parts[1] == "thumbs":
+        return None
+    return parts[2].split("-", 1)[0]
+
+
+def dedup_report(db: Session) -> dict:
+    shared = shared_pages(db)
+    return {
+        "pages": _pages_report(db, shared),
+        "archives": _archives_report(db),
+        "uploads": upload_dedup.stats(),
+        "renditions": _cache_report(rendition_cache.sizes(), _content_hash, shared),
+        "page_cache": _cache_report(page_cache.sizes(), _content_hash, shared),
+    }
@@ -0,0 +1,90 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException, Request
+
+
+# Una página no cambia mientras no cambie el archivo, y si cambia cambia su ETag
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Para URLs cuyo contenido depende de qué páginas tenga el archivo ahora (se
+# puede reescribir): se guarda, pero se revalida con el ETag antes de usarla
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def cache_headers(etag: str, mtime_ns: int) -> dict:
+    return {
+        "etag": etag,
+        "last-modified": formatdate(mtime_ns // 1_000_000_000, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+    }
+
+
+def _etag_list(value: str) -> list[str]:
+    tags = []
+    for tag in value.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def is_not_modified(request: Request, etag: str, mtime_ns: int) -> bool:
+    """
+    Evalúa If-None-Match y, si no viene, If-Modified-Since (RFC 9110 §13.2.2).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etag_list(if_none_match)
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return mtime_ns // 1_000_000_000 <= since
+    return False
+
+
+def requested_range(request: Request, etag: str, size: int) -> tuple[int, int] | None:
+    """
+    Interpreta la cabecera Range (un solo rango de bytes).
+
+    Returns:
+        (start, end) con end exclusivo, o None si hay que enviar todo
+
+    Raises:
+        HTTPException 416 si el rango no se puede satisfacer
+    """
+    header = request.headers.get("range")
+    if not header or not header.startswith("bytes="):
+        return None
+    # If-Range con un ETag distinto: la copia del cliente es vieja, va completa
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None  # varios rangos: se permite responder con todo
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length < 0:
+                raise ValueError
+            # bytes=-0 (sufijo vacío) es válido pero no se puede satisfacer: 416
+            start, end = max(0, size - length), size
+        else:
+            start = int(first)
+            if start < 0 or (last != "" and int(last) < start):
+                raise ValueError  # rango mal formado: se ignora (RFC 9110 §14.2)
+            end = size if last == "" else min(int(last) + 1, size)
+    except ValueError:
+        return None
+
+    if start >= size or start >= end:
+        raise HTTPException(416, "Rango no válido", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
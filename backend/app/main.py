@@ -1,50 +1,98 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import FastAPI
-from fastapi import File
 from fastapi import Header
 from fastapi import HTTPException
-from fastapi import UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import os
-from pathlib import Path
-import re
+from PIL import UnidentifiedImageError
 from sqlalchemy.orm import Session
-from zipfile import BadZipFile
+from datetime import datetime
+from typing import Optional
+import hashlib
+import uuid
+from zipfile import ZIP_STORED, BadZipFile
 
-from . import crud, models, schemas
-from .auth import verify_password, get_password_hash, create_access_token, decode_token
-from .database import SessionLocal, engine, Base
-from .utils import extract_pages_list, get_page_image_with_raise, get_page_image
+from . import crud, models, schemas, thumbnails
+from .auth import (Principal, create_access_token, decode_token_claims, get_password_hash,
+                   principal_cache, verify_password)
+from .archive_pool import archive_pool
+from .archives import EXTERNAL
+from .config import (BATCH_MAX_PAGES, CACHE_DIR, LISTING_MAX_LIMIT, RENDITION_MAX_WIDTH, SLOW_REQUEST_MS,
+                     THUMBNAIL_WIDTH, TILE_HEIGHT)
+from .http_cache import REVALIDATE_CACHE_CONTROL, cache_headers, is_not_modified, requested_range
+from .dedup import dedup_report, upload_dedup
+from .database import (SessionLocal, engine, Base, add_missing_columns, create_missing_indexes,
+                       drop_duplicate_rows, drop_indexes, reset_stale_tables)
+from .page_index import cached_page_index, get_page_index
+from .metrics import MetricsMiddleware, render_metrics
+from .page_io import page_io
+from .process_lock import library_leader
+from .progress_store import Progress, progress_store
+from .renditions import RenditionParams, format_available, get_page_rendition, rendition_cache
+from .readahead import MAX_CACHED_PAGE, page_cache, page_key, readahead
+from .responses import ArchiveEntryResponse, BytesRangeResponse, FileRangeResponse
+from .scanner import library_scanner
+from .search import KINDS, ensure_search_index, search_library
+from .shared_cache import read_cached, shared_cache
+from .tiles import get_page_tile, strip_cache, tile_layout
+from .thumbnails import COVER_PARAMS, THUMBPACK_MEDIA_TYPE, generate_cover, get_thumbpack, schedule_covers
+from .uploads import receive_upload
+from .watcher import library_watcher
+from .utils import ARCHIVE_EXTENSIONS, ensure_extracted
 from .crud import get_comic
 #from .schemas import UserCreate, UserResponse
 from .schemas import UserCreate, UserResponse, Token
 
 
-COMICS_ROOT = Path("../comics")   # cambiar en Docker a volumen
+reset_stale_tables(models.ArchiveIndex.__table__, models.ComicPage.__table__)
 Base.metadata.create_all(bind=engine)
+# reading_progress pasó a tener una fila única por (usuario, cómic) y updated_at
+add_missing_columns(models.ReadingProgress.__table__)
+drop_duplicate_rows(models.ReadingProgress.__table__, "user_id", "comic_id")
+drop_indexes("ix_reading_progress_user_comic")
+create_missing_indexes(models.Comic.__table__, models.ReadingProgress.__table__)
+ensure_search_index(engine)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: escanear al iniciar
-    db = SessionLocal()
-    try:
-        scan_comics_library(db)
-    finally:
-        db.close()
+    # Startup: se sirve desde el primer momento. El watcher aplica los cambios
+    # de la biblioteca según llegan y un escaneo en segundo plano recoge lo que
+    # cambió con el servidor parado (el watcher arranca antes para no perder nada).
+    # Con varios workers solo lo hace el que tiene library_leader
+    if library_leader.acquire(blocking=False):
+        library_watcher.start()
+        library_scanner.start()
+    else:
+        print("ℹ️  Otro worker vigila y escanea la biblioteca")
+    progress_store.start()
+    shared_cache.start()
     
     # Shutdown: opcional, aquí puedes limpiar caché si quieres
     yield
     
-    # Cleanup si es necesario
-    pass
+    # Cleanup: volcar el progreso pendiente, parar los workers y cerrar los descriptores del pool
+    library_watcher.stop()
+    library_leader.release()
+    progress_store.stop()
+    thumbnails.shutdown()
+    readahead.shutdown()
+    shared_cache.close()
+    page_io.shutdown()
+    archive_pool.close_all()
 
 #app = FastAPI(title="CBZ Reader")
 # app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
 app = FastAPI(title="CBZ Reader", lifespan=lifespan)
+# Tiempos por etapa, peticiones en curso y registro de peticiones lentas (GET /metrics)
+app.add_middleware(MetricsMiddleware, slow_request_ms=SLOW_REQUEST_MS)
 
 
 def get_db():
@@ -54,107 +102,469 @@ def get_db():
     finally:
         db.close()
 
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
+
+def load_principal(user_id) -> Optional[Principal]:
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        return Principal(user.id, user.email) if user else None
+    finally:
+        db.close()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    # Casi siempre sale de la caché: sin decodificar el JWT ni ir a la base
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    user_id, expires_at = decode_token_claims(token)
+    principal = await run_in_threadpool(load_principal, user_id)
+    if principal is None:
+        raise HTTPException(401, "Usuario no encontrado")
+    principal_cache.put(token, principal, expires_at)
+    return principal
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[Principal]:
+    # Para endpoints públicos que cambian si hay sesión (filtro por leídos)
+    if token is None:
+        return None
+    return await get_current_user(token)
+
 @app.post("/upload", response_model=schemas.ComicResponse)
-async def upload_cbz(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    if not file.filename.lower().endswith(".cbz"):
-        raise HTTPException(400, "Solo archivos .cbz")
-    
-    content = await file.read()
-    comic = crud.create_comic(db, content, file.filename)
+async def upload_cbz(request: Request, response: Response, db: Session = Depends(get_db)):
+    # El cuerpo se lee en streaming: ver uploads.receive_upload
+    upload = await receive_upload(request)
+    if not upload.filename.lower().endswith(ARCHIVE_EXTENSIONS):
+        upload.discard()
+        raise HTTPException(400, f"Formatos admitidos: {', '.join(ARCHIVE_EXTENSIONS)}")
+
+    try:
+        comic, created = await run_in_threadpool(crud.create_comic, db, upload)
+    except BadZipFile:
+        raise HTTPException(400, "Archivo de cómic inválido")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except FileExistsError:
+        raise HTTPException(409, "Ya existe un cómic con ese nombre")
+    finally:
+        upload.discard()
+    if created:
+        schedule_covers([comic.id])
+    else:
+        upload_dedup.record(upload.size)
+        response.headers["X-Duplicate-Of"] = str(comic.id)
     return comic
 
 @app.get("/comics")
-def list_comics(db: Session = Depends(get_db)):
-    return crud.get_comics(db)
+def list_comics(
+    limit: int = Query(100, ge=1, le=LISTING_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    series: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(read|reading|unread)$"),
+    added_after: Optional[datetime] = None,
+    added_before: Optional[datetime] = None,
+    view: str = Query("full", pattern="^(full|grid)$"),
+    user=Depends(get_optional_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Biblioteca ordenada por serie y volumen, paginada con cursor: se pide la
+    siguiente página con ?cursor=<next_cursor>.
+    """
+    if status is not None and user is None:
+        raise HTTPException(401, "Inicia sesión para filtrar por progreso de lectura")
+    if status is not None:
+        # El filtro se hace en la base: antes se escribe lo que el usuario
+        # tenga pendiente en el buffer de progreso
+        progress_store.flush(user.id)
+    try:
+        rows, next_cursor = crud.get_comics(
+            db, limit, cursor, series=series, status=status, user_id=user.id if user else None,
+            added_after=added_after, added_before=added_before, grid=view == "grid",
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    schema = schemas.ComicGridItem if view == "grid" else schemas.ComicResponse
+    return {
+        "items": [schema.model_validate(row) for row in rows],
+        "next_cursor": next_cursor,
+    }
 
-@app.get("/comics/{comic_id}/pages")
-def comic_pages(comic_id: int, db: Session = Depends(get_db)):
+@app.get("/search", response_model=schemas.SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = Query(None, pattern=f"^({'|'.join(KINDS)})$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """
+    Búsqueda por título, serie y nombre de archivo (fragmentos de 3+
+    caracteres, tolera errores de escritura), ordenada por relevancia y
+    paginada con ?offset=<next_offset>.
+    """
+    items, next_offset, mode = search_library(db, q, kind, limit, offset)
+    return {"items": items, "next_offset": next_offset, "mode": mode}
+
+def load_page_index(db: Session, comic_id: int):
     comic = crud.get_comic(db, comic_id)
     if not comic:
         raise HTTPException(404, "Cómic no encontrado")
-    
-    filepath = os.path.join(os.path.dirname(__file__), "../../comics", comic.filename)
-    return {"pages": extract_pages_list(filepath)}
+    try:
+        return get_page_index(db, comic)
+    except FileNotFoundError:
+        raise HTTPException(404, "Archivo del cómic no encontrado")
+    except BadZipFile:
+        raise HTTPException(404, "Cómic con errores")
+
+@app.get("/comics/{comic_id}/pages")
+def comic_pages(comic_id: int, db: Session = Depends(get_db)):
+    index = load_page_index(db, comic_id)
+    return {"pages": index.names(), "meta": index.layout()}
+
+def rendition_params(
+    width: Optional[int] = Query(None, ge=16, le=RENDITION_MAX_WIDTH),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(webp|avif|jpeg)$"),
+    quality: int = Query(80, ge=1, le=100),
+) -> Optional[RenditionParams]:
+    # Modo rendition: ?width=400&format=webp&quality=75
+    if width is None and fmt is None:
+        return None
+    fmt = fmt or "webp"
+    if not format_available(fmt):
+        raise HTTPException(400, f"Formato {fmt} no disponible en este servidor")
+    return RenditionParams(width or RENDITION_MAX_WIDTH, fmt, quality)
+
+def read_page_index(comic_id: int):
+    # Trabajo del executor de páginas: usa su propia sesión porque puede
+    # compartirse entre varias peticiones
+    db = SessionLocal()
+    try:
+        return load_page_index(db, comic_id)
+    finally:
+        db.close()
+
+def read_reading_mode(user_id: int, comic_id: int) -> str:
+    # Modo de lectura guardado (buffer de progress_store o base); marca cuántas
+    # páginas precarga readahead por paso
+    db = SessionLocal()
+    try:
+        progress = progress_store.get(db, user_id, comic_id)
+    finally:
+        db.close()
+    return (progress or Progress()).reading_mode
+
+def stat_cached(get_path):
+    """
+    Ruta y os.stat de un archivo de la caché compartida. Si desaparece entre
+    la búsqueda y el stat (otro worker lo expulsó, o se borró a mano) se pide
+    otra vez, y get_path lo regenera.
+    """
+    path = get_path()
+    try:
+        return path, os.stat(path)
+    except FileNotFoundError:
+        path = get_path()
+        return path, os.stat(path)
+
+def read_rendition(index, entry, params: RenditionParams):
+    return stat_cached(lambda: get_page_rendition(index, entry, params))
+
+def page_etag(index, entry) -> str:
+    # El hash de la página si se conoce (no cambia al reescribir el archivo
+    # sin tocarla); si no, huella del archivo + CRC de la entrada
+    if entry.content_hash:
+        return entry.content_hash
+    return f"{index.file_size:x}-{index.file_mtime:x}-{entry.crc:08x}"
 
 @app.get("/comics/{comic_id}/page/{page_index}")
-def get_page(comic_id: int, page_index: int, db: Session = Depends(get_db)):
-    comic = crud.get_comic(db, comic_id)
-    if not comic:
-        raise HTTPException(404, "Cómic no encontrado")
+async def get_page(
+    comic_id: int,
+    page_index: int,
+    request: Request,
+    params: Optional[RenditionParams] = Depends(rendition_params),
+    user: Optional[Principal] = Depends(get_optional_user),
+):
+    # Toda la I/O va al executor de páginas; las peticiones simultáneas de la
+    # misma página comparten lectura (ver page_io.PageIO)
+    index = await page_io.run(comic_id, ("index", comic_id), read_page_index, comic_id)
     
-    filepath = os.path.join(os.path.dirname(__file__), "../../comics", comic.filename)
-    pages = extract_pages_list(filepath)
-    
-    if page_index < 0 or page_index >= len(pages):
+    if page_index < 0 or page_index >= len(index.pages):
         raise HTTPException(404, "Página fuera de rango")
     
-    #image_io = get_page_image(filepath, pages[page_index])
+    entry = index.pages[page_index]
+    source = index.source(entry)
+    # Offsets fuera del archivo: índice de otra versión o archivo truncado. Las
+    # páginas RAR (EXTERNAL) no tienen offsets: las lee la herramienta externa
+    if (source == index.path and entry.compress_type != EXTERNAL
+            and entry.data_offset + entry.compress_size > index.file_size):
+        raise HTTPException(404, "Cómic con errores")
+
+    # ETag fuerte: contenido de la página (+ parámetros de la rendition)
+    etag = page_etag(index, entry)
+    if params is not None:
+        etag = f"{etag}-{params.suffix()}"
+    etag = f'"{etag}"'
+    headers = cache_headers(etag, index.file_mtime)
+    if is_not_modified(request, etag, index.file_mtime):
+        return Response(status_code=304, headers=headers)
+
+    mode = Progress().reading_mode
+    if user is not None:
+        mode = await run_in_threadpool(read_reading_mode, user.id, comic_id)
+    readahead.warm(index, page_index, mode, params=params)
+    key = page_key(index, page_index)
+
+    if params is not None:
+        try:
+            path, st = await page_io.run(comic_id, key + (params,), read_rendition, index, entry, params)
+        except BadZipFile:
+            raise HTTPException(404, "Cómic con errores")
+        except UnidentifiedImageError:
+            raise HTTPException(415, "La página no es una imagen válida")
+        return FileRangeResponse(path, params.media_type, headers,
+                                 requested_range(request, etag, st.st_size), st)
+
+    data = None
+    if entry.compress_type != ZIP_STORED:
+        # Comprimida: se descomprime una vez y queda en la caché compartida,
+        # de donde se sirve mapeada. Las STORED se envían tal cual del archivo
+        # (sendfile), sin copia.
+        data = page_cache.get(key)
+        if data is None and entry.file_size <= MAX_CACHED_PAGE:
+            try:
+                data = await page_io.run(comic_id, key, readahead.read, index, entry)
+            except BadZipFile:
+                raise HTTPException(404, "Cómic con errores")
+    if data is not None:
+        return BytesRangeResponse(data, entry.media_type, headers,
+                                  requested_range(request, etag, len(data)))
+    if index.extracted:
+        # Archivo sólido: la página se sirve desde su extracción en caché
+        try:
+            await page_io.run(comic_id, ("extract", comic_id, index.file_size, index.file_mtime),
+                              ensure_extracted, index)
+        except BadZipFile:
+            raise HTTPException(404, "Cómic con errores")
+    fingerprint = (index.file_size, index.file_mtime) if source == index.path else None
+    return ArchiveEntryResponse(source, entry, entry.media_type, headers,
+                                requested_range(request, etag, entry.file_size), fingerprint)
+
+async def load_tile_page(comic_id: int, page_index: int):
+    index = await page_io.run(comic_id, ("index", comic_id), read_page_index, comic_id)
+    if page_index < 0 or page_index >= len(index.pages):
+        raise HTTPException(404, "Página fuera de rango")
+    return index, index.pages[page_index]
+
+def read_tile(index, entry, params: RenditionParams, tile: int):
+    return stat_cached(lambda: get_page_tile(index, entry, params, tile))
+
+@app.get("/comics/{comic_id}/page/{page_index}/tiles")
+async def get_page_tiles(
+    comic_id: int,
+    page_index: int,
+    params: Optional[RenditionParams] = Depends(rendition_params),
+):
+    """
+    Tiras verticales (webtoon/manhwa): dimensiones de la página al ancho
+    pedido y lista de tiles de alto fijo, para cargar solo la parte visible.
+    """
+    index, entry = await load_tile_page(comic_id, page_index)
+    params = params or RenditionParams(RENDITION_MAX_WIDTH)
+    try:
+        # El manifiesto lleva el número de página: clave por cómic, no por contenido
+        key = ("tiles", comic_id, index.file_size, index.file_mtime, page_index, params)
+        return await page_io.run(comic_id, key, tile_layout, index, entry, params)
+    except BadZipFile:
+        raise HTTPException(404, "Cómic con errores")
+    except UnidentifiedImageError:
+        raise HTTPException(415, "La página no es una imagen válida")
+
+@app.get("/comics/{comic_id}/page/{page_index}/tiles/{tile}")
+async def get_page_tile_image(
+    comic_id: int,
+    page_index: int,
+    tile: int,
+    request: Request,
+    params: Optional[RenditionParams] = Depends(rendition_params),
+):
+    index, entry = await load_tile_page(comic_id, page_index)
+    params = params or RenditionParams(RENDITION_MAX_WIDTH)
+    etag = f'"{page_etag(index, entry)}-t{TILE_HEIGHT}-{tile}-{params.suffix()}"'
+    headers = cache_headers(etag, index.file_mtime)
+    if is_not_modified(request, etag, index.file_mtime):
+        return Response(status_code=304, headers=headers)
     try:
-        image_io = get_page_image_with_raise(filepath, pages[page_index])
-        return StreamingResponse(image_io, media_type="image/jpeg")
-    except BadZipFile as e:
+        path, st = await page_io.run(comic_id, page_key(index, page_index) + (params, tile),
+                                     read_tile, index, entry, params, tile)
+    except IndexError:
+        raise HTTPException(404, "Tile fuera de rango")
+    except BadZipFile:
         raise HTTPException(404, "Cómic con errores")
+    except UnidentifiedImageError:
+        raise HTTPException(415, "La página no es una imagen válida")
+    return FileRangeResponse(path, params.media_type, headers,
+                             requested_range(request, etag, st.st_size), st)
 
+def read_batch_part(index, entry, params: Optional[RenditionParams]) -> bytes:
+    if params is not None:
+        return read_cached(lambda: get_page_rendition(index, entry, params))
+    return readahead.read(index, entry)
 
-def extract_volume(filename: str):
-    patterns = [
-        r"(?i)(?:vol\.?|volume|tomo)[\s._-]*(\d+)",
-        r"(?i)#?(\d+)",
-        r"(?i)cap[\s._-]*(\d+)",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, filename)
-        if match:
-            return int(match.group(1))
-    return 9999
-
-def scan_comics_library(db: Session):
-    if not COMICS_ROOT.exists():
-        print("⚠️  Carpeta /comics no existe - crea el volumen Docker")
-        return
-    added = 0
-    for cbz_path in COMICS_ROOT.rglob("*.cbz"):
-        relative = cbz_path.relative_to(COMICS_ROOT).as_posix()
-        existing = db.query(models.Comic).filter(models.Comic.filename == relative).first()
-        if not existing:
-            # Extraer serie del nombre de carpeta padre
-            # series = cbz_path.parent.name
-            series = cbz_path.parent.name if cbz_path.parent.name != "comics" else "Sin serie"
-            title = cbz_path.stem
-            vol = extract_volume(title)
-            pages = len(extract_pages_list(str(cbz_path)))
-            
-            comic = models.Comic(
-                filename=relative,
-                title=title,
-                series=series,
-                volume=vol,
-                pages=pages
-            )
-            db.add(comic)
-            added += 1
-    if added > 0:
-        db.commit()
-        print(f"✅ Añadidos {added} cómics nuevos")
-    else:
-        print("ℹ️  No hay cómics nuevos")
+@app.get("/comics/{comic_id}/pages/batch")
+async def get_pages_batch(
+    comic_id: int,
+    request: Request,
+    start: int = Query(0, alias="from", ge=0),
+    count: int = Query(2, ge=1, le=BATCH_MAX_PAGES),
+    params: Optional[RenditionParams] = Depends(rendition_params),
+    user: Optional[Principal] = Depends(get_optional_user),
+):
+    """
+    Varias páginas seguidas en una sola respuesta multipart/mixed (doble
+    página, webtoon). Cada parte lleva X-Page-Index, ETag y Content-Type.
+
+    Las páginas se leen por page_io, como en get_page (coalescencia y 503 si
+    está saturado), antes de empezar a responder: un error no corta la
+    respuesta a medias. La URL no identifica el contenido (from/count sobre
+    el archivo actual), así que se revalida con su ETag en lugar de ser
+    inmutable.
+    """
+    index = await page_io.run(comic_id, ("index", comic_id), read_page_index, comic_id)
+    numbers = range(start, min(start + count, len(index.pages)))
+    if not numbers:
+        raise HTTPException(404, "Página fuera de rango")
+
+    suffix = f"-{params.suffix()}" if params is not None else ""
+    etags = [page_etag(index, index.pages[number]) + suffix for number in numbers]
+    etag = hashlib.blake2b(" ".join(etags).encode(), digest_size=16).hexdigest()
+    headers = {**cache_headers(f'"{etag}"', index.file_mtime), "cache-control": REVALIDATE_CACHE_CONTROL}
+    if is_not_modified(request, f'"{etag}"', index.file_mtime):
+        return Response(status_code=304, headers=headers)
+
+    mode = Progress().reading_mode
+    if user is not None:
+        mode = await run_in_threadpool(read_reading_mode, user.id, comic_id)
+    readahead.warm(index, numbers[-1], mode, params=params)
+
+    try:
+        datas = await asyncio.gather(*(
+            page_io.run(comic_id, page_key(index, number) + ((params, "bytes") if params else ()),
+                        read_batch_part, index, index.pages[number], params)
+            for number in numbers
+        ))
+    except BadZipFile:
+        raise HTTPException(404, "Cómic con errores")
+    except UnidentifiedImageError:
+        raise HTTPException(415, "La página no es una imagen válida")
+
+    boundary = uuid.uuid4().hex
+
+    def parts():
+        for number, part_etag, data in zip(numbers, etags, datas):
+            media_type = params.media_type if params is not None else index.pages[number].media_type
+            yield (f"--{boundary}\r\n"
+                   f"Content-Type: {media_type}\r\n"
+                   f"Content-Length: {len(data)}\r\n"
+                   f"X-Page-Index: {number}\r\n"
+                   f'ETag: "{part_etag}"\r\n\r\n').encode()
+            yield data
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    return StreamingResponse(parts(), media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
+
+
+@app.get("/comics/{comic_id}/cover")
+def get_cover(comic_id: int, request: Request, db: Session = Depends(get_db)):
+    comic = crud.get_comic(db, comic_id)
+    if not comic:
+        raise HTTPException(404, "Cómic no encontrado")
+    path = CACHE_DIR / comic.cover_path if comic.cover_path else None
+    try:
+        st = os.stat(path) if path is not None else None
+    except FileNotFoundError:
+        st = None  # Expulsada de la caché: se vuelve a generar
+    if st is None:
+        def cover():
+            # None: cómic sin páginas (o borrado mientras tanto)
+            path = generate_cover(comic_id)
+            if path is None:
+                raise HTTPException(404, "Portada no disponible")
+            return path
+        try:
+            path, st = stat_cached(cover)
+        except (FileNotFoundError, BadZipFile, UnidentifiedImageError):
+            raise HTTPException(404, "Portada no disponible")
+    etag = f'"cover-{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = cache_headers(etag, st.st_mtime_ns)
+    # La portada cambia si cambia el archivo: no puede ser immutable
+    headers["cache-control"] = "public, max-age=3600"
+    if is_not_modified(request, etag, st.st_mtime_ns):
+        return Response(status_code=304, headers=headers)
+    return FileRangeResponse(str(path), COVER_PARAMS.media_type, headers,
+                             requested_range(request, etag, st.st_size), st)
+
+@app.get("/comics/{comic_id}/thumbnails")
+def get_thumbnails(comic_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Todas las miniaturas del cómic en una sola respuesta (formato en
+    thumbnails.py). Cada miniatura suelta está en /page/{n}?width=THUMBNAIL_WIDTH.
+    """
+    index = load_page_index(db, comic_id)
+    etag = f'"thumbs-{index.file_size:x}-{index.file_mtime:x}-w{THUMBNAIL_WIDTH}"'
+    headers = cache_headers(etag, index.file_mtime)
+    if is_not_modified(request, etag, index.file_mtime):
+        return Response(status_code=304, headers=headers)
+    try:
+        path, st = stat_cached(lambda: get_thumbpack(index))
+    except BadZipFile:
+        raise HTTPException(404, "Cómic con errores")
+    except UnidentifiedImageError:
+        raise HTTPException(415, "Alguna página no es una imagen válida")
+    return FileRangeResponse(str(path), THUMBPACK_MEDIA_TYPE, headers,
+                             requested_range(request, etag, st.st_size), st)
 
 
 @app.post("/scan")
-async def manual_scan(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    background_tasks.add_task(scan_comics_library)
+def manual_scan():
+    if not library_scanner.start():
+        return {"status": "ya hay un escaneo en curso", **library_scanner.status()}
     return {"status": "escaneando en background..."}
 
+@app.get("/scan/status")
+def scan_status():
+    return library_scanner.status()
 
+@app.get("/stats")
+def cache_stats():
+    return {
+        "archive_pool": archive_pool.stats(),
+        "shared_cache": shared_cache.stats(),
+        "renditions": rendition_cache.stats(),
+        "readahead": readahead.stats(),
+        "page_io": page_io.stats(),
+        "progress": progress_store.stats(),
+        "principals": principal_cache.stats(),
+        "tiles": strip_cache.stats(),
+        "watcher": library_watcher.stats(),
+    }
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
+@app.get("/dedup")
+def dedup(db: Session = Depends(get_db)):
+    """
+    Páginas y archivos repetidos en la biblioteca y espacio que ahorra
+    guardar una vez por contenido lo que se deriva de ellos.
+    """
+    return dedup_report(db)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Formato de texto de Prometheus; las cachés salen de los mismos stats() que /stats
+    return PlainTextResponse(render_metrics(cache_stats(), library_scanner.status()),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    user_id = decode_token(token)
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(401, "Usuario no encontrado")
-    return user
 
 # Registro
 @app.post("/register", response_model=UserResponse)
@@ -188,30 +598,21 @@ def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get
 
 # Guardar/Obtener progreso
 @app.post("/progress/{comic_id}")
-def save_progress(comic_id: int, progress: dict, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    prog = db.query(models.ReadingProgress).filter(
-        models.ReadingProgress.user_id == user.id,
-        models.ReadingProgress.comic_id == comic_id
-    ).first()
-    if not prog:
-        prog = models.ReadingProgress(user_id=user.id, comic_id=comic_id)
-        db.add(prog)
-    prog.current_page = progress.get("current", 0)
-    prog.reading_mode = progress.get("reading_mode", "double")
-    prog.reading_direction = progress.get("reading_direction", "ltr")
-    db.commit()
+def save_progress(comic_id: int, progress: schemas.ProgressUpdate, user: Principal = Depends(get_current_user)):
+    # Sin tocar la base: progress_store lo escribe en lotes en segundo plano
+    current = Progress(progress.current, progress.reading_mode, progress.reading_direction)
+    previous = progress_store.put(user.id, comic_id, current)
+
+    # Precargar alrededor de la nueva posición, en el sentido en que se avanza
+    index = cached_page_index(comic_id)
+    if index is not None and current.current < len(index.pages):
+        readahead.warm(index, current.current, current.reading_mode,
+                       backwards=previous is not None and current.current < previous.current)
     return {"status": "ok"}
 
 @app.get("/progress/{comic_id}")
-def get_progress(comic_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    prog = db.query(models.ReadingProgress).filter(
-        models.ReadingProgress.user_id == user.id,
-        models.ReadingProgress.comic_id == comic_id
-    ).first()
+def get_progress(comic_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    prog = progress_store.get(db, user.id, comic_id)
     if not prog:
-        return {"current": 0, "reading_mode": "double", "reading_direction": "ltr"}
-    return {
-        "current": prog.current_page,
-        "reading_mode": prog.reading_mode,
-        "reading_direction": prog.reading_direction
-    }
\ No newline at end of file
+        return Progress().as_dict()
+    return prog.as_dict()
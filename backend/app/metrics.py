@@ -0,0 +1,261 @@
+"""
+Instrumentación de los caminos calientes y exposición en formato de texto de
+Prometheus (GET /metrics), sin dependencias externas.
+
+- stage(nombre): mide una etapa (apertura del archivo, índice, lectura,
+  conversión, consulta a la base de datos, envío de la respuesta) en el
+  histograma comicviewer_stage_seconds y, si hay una petición en curso en el
+  contexto, la suma a su desglose.
+- MetricsMiddleware: duración y número de peticiones por ruta, peticiones en
+  curso y registro de peticiones de página lentas con su desglose por etapa.
+
+Con SCAN_EXECUTOR=process las etapas del escaneo ocurren en otros procesos y
+no aparecen aquí (el progreso del escaneo sí).
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Rutas cuyo desglose se registra si superan SLOW_REQUEST_MS
+PAGE_ROUTE_PREFIX = "/comics/{comic_id}/page"
+
+# Campos de los stats() de las cachés que solo crecen (el resto son gauges)
+COUNTER_FIELDS = {"hits", "misses", "evictions", "invalidations", "scheduled", "jobs", "coalesced",
+                  "rejected", "updates", "flushes", "rows_flushed", "errors", "events", "syncs",
+                  "overflows", "added", "updated", "renamed", "removed"}
+
+_metrics = []
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            if not self.labelnames and not self._values:
+                lines.append(f"{self.name} 0")
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # (observaciones por bucket, suma, total de observaciones)
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "comicviewer_stage_seconds",
+    "Tiempo por etapa: archive_open, index_lookup, read, transcode, db_query, response_send",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "comicviewer_http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route"),
+)
+REQUESTS = Counter("comicviewer_http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+IN_FLIGHT = Gauge("comicviewer_http_requests_in_flight", "Peticiones HTTP en curso")
+SCAN_SECONDS = Histogram(
+    "comicviewer_scan_duration_seconds", "Duración de los escaneos de la biblioteca",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def record(name: str, seconds: float, trace: dict | None = None):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = trace if trace is not None else _trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def instrument_engine(engine):
+    """Mide cada consulta SQL como etapa db_query."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        record("db_query", time.perf_counter() - conn.info["metrics_t0"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None and context.connection.info.get("metrics_t0"):
+            context.connection.info["metrics_t0"].pop()
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: cada petición lleva su desglose por etapas en una
+    ContextVar, que siguen tanto el threadpool de Starlette como page_io.
+    """
+
+    def __init__(self, app, slow_request_ms: float = 0):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = {}
+        token = _trace.set(trace)
+        status = 500
+        send_started = None
+
+        async def send_wrapper(message):
+            nonlocal status, send_started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                send_started = time.perf_counter()
+            await send(message)
+
+        IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            IN_FLIGHT.dec()
+            _trace.reset(token)
+            if send_started is not None:
+                record("response_send", end - send_started, trace)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(end - t0, method=scope["method"], route=route)
+            REQUESTS.inc(method=scope["method"], route=route, status=status)
+            elapsed_ms = (end - t0) * 1000
+            if self.slow_request_ms and route.startswith(PAGE_ROUTE_PREFIX) and elapsed_ms >= self.slow_request_ms:
+                stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in trace.items())
+                print(f"🐢 Petición lenta: {scope['method']} {scope['path']} {status} "
+                      f"{elapsed_ms:.1f}ms ({stages or 'sin etapas'})")
+
+
+def _stats_lines(stats: dict[str, dict]) -> list[str]:
+    lines = []
+    for component, values in stats.items():
+        for field, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            if field in COUNTER_FIELDS:
+                name = f"comicviewer_{component}_{field}_total"
+                kind = "counter"
+            else:
+                name = f"comicviewer_{component}_{field}"
+                kind = "gauge"
+            lines += [f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+    return lines
+
+
+def _scan_lines(status: dict) -> list[str]:
+    lines = ["# TYPE comicviewer_scan_state gauge"]
+    for state in ("idle", "listing", "indexing", "done", "error"):
+        lines.append(f'comicviewer_scan_state{{state="{state}"}} {int(status.get("state") == state)}')
+    for field, value in status.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines += [f"# TYPE comicviewer_scan_{field} gauge", f"comicviewer_scan_{field} {_number(value)}"]
+    return lines
+
+
+def render_metrics(stats: dict[str, dict], scan_status: dict) -> str:
+    """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    lines += _stats_lines(stats)
+    lines += _scan_lines(scan_status)
+    return "\n".join(lines) + "\n"
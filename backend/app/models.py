@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Column, Integer, Index, String, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -6,6 +6,8 @@ from datetime import datetime
 
 class Comic(Base):
     __tablename__ = "comics"
+    # Orden del listado: paginación por cursor sobre (series, volume, id)
+    __table_args__ = (Index("ix_comics_series_volume_id", "series", "volume", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, unique=True, index=True)
@@ -17,6 +19,46 @@ class Comic(Base):
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
 
+class ArchiveIndex(Base):
+    """Huella del archivo (tamaño + mtime) con la que se construyó el índice de páginas, y su formato."""
+    __tablename__ = "archive_index"
+
+    comic_id = Column(Integer, ForeignKey("comics.id", ondelete="CASCADE"), primary_key=True)
+    file_size = Column(BigInteger, nullable=False)
+    file_mtime = Column(BigInteger, nullable=False)  # st_mtime_ns
+    version = Column(Integer, nullable=False)
+    page_count = Column(Integer, nullable=False)
+    format = Column(String, nullable=False, default="zip")  # zip | tar | dir | rar
+    extracted = Column(Boolean, nullable=False, default=False)  # sólido, extraído en CACHE_DIR/extracted
+    content_hash = Column(String(64), index=True, nullable=True)  # SHA-256 del archivo
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ComicPage(Base):
+    """
+    Índice de páginas: número de página (orden natural) -> entrada dentro del
+    archivo, con las dimensiones leídas de la cabecera de la imagen.
+    """
+    __tablename__ = "comic_pages"
+    __table_args__ = (UniqueConstraint("comic_id", "number"),)
+
+    id = Column(Integer, primary_key=True)
+    comic_id = Column(Integer, ForeignKey("comics.id", ondelete="CASCADE"), index=True, nullable=False)
+    number = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    header_offset = Column(BigInteger, nullable=False)
+    data_offset = Column(BigInteger, nullable=False)
+    compress_size = Column(BigInteger, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    compress_type = Column(Integer, nullable=False)
+    crc = Column(BigInteger, nullable=False)
+    media_type = Column(String, nullable=False)
+    width = Column(Integer, nullable=False, default=0)
+    height = Column(Integer, nullable=False, default=0)
+    is_spread = Column(Boolean, nullable=False, default=False)
+    content_hash = Column(String(32), index=True, nullable=True)  # BLAKE2b de la imagen
+
+
 class Manga(Base):
     __tablename__ = "manga"
 
@@ -49,12 +91,17 @@ class User(Base):
 
 class ReadingProgress(Base):
     __tablename__ = "reading_progress"
+    # Una fila por (usuario, cómic): el volcado de progress_store es un upsert
+    __table_args__ = (Index("ux_reading_progress_user_comic", "user_id", "comic_id", unique=True),)
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     comic_id = Column(Integer, ForeignKey("comics.id"))
     current_page = Column(Integer, default=0)
     reading_mode = Column(String, default="double")
     reading_direction = Column(String, default="ltr")
+    # Cuándo guardó el usuario esta posición (ns): un volcado con una posición
+    # más antigua no pisa una más reciente
+    updated_at = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="progress")
     comic = relationship("Comic")
\ No newline at end of file
@@ -0,0 +1,307 @@
+"""
+Optimizador de la biblioteca: reescribe los CBZ/ZIP con la disposición más
+barata de servir.
+
+    python -m app.optimize [--dry-run] [--workers N] [--webp lossless|lossy] [rutas...]
+
+- Imágenes sin comprimir (STORED): deflate apenas gana un 1% en JPEG/PNG y
+  obliga a descomprimir en cada lectura; sin comprimir se envían con sendfile.
+- Sin basura (__MACOSX, ._*, .DS_Store, Thumbs.db, carpetas).
+- Páginas en orden natural dentro del archivo (lecturas secuenciales) y el
+  resto de archivos (ComicInfo.xml) al final.
+- Opcional: los PNG grandes se recodifican a WebP, sin pérdida o con
+  pérdida, si así ocupan menos.
+
+Cada archivo se procesa en un pool de procesos. La reescritura es atómica
+(temporal en la misma carpeta, verificado, y os.replace): quien ya tenga el
+archivo abierto sigue leyendo la versión anterior. Con --dry-run no se
+escribe nada y se informa de lo que se ahorraría. Al terminar se reindexan
+los archivos reescritos (índice de páginas, huella y hash de contenido).
+
+Solo se reescriben ZIP: los TAR y RAR se leen igual de rápido extraídos o
+sin comprimir, y pasarlos a CBZ cambiaría el nombre del archivo.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+from .archives import is_page_name, natural_key
+from .config import COMICS_DIR
+
+
+ZIP_EXTENSIONS = (".cbz", ".zip")
+JUNK_NAMES = {".ds_store", "thumbs.db", "desktop.ini"}
+OPTIMIZE_TEMP_PREFIX = ".optimize-"
+
+
+@dataclass(frozen=True)
+class OptimizeOptions:
+    webp: str | None = None  # None | "lossless" | "lossy"
+    webp_quality: int = 90
+    png_min_bytes: int = 1024 * 1024
+
+
+@dataclass
+class OptimizeResult:
+    path: str
+    size_before: int = 0
+    size_after: int = 0
+    rewritten: bool = False
+    junk: int = 0
+    deflated: int = 0
+    reordered: bool = False
+    webp: int = 0
+    error: str | None = None
+
+
+def is_junk(info: zipfile.ZipInfo) -> bool:
+    if info.is_dir():
+        return True
+    parts = info.filename.split("/")
+    name = parts[-1]
+    return "__MACOSX" in parts or name.startswith("._") or name.lower() in JUNK_NAMES
+
+
+class _SizeCounter(io.RawIOBase):
+    """Destino que solo mide: el tamaño exacto que tendría el ZIP en --dry-run."""
+
+    def __init__(self):
+        self.position = 0
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.position += len(data)
+        self.size = max(self.size, self.position)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = offset
+        return offset
+
+
+def to_webp(data: bytes, options: OptimizeOptions) -> bytes:
+    with Image.open(io.BytesIO(data)) as img:
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        out = io.BytesIO()
+        if options.webp == "lossless":
+            img.save(out, "WEBP", lossless=True, quality=100, method=4)
+        else:
+            img.save(out, "WEBP", quality=options.webp_quality, method=4)
+        return out.getvalue()
+
+
+def _plan(infos: list[zipfile.ZipInfo]):
+    """(páginas en orden natural, otros archivos, basura)"""
+    junk = [info for info in infos if is_junk(info)]
+    kept = [info for info in infos if not is_junk(info)]
+    pages = sorted((info for info in kept if is_page_name(info.filename)),
+                   key=lambda info: natural_key(info.filename))
+    others = [info for info in kept if not is_page_name(info.filename)]
+    return pages, others, junk
+
+
+def _write_archive(z: zipfile.ZipFile, out, pages, others, options: OptimizeOptions, result: OptimizeResult):
+    names = {info.filename for info in pages + others}
+    with zipfile.ZipFile(out, "w") as dest:
+        for info in pages:
+            data = z.read(info)
+            name = info.filename
+            if options.webp and name.lower().endswith(".png") and info.file_size >= options.png_min_bytes:
+                webp_name = os.path.splitext(name)[0] + ".webp"
+                if webp_name not in names:
+                    webp = to_webp(data, options)
+                    if len(webp) < len(data):
+                        data, name = webp, webp_name
+                        result.webp += 1
+            entry = zipfile.ZipInfo(name, info.date_time)
+            entry.external_attr = info.external_attr
+            entry.compress_type = zipfile.ZIP_STORED
+            dest.writestr(entry, data)
+        for info in others:
+            entry = zipfile.ZipInfo(info.filename, info.date_time)
+            entry.external_attr = info.external_attr
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            dest.writestr(entry, z.read(info))
+        dest.comment = z.comment
+
+
+def optimize_archive(path: str, options: OptimizeOptions, dry_run: bool = False) -> OptimizeResult:
+    """
+    Trabajo del pool: reescribe un ZIP en la disposición canónica si hace
+    falta. Si ya la tiene (y no hay PNG que convertir) no se toca.
+    """
+    result = OptimizeResult(path)
+    try:
+        result.size_before = os.path.getsize(path)
+        with zipfile.ZipFile(path) as z:
+            infos = z.infolist()
+            pages, others, junk = _plan(infos)
+            result.junk = len(junk)
+            result.deflated = sum(info.compress_type != zipfile.ZIP_STORED for info in pages)
+            result.reordered = sorted(pages, key=lambda info: info.header_offset) != pages
+            png = options.webp is not None and any(
+                info.filename.lower().endswith(".png") and info.file_size >= options.png_min_bytes
+                for info in pages
+            )
+            if not (result.junk or result.deflated or result.reordered or png):
+                result.size_after = result.size_before
+                return result
+
+            if dry_run:
+                counter = _SizeCounter()
+                _write_archive(z, counter, pages, others, options, result)
+                result.size_after = counter.size
+            else:
+                fd, temp_path = tempfile.mkstemp(prefix=OPTIMIZE_TEMP_PREFIX, suffix=".tmp",
+                                                 dir=os.path.dirname(path))
+                try:
+                    with os.fdopen(fd, "wb") as out:
+                        _write_archive(z, out, pages, others, options, result)
+                        out.flush()
+                        os.fsync(out.fileno())
+                    _verify(temp_path, len(pages))
+                    os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+                    result.size_after = os.path.getsize(temp_path)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+
+        if not (result.junk or result.deflated or result.reordered or result.webp):
+            # Solo había PNG candidatos y ninguno ganaba como WebP
+            if not dry_run:
+                os.unlink(temp_path)
+            result.size_after = result.size_before
+            return result
+        if not dry_run:
+            os.replace(temp_path, path)
+        result.rewritten = True
+    except (OSError, zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+        result.error = str(e)
+    return result
+
+
+def _verify(path: str, pages: int):
+    with zipfile.ZipFile(path) as z:
+        bad = z.testzip()
+        if bad is not None:
+            raise zipfile.BadZipFile(f"CRC incorrecto en '{bad}' tras reescribir")
+        if sum(is_page_name(name) for name in z.namelist()) != pages:
+            raise zipfile.BadZipFile("El archivo reescrito no tiene las mismas páginas")
+
+
+def find_archives(paths: list[Path]) -> list[str]:
+    found = []
+    for root in paths:
+        if root.is_file():
+            found.append(str(root))
+            continue
+        for dirpath, dirs, filenames in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.lower().endswith(ZIP_EXTENSIONS) and not filename.startswith("."):
+                    found.append(os.path.join(dirpath, filename))
+    return found
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 ** 2:.1f} MB"
+
+
+def _describe(result: OptimizeResult) -> str:
+    changes = []
+    if result.deflated:
+        changes.append(f"{result.deflated} sin comprimir")
+    if result.junk:
+        changes.append(f"{result.junk} de basura")
+    if result.reordered:
+        changes.append("reordenado")
+    if result.webp:
+        changes.append(f"{result.webp} PNG a WebP")
+    return ", ".join(changes)
+
+
+def reindex():
+    """Escaneo incremental: solo se vuelven a indexar los archivos reescritos."""
+    from . import main  # noqa: F401  (crea o actualiza las tablas como al arrancar el servidor)
+    from .scanner import library_scanner
+
+    library_scanner.run()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.optimize",
+        description="Reescribe los CBZ/ZIP de la biblioteca para servirlos más rápido",
+    )
+    parser.add_argument("paths", nargs="*", type=Path, help=f"archivos o carpetas (por defecto {COMICS_DIR})")
+    parser.add_argument("--dry-run", action="store_true", help="solo informar de lo que se ahorraría")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--webp", choices=("lossless", "lossy"), help="recodificar los PNG grandes a WebP")
+    parser.add_argument("--webp-quality", type=int, default=OptimizeOptions.webp_quality,
+                        help="calidad del WebP con pérdida")
+    parser.add_argument("--png-min-kb", type=int, default=OptimizeOptions.png_min_bytes // 1024,
+                        help="tamaño mínimo de un PNG para recodificarlo")
+    parser.add_argument("--no-reindex", action="store_true", help="no reindexar al terminar")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    options = OptimizeOptions(args.webp, args.webp_quality, args.png_min_kb * 1024)
+    archives = find_archives(args.paths or [COMICS_DIR])
+    print(f"🔎 {len(archives)} archivos ZIP/CBZ{' (simulación)' if args.dry_run else ''}")
+
+    t0 = time.monotonic()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for result in pool.map(optimize_archive, archives, [options] * len(archives),
+                               [args.dry_run] * len(archives)):
+            results.append(result)
+            if result.error:
+                print(f"⚠️  {result.path}: {result.error}")
+            elif result.rewritten:
+                print(f"{'📝' if args.dry_run else '✅'} {result.path}: {_describe(result)} "
+                      f"({_mb(result.size_before)} → {_mb(result.size_after)})")
+
+    rewritten = [result for result in results if result.rewritten]
+    before = sum(result.size_before for result in rewritten)
+    after = sum(result.size_after for result in rewritten)
+    verb = "se reescribirían" if args.dry_run else "reescritos"
+    print(f"📦 {len(rewritten)} de {len(results)} {verb}, {sum(bool(r.error) for r in results)} con errores "
+          f"en {time.monotonic() - t0:.1f}s")
+    print(f"   {sum(r.deflated for r in rewritten)} páginas sin comprimir, {sum(r.junk for r in rewritten)} "
+          f"entradas de basura, {sum(r.reordered for r in rewritten)} reordenados, "
+          f"{sum(r.webp for r in rewritten)} PNG a WebP")
+    print(f"   {_mb(before)} → {_mb(after)} ({_mb(before - after)} menos)")
+
+    if rewritten and not args.dry_run and not args.no_reindex:
+        print("🔄 Reindexando")
+        reindex()
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
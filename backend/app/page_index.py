@@ -0,0 +1,198 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import PAGE_INDEX_MEMO_SIZE
+from .metrics import stage
+from .utils import ArchiveScan, PageEntry, comic_path, extraction_dir, scan_pages, stat_comic
+
+
+# Subir cuando cambie la forma de construir el índice para forzar su reconstrucción
+INDEX_VERSION = 5
+
+_PAGE_COLUMNS = ("number", "name", "header_offset", "data_offset",
+                 "compress_size", "file_size", "compress_type", "crc", "media_type",
+                 "width", "height", "is_spread", "content_hash")
+
+
+@dataclass(frozen=True)
+class PageIndex:
+    comic_id: int
+    path: str
+    file_size: int
+    file_mtime: int
+    pages: tuple[PageEntry, ...]
+    format: str = "zip"
+    extracted: bool = False
+
+    def matches(self, st: os.stat_result) -> bool:
+        return self.file_size == st.st_size and self.file_mtime == st.st_mtime_ns
+
+    def source(self, entry: PageEntry) -> str:
+        """Archivo donde están los bytes de la página (offsets de entry)."""
+        if self.format == "dir":
+            return os.path.join(self.path, entry.name)
+        if self.extracted:
+            return str(extraction_dir(self.path, self.file_size, self.file_mtime) / entry.name)
+        return self.path
+
+    def names(self) -> list[str]:
+        return [page.name for page in self.pages]
+
+    def layout(self) -> list[dict]:
+        """Metadatos por página para maquetar doble página y webtoon sin descargar imágenes."""
+        return [{
+            "number": page.number,
+            "name": page.name,
+            "width": page.width,
+            "height": page.height,
+            "size": page.file_size,
+            "format": page.media_type.split("/")[-1],
+            "is_spread": page.is_spread,
+        } for page in self.pages]
+
+
+_memo: "OrderedDict[int, PageIndex]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _remember(index: PageIndex):
+    with _memo_lock:
+        _memo[index.comic_id] = index
+        _memo.move_to_end(index.comic_id)
+        while len(_memo) > PAGE_INDEX_MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def cached_page_index(comic_id: int) -> PageIndex | None:
+    """Índice en memoria, sin comprobar el archivo ni ir a la base de datos."""
+    with _memo_lock:
+        return _memo.get(comic_id)
+
+
+def forget_page_index(comic_id: int):
+    with _memo_lock:
+        _memo.pop(comic_id, None)
+
+
+def write_page_indexes(db: Session, indexes: list[tuple[int, int, int, ArchiveScan]],
+                       content_hashes: dict[int, str] | None = None):
+    """
+    Guarda en bloque varios índices de páginas, cada uno como
+    (comic_id, file_size, file_mtime_ns, scan). Sin commit.
+
+    El hash de contenido del archivo es el de content_hashes o el del scan; si
+    no viene ninguno, se conserva el anterior si el archivo no cambió.
+    """
+    if not indexes:
+        return
+    comic_ids = [comic_id for comic_id, _, _, _ in indexes]
+    now = datetime.utcnow()
+    hashes = {
+        comic_id: (file_size, file_mtime, content_hash)
+        for comic_id, file_size, file_mtime, content_hash in db.execute(
+            select(models.ArchiveIndex.comic_id, models.ArchiveIndex.file_size,
+                   models.ArchiveIndex.file_mtime, models.ArchiveIndex.content_hash)
+            .where(models.ArchiveIndex.comic_id.in_(comic_ids),
+                   models.ArchiveIndex.content_hash.is_not(None))
+        )
+    }
+    content_hashes = content_hashes or {}
+
+    def content_hash(comic_id, file_size, file_mtime, scan):
+        if comic_id in content_hashes:
+            return content_hashes[comic_id]
+        if scan.content_hash is not None:
+            return scan.content_hash
+        previous = hashes.get(comic_id)
+        if previous is not None and previous[:2] == (file_size, file_mtime):
+            return previous[2]
+        return None
+
+    db.execute(delete(models.ComicPage).where(models.ComicPage.comic_id.in_(comic_ids)))
+    db.execute(delete(models.ArchiveIndex).where(models.ArchiveIndex.comic_id.in_(comic_ids)))
+    page_rows = [
+        # Sin hash de contenido (PAGE_CONTENT_HASH=0) la columna queda NULL
+        {"comic_id": comic_id, **{column: getattr(entry, column) for column in _PAGE_COLUMNS},
+         "content_hash": entry.content_hash or None}
+        for comic_id, _, _, scan in indexes
+        for entry in scan.pages
+    ]
+    if page_rows:
+        db.execute(insert(models.ComicPage), page_rows)
+    db.execute(insert(models.ArchiveIndex), [
+        {"comic_id": comic_id, "file_size": file_size, "file_mtime": file_mtime,
+         "version": INDEX_VERSION, "page_count": len(scan.pages), "indexed_at": now,
+         "format": scan.format, "extracted": scan.extracted,
+         "content_hash": content_hash(comic_id, file_size, file_mtime, scan)}
+        for comic_id, file_size, file_mtime, scan in indexes
+    ])
+    db.execute(update(models.Comic), [
+        {"id": comic_id, "pages": len(scan.pages)} for comic_id, _, _, scan in indexes
+    ])
+
+
+def build_page_index(db: Session, comic: models.Comic, st: os.stat_result | None = None) -> PageIndex:
+    """
+    Lee el cómic y guarda su índice de páginas en la base de datos.
+    No hace commit: quien llama decide cuándo confirmar (escaneo, subida...).
+    """
+    path = comic_path(comic.filename)
+    if st is None:
+        st = stat_comic(path)
+    scan = scan_pages(path, str(extraction_dir(path, st.st_size, st.st_mtime_ns)))
+
+    db.flush()
+    write_page_indexes(db, [(comic.id, st.st_size, st.st_mtime_ns, scan)])
+    comic.pages = len(scan.pages)
+
+    index = PageIndex(comic.id, path, st.st_size, st.st_mtime_ns, tuple(scan.pages),
+                      scan.format, scan.extracted)
+    _remember(index)
+    return index
+
+
+def get_page_index(db: Session, comic: models.Comic) -> PageIndex:
+    """
+    Devuelve el índice de páginas del cómic. Primero memoria, luego base de
+    datos; solo se vuelve a leer el archivo si cambió su tamaño o su mtime.
+
+    Raises:
+        FileNotFoundError: si el archivo del cómic ya no existe
+        zipfile.BadZipFile: si hay que reconstruir el índice y el archivo está dañado
+    """
+    with stage("index_lookup"):
+        return _get_page_index(db, comic)
+
+
+def _get_page_index(db: Session, comic: models.Comic) -> PageIndex:
+    path = comic_path(comic.filename)
+    st = stat_comic(path)
+
+    with _memo_lock:
+        cached = _memo.get(comic.id)
+        if cached is not None and cached.path == path and cached.matches(st):
+            _memo.move_to_end(comic.id)
+            return cached
+
+    row = db.get(models.ArchiveIndex, comic.id)
+    if (row is not None and row.version == INDEX_VERSION
+            and row.file_size == st.st_size and row.file_mtime == st.st_mtime_ns):
+        rows = db.query(*(getattr(models.ComicPage, column) for column in _PAGE_COLUMNS)).filter(
+            models.ComicPage.comic_id == comic.id
+        ).order_by(models.ComicPage.number).all()
+        if len(rows) == row.page_count:
+            index = PageIndex(comic.id, path, st.st_size, st.st_mtime_ns,
+                              tuple(PageEntry(*r[:-1], r[-1] or "") for r in rows), row.format, row.extracted)
+            _remember(index)
+            return index
+
+    index = build_page_index(db, comic, st)
+    db.commit()
+    return index
@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from .config import PAGE_IO_MAX_QUEUE, PAGE_IO_PER_ARCHIVE, PAGE_IO_RETRY_AFTER, PAGE_IO_WORKERS
+
+
+class PageIO:
+    """
+    Executor dedicado para la lectura de páginas, separado del threadpool de
+    Starlette para que un pico de lecturas no deje sin hilos a /login o
+    /progress.
+
+    - Coalescencia: peticiones simultáneas con la misma clave (p. ej. la misma
+      página del mismo cómic) comparten un único trabajo.
+    - Como mucho PAGE_IO_PER_ARCHIVE trabajos a la vez por archivo.
+    - Si hay más de PAGE_IO_MAX_QUEUE trabajos pendientes se responde 503 con
+      Retry-After en lugar de encolar sin límite.
+
+    Todo el estado se toca desde el event loop, así que no necesita locks.
+    """
+
+    def __init__(self, workers: int, per_archive: int, max_queue: int, retry_after: int):
+        self.per_archive = per_archive
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page-io")
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._archives: dict[object, asyncio.Semaphore] = {}
+        self._archive_jobs: Counter = Counter()
+        self.pending = 0
+        self.jobs = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def call(self, fn, *args):
+        """Ejecuta fn en el executor de I/O, sin coalescencia ni límites."""
+        # Con el contexto de la petición, para que sus etapas cuenten en metrics
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(context.run, fn, *args)
+        )
+
+    async def run(self, archive, key: tuple, fn, *args):
+        """
+        Ejecuta fn(*args) en el executor, compartiendo el resultado (o la
+        excepción) con las peticiones que lleguen mientras con la misma clave.
+
+        Raises:
+            HTTPException 503 si el executor está saturado
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(503, "Servidor ocupado, reintenta en unos segundos",
+                                headers={"Retry-After": str(self.retry_after)})
+
+        future = asyncio.ensure_future(self._run(archive, fn, *args))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: si el cliente se va, el trabajo sigue para el resto
+        return await asyncio.shield(future)
+
+    async def _run(self, archive, fn, *args):
+        self.pending += 1
+        self.jobs += 1
+        self._archive_jobs[archive] += 1
+        semaphore = self._archives.setdefault(archive, asyncio.Semaphore(self.per_archive))
+        try:
+            async with semaphore:
+                return await self.call(fn, *args)
+        finally:
+            self.pending -= 1
+            self._archive_jobs[archive] -= 1
+            if not self._archive_jobs[archive]:
+                del self._archive_jobs[archive]
+                del self._archives[archive]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "inflight_keys": len(self._inflight),
+            "busy_archives": len(self._archive_jobs),
+            "jobs": self.jobs,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "max_queue": self.max_queue,
+        }
+
+
+page_io = PageIO(PAGE_IO_WORKERS, PAGE_IO_PER_ARCHIVE, PAGE_IO_MAX_QUEUE, PAGE_IO_RETRY_AFTER)
@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no se coordina entre procesos
+    fcntl = None
+
+from .config import CACHE_DIR
+
+
+class ProcessLock:
+    """
+    Candado entre procesos con flock sobre un archivo en CACHE_DIR, para lo
+    que con varios workers de uvicorn debe hacer uno solo (vigilar y escanear
+    la biblioteca). El sistema lo suelta si el proceso muere, así que el
+    worker que uvicorn arranca en su lugar puede tomarlo.
+
+    Dentro de un proceso no protege entre hilos: flock es por descriptor.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Toma el candado; sin blocking, False si lo tiene otro proceso."""
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            # Cerrar el descriptor suelta el flock
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# El worker que lo tiene vigila la biblioteca y lanza el escaneo de arranque
+library_leader = ProcessLock(CACHE_DIR / "library.leader")
+# Escaneos y syncs de cualquier worker, uno cada vez
+library_scan_lock = ProcessLock(CACHE_DIR / "library.scan")
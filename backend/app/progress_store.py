@@ -0,0 +1,226 @@
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from . import models
+from .config import PROGRESS_FLUSH_BATCH, PROGRESS_FLUSH_INTERVAL, PROGRESS_WRITE_BEHIND
+from .database import SessionLocal
+
+
+@dataclass(frozen=True)
+class Progress:
+    current: int = 0
+    reading_mode: str = "double"
+    reading_direction: str = "ltr"
+    # Cuándo se guardó (time_ns); lo pone ProgressStore.put
+    updated_at: int = field(default=0, compare=False)
+
+    def as_dict(self) -> dict:
+        return {
+            "current": self.current,
+            "reading_mode": self.reading_mode,
+            "reading_direction": self.reading_direction,
+        }
+
+
+class ProgressStore:
+    """
+    Progreso de lectura con escritura diferida.
+
+    Cada cambio de página solo actualiza un diccionario en memoria con la
+    última posición por (usuario, cómic); un hilo de fondo escribe las
+    entradas pendientes en lotes cada PROGRESS_FLUSH_INTERVAL segundos, y al
+    apagar se vuelca lo que quede. Las lecturas consultan primero el buffer,
+    así que el usuario siempre ve lo último que guardó.
+
+    El buffer es de cada proceso: con write_behind=False (varios workers de
+    uvicorn) cada cambio se escribe al momento y el buffer solo guarda lo que
+    no se pudo escribir. La escritura es un upsert que solo aplica posiciones
+    más recientes que la guardada (updated_at), así que un volcado tardío no
+    pisa lo que otro proceso ya escribió.
+    """
+
+    def __init__(self, interval: float, batch_size: int, write_behind: bool = True):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.write_behind = write_behind
+        self._last_stamp = 0
+        self._pending: dict[tuple[int, int], Progress] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.updates = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def put(self, user_id: int, comic_id: int, progress: Progress) -> Progress | None:
+        """Guarda la posición; devuelve la anterior si seguía en el buffer."""
+        with self._lock:
+            # Estrictamente creciente aunque dos llamadas caigan en el mismo ns
+            self._last_stamp = max(time.time_ns(), self._last_stamp + 1)
+            progress = replace(progress, updated_at=self._last_stamp)
+            previous = self._pending.get((user_id, comic_id))
+            self._pending[(user_id, comic_id)] = progress
+            self.updates += 1
+        if not self.write_behind:
+            self.flush(user_id)
+        return previous
+
+    def get(self, db, user_id: int, comic_id: int) -> Progress | None:
+        with self._lock:
+            progress = self._pending.get((user_id, comic_id))
+        if progress is not None:
+            return progress
+        row = db.query(models.ReadingProgress).filter(
+            models.ReadingProgress.user_id == user_id,
+            models.ReadingProgress.comic_id == comic_id
+        ).first()
+        if row is None:
+            return None
+        return Progress(row.current_page, row.reading_mode, row.reading_direction, row.updated_at)
+
+    def discard_comics(self, comic_ids):
+        """Olvida el progreso pendiente de cómics eliminados."""
+        comic_ids = set(comic_ids)
+        with self._lock:
+            for key in [key for key in self._pending if key[1] in comic_ids]:
+                del self._pending[key]
+
+    def discard_user(self, user_id: int):
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == user_id]:
+                del self._pending[key]
+
+    def flush(self, user_id: int | None = None) -> int:
+        """
+        Escribe lo pendiente (solo lo de user_id, si se indica). Devuelve el
+        número de filas escritas.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = {key: progress for key, progress in self._pending.items()
+                         if user_id is None or key[0] == user_id}
+            if not batch:
+                return 0
+            t0 = time.perf_counter()
+            try:
+                self._write(batch)
+                done, written = batch, len(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  No se pudo guardar el progreso de lectura en lote: {e}")
+                # Fila a fila, para que una entrada mala no bloquee las demás
+                done, written = self._write_each(batch)
+            with self._lock:
+                for key, progress in done.items():
+                    # Solo se sueltan las que no cambiaron mientras se escribía
+                    if self._pending.get(key) is progress:
+                        del self._pending[key]
+
+            elapsed = (time.perf_counter() - t0) * 1000
+            self.flushes += 1
+            self.rows_flushed += written
+            self.last_batch_size = written
+            self.max_batch_size = max(self.max_batch_size, written)
+            self.last_flush_ms = elapsed
+            self.total_flush_ms += elapsed
+            return written
+
+    def _write_each(self, batch: dict[tuple[int, int], Progress]) -> tuple[dict, int]:
+        """
+        Returns:
+            (entradas resueltas: escritas o descartadas por no poder escribirse
+            nunca, filas escritas). Si la base no está disponible (bloqueada,
+            disco lleno) se para y el resto sigue en el buffer.
+        """
+        done = {}
+        written = 0
+        for key, progress in batch.items():
+            try:
+                self._write({key: progress})
+                written += 1
+            except OperationalError as e:
+                print(f"⚠️  Progreso pendiente hasta el siguiente volcado: {e}")
+                break
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Progreso descartado (usuario {key[0]}, cómic {key[1]}): {e}")
+            done[key] = progress
+        return done, written
+
+    def _write(self, batch: dict[tuple[int, int], Progress]):
+        Row = models.ReadingProgress.__table__
+        db = SessionLocal()
+        try:
+            items = list(batch.items())
+            for start in range(0, len(items), self.batch_size):
+                stmt = insert(Row).values([
+                    {"user_id": key[0], "comic_id": key[1], "current_page": p.current,
+                     "reading_mode": p.reading_mode, "reading_direction": p.reading_direction,
+                     "updated_at": p.updated_at}
+                    for key, p in items[start:start + self.batch_size]
+                ])
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=[Row.c.user_id, Row.c.comic_id],
+                    set_={column: stmt.excluded[column] for column in
+                          ("current_page", "reading_mode", "reading_direction", "updated_at")},
+                    where=stmt.excluded.updated_at > Row.c.updated_at,
+                ))
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="progress-flush", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "errors": self.errors,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+progress_store = ProgressStore(PROGRESS_FLUSH_INTERVAL, PROGRESS_FLUSH_BATCH, PROGRESS_WRITE_BEHIND)
+
+
+@event.listens_for(models.User, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    # Que el siguiente volcado no recree progreso de un usuario ya borrado
+    progress_store.discard_user(target.id)
@@ -0,0 +1,133 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZIP_STORED
+
+from .config import READAHEAD_PAGES, READAHEAD_WORKERS
+from .page_index import PageIndex
+from .renditions import RenditionParams, content_key, get_page_rendition
+from .shared_cache import CacheSpace, shared_cache
+from .utils import PageEntry, read_page_entry
+
+
+# Páginas más grandes que esto no se guardan en caché (se sirven del archivo)
+MAX_CACHED_PAGE = 32 * 1024 * 1024
+
+
+def page_key(index: PageIndex, number: int) -> tuple:
+    # Por contenido si se conoce (content_key): la misma página en varios cómics se guarda una vez
+    return ("page", content_key(index, index.pages[number]))
+
+
+class PageByteCache:
+    """
+    Páginas originales ya descomprimidas, en la caché compartida por todos
+    los workers (CACHE_DIR/originals/). Se leen mapeadas en memoria: get()
+    devuelve una vista sobre el mapeo, sin copiar los bytes.
+    """
+
+    def __init__(self, space: CacheSpace):
+        self.space = space
+
+    def get(self, key: tuple) -> memoryview | None:
+        return self.space.read(key[1])
+
+    def __contains__(self, key: tuple) -> bool:
+        return key[1] in self.space
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > MAX_CACHED_PAGE:
+            return
+        self.space.put(key[1], data)
+
+    def sizes(self) -> list[tuple[str, int]]:
+        """(clave, bytes) de cada página en caché."""
+        return self.space.sizes()
+
+    def stats(self) -> dict:
+        return self.space.stats()
+
+
+class ReadAhead:
+    """
+    Precarga las páginas alrededor de la que se está leyendo.
+
+    El orden de las páginas es el mismo en ltr y rtl (rtl solo invierte cómo se
+    muestran), así que la dirección de lectura no cambia qué páginas se cargan;
+    lo que sí cuenta es el modo (en doble página cada paso son dos páginas, en
+    webtoon el scroll consume más) y si el lector va hacia atrás.
+    Con parámetros de rendition se calienta la caché de renditions, que es
+    donde está el coste (la conversión); si no, la de páginas descomprimidas
+    (las STORED no: se envían con sendfile desde el propio archivo).
+    """
+
+    MODE_STEP = {"single": 1, "double": 2, "webtoon": 2}
+
+    def __init__(self, cache: PageByteCache, pages: int, workers: int):
+        self.cache = cache
+        self.pages = pages
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="readahead")
+        self._inflight: set[tuple] = set()
+        self._lock = threading.Lock()
+        self.scheduled = 0
+
+    def window(self, center: int, total: int, mode: str = "double", backwards: bool = False) -> list[int]:
+        step = self.MODE_STEP.get(mode, 1)
+        ahead = self.pages * step
+        behind = max(step, ahead // 2)
+        if backwards:
+            ahead, behind = behind, ahead
+        # Primero las más cercanas en el sentido de lectura
+        forward = range(center + 1, min(total, center + ahead + 1))
+        backward = range(center - 1, max(-1, center - behind - 1), -1)
+        return list(forward) + list(backward)
+
+    def read(self, index: PageIndex, entry: PageEntry) -> bytes | memoryview:
+        """Bytes de una página, de la caché o del archivo (y se guardan)."""
+        key = page_key(index, entry.number)
+        data = self.cache.get(key)
+        if data is None:
+            data = read_page_entry(index, entry).getvalue()
+            # Las STORED se sirven del propio archivo (sendfile): copiarlas a
+            # la caché solo ocuparía disco
+            if entry.compress_type != ZIP_STORED:
+                self.cache.put(key, data)
+        return data
+
+    def warm(self, index: PageIndex, center: int, mode: str = "double", backwards: bool = False,
+             params: RenditionParams | None = None):
+        for number in self.window(center, len(index.pages), mode, backwards):
+            key = page_key(index, number)
+            if params is None and (index.pages[number].compress_type == ZIP_STORED or key in self.cache):
+                continue
+            key += (params,)
+            with self._lock:
+                if key in self._inflight:
+                    continue
+                self._inflight.add(key)
+                self.scheduled += 1
+            self._executor.submit(self._warm_one, index, number, params, key)
+
+    def _warm_one(self, index: PageIndex, number: int, params: RenditionParams | None, key: tuple):
+        try:
+            entry = index.pages[number]
+            if params is None:
+                self.read(index, entry)
+            else:
+                get_page_rendition(index, entry, params)
+        except Exception as e:
+            print(f"⚠️  Precarga fallida (cómic {index.comic_id}, página {number}): {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {"scheduled": self.scheduled, "inflight": inflight, **self.cache.stats()}
+
+
+page_cache = PageByteCache(shared_cache.space("originals"))
+readahead = ReadAhead(page_cache, READAHEAD_PAGES, READAHEAD_WORKERS)
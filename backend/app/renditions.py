@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401  (registra AVIF en Pillow < 11)
+except ImportError:
+    pillow_avif = None
+
+from .metrics import stage
+from .page_index import PageIndex
+from .shared_cache import shared_cache
+from .utils import PageEntry, read_page_entry
+
+
+RENDITION_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def format_available(fmt: str) -> bool:
+    Image.init()  # Image.SAVE se llena al cargar los plugins
+    return RENDITION_FORMATS[fmt][0] in Image.SAVE
+
+
+@dataclass(frozen=True)
+class RenditionParams:
+    width: int
+    format: str = "webp"
+    quality: int = 80
+
+    @property
+    def media_type(self) -> str:
+        return RENDITION_FORMATS[self.format][1]
+
+    def suffix(self) -> str:
+        return f"w{self.width}-q{self.quality}.{self.format}"
+
+
+def decode_scaled(data: bytes, width: int) -> Image.Image:
+    """Decodifica una imagen reducida (solo hacia abajo) al ancho dado."""
+    img = Image.open(BytesIO(data))
+    # En JPEG draft() decodifica directamente a una escala reducida
+    img.draft(None, (width, img.height * width // max(img.width, 1)))
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        img = img.resize((width, height), Image.LANCZOS)
+    else:
+        img.load()
+    return img
+
+
+def encode_image(img: Image.Image, params: RenditionParams) -> bytes:
+    """Codifica una imagen ya decodificada con el formato y la calidad pedidos."""
+    if params.format == "jpeg" or img.mode not in ("RGB", "RGBA"):
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha and params.format != "jpeg" else "RGB")
+
+    out = BytesIO()
+    pil_format = RENDITION_FORMATS[params.format][0]
+    if pil_format == "WEBP":
+        img.save(out, pil_format, quality=params.quality, method=4)
+    elif pil_format == "JPEG":
+        img.save(out, pil_format, quality=params.quality, optimize=True, progressive=True)
+    else:
+        img.save(out, pil_format, quality=params.quality)
+    return out.getvalue()
+
+
+def render_image(data: bytes, params: RenditionParams) -> bytes:
+    """
+    Redimensiona (solo hacia abajo) y recodifica una imagen.
+
+    Args:
+        data: Bytes de la imagen original
+        params: Ancho destino, formato y calidad
+
+    Returns:
+        Bytes de la imagen en el formato pedido
+    """
+    with stage("transcode"), decode_scaled(data, params.width) as img:
+        return encode_image(img, params)
+
+
+# Renditions, tiles, portadas y paquetes de miniaturas: CACHE_DIR/renditions/
+rendition_cache = shared_cache.space("renditions")
+
+
+# Prefijo de las claves de caché direccionadas por contenido
+CONTENT_PREFIX = "pages"
+
+
+def content_key(index: PageIndex, entry: PageEntry) -> str:
+    """
+    Prefijo de las claves de caché de lo que se deriva de una página. Con el
+    hash de contenido, una página repetida en varios cómics (créditos,
+    portadas, reediciones) se convierte y se guarda una sola vez; sin él, la
+    huella del archivo y el CRC de la entrada.
+    """
+    if entry.content_hash:
+        return f"{CONTENT_PREFIX}/{entry.content_hash[:2]}/{entry.content_hash}"
+    return f"{index.comic_id}/{entry.number}-{index.file_size:x}-{index.file_mtime:x}-{entry.crc:08x}"
+
+
+def get_page_rendition(index: PageIndex, entry: PageEntry, params: RenditionParams) -> Path:
+    """
+    Devuelve la ruta de la versión cacheada de una página, generándola la
+    primera vez. La clave sale del contenido de la página (content_key), así
+    que un archivo modificado nunca sirve versiones viejas.
+    """
+    key = f"{content_key(index, entry)}-{params.suffix()}"
+    return rendition_cache.get_or_create(
+        key, lambda: render_image(read_page_entry(index, entry).getvalue(), params)
+    )
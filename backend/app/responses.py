@@ -0,0 +1,205 @@
+import os
+import zipfile
+import zlib
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .archive_pool import ArchiveChangedError, ArchiveHandle, archive_pool
+from .archives import EXTERNAL, read_external
+from .page_io import page_io
+from .utils import PageEntry
+
+
+CHUNK_SIZE = 256 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def iter_file_range(fd: int, offset: int, count: int, chunk_size: int = CHUNK_SIZE):
+    """Recorre count bytes del descriptor a partir de offset, por bloques."""
+    remaining = count
+    while remaining > 0:
+        chunk = os.pread(fd, min(chunk_size, remaining), offset)
+        if not chunk:
+            raise zipfile.BadZipFile(f"Datos truncados en el descriptor {fd}")
+        offset += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def iter_deflated(handle: ArchiveHandle, entry: PageEntry, start: int = 0, end: int | None = None,
+                  chunk_size: int = CHUNK_SIZE):
+    """
+    Descomprime una entrada DEFLATED por bloques, sin tenerla entera en memoria,
+    y devuelve solo los bytes [start, end). El CRC se comprueba cuando se
+    descomprime la entrada completa.
+    """
+    end = entry.file_size if end is None else end
+    decompressor = zlib.decompressobj(-15)
+    crc = 0
+    position = 0
+
+    def window(data: bytes) -> bytes:
+        nonlocal position
+        begin = position
+        position += len(data)
+        return data[max(0, start - begin):max(0, end - begin)]
+
+    for raw in iter_file_range(handle.fd, entry.data_offset, entry.compress_size, chunk_size):
+        data = decompressor.decompress(raw)
+        crc = zlib.crc32(data, crc)
+        part = window(data)
+        if part:
+            yield part
+        if position >= end and end < entry.file_size:
+            return
+    data = decompressor.flush()
+    crc = zlib.crc32(data, crc)
+    part = window(data)
+    if part:
+        yield part
+    if crc != entry.crc:
+        raise zipfile.BadZipFile(f"CRC incorrecto para '{entry.name}' en {handle.path}")
+
+
+async def send_chunks(send: Send, chunks):
+    iterator = iter(chunks)
+    while True:
+        chunk = await page_io.call(next, iterator, None)
+        if chunk is None:
+            break
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def send_file_range(scope: Scope, send: Send, fd: int, offset: int, count: int):
+    """
+    Envía un rango de un archivo. Si el servidor ASGI ofrece la extensión
+    zerocopysend se le entrega el descriptor con offset y longitud (sendfile);
+    si no, se copia por bloques con pread.
+    """
+    if count > 0 and ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+        with open(fd, "rb", closefd=False) as f:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": f,
+                "offset": offset,
+                "count": count,
+                "more_body": False,
+            })
+        return
+    await send_chunks(send, iter_file_range(fd, offset, count))
+
+
+class RangeResponse(Response):
+    """
+    Base para respuestas que pueden enviar la representación completa (200) o
+    un rango [start, end) de ella (206).
+    """
+
+    def __init__(self, total_size: int, media_type: str, headers: dict | None = None,
+                 byte_range: tuple[int, int] | None = None):
+        headers = dict(headers or {})
+        headers["accept-ranges"] = "bytes"
+        if byte_range is None:
+            self.start, self.end = 0, total_size
+            status_code = 200
+        else:
+            self.start, self.end = byte_range
+            status_code = 206
+            headers["content-range"] = f"bytes {self.start}-{self.end - 1}/{total_size}"
+        headers["content-length"] = str(self.end - self.start)
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+
+    async def _send_start(self, send: Send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+
+class BytesRangeResponse(RangeResponse):
+    """Respuesta desde bytes en memoria o mapeados (caché compartida de páginas)."""
+
+    def __init__(self, data: bytes | memoryview, media_type: str, headers: dict | None = None,
+                 byte_range: tuple[int, int] | None = None):
+        super().__init__(len(data), media_type, headers, byte_range)
+        self.body = data[self.start:self.end] if byte_range is not None else data
+
+
+class ArchiveEntryResponse(RangeResponse):
+    """
+    Envía una página directamente desde el archivo del cómic (o desde la
+    imagen suelta, en carpetas y archivos sólidos extraídos).
+
+    - STORED: los bytes de la página son un rango contiguo del archivo y se
+      envían con send_file_range.
+    - DEFLATED: se descomprime por bloques.
+    - Otros métodos (bzip2, lzma) se leen enteros con zipfile, y los RAR no
+      sólidos con la herramienta externa.
+
+    Salvo en el último caso, la imagen completa nunca pasa por el heap de
+    Python. El handle del pool se mantiene prestado mientras dura el envío.
+    """
+
+    def __init__(self, path: str, entry: PageEntry, media_type: str, headers: dict | None = None,
+                 byte_range: tuple[int, int] | None = None, fingerprint: tuple[int, int] | None = None):
+        super().__init__(entry.file_size, media_type, headers, byte_range)
+        self.path = path
+        self.entry = entry
+        # Huella del índice de entry (ver ArchivePool.checkout)
+        self.fingerprint = fingerprint
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            handle = await page_io.call(archive_pool.checkout, self.path, self.fingerprint)
+        except ArchiveChangedError:
+            # Reemplazado entre el índice y el envío: al repetir la petición
+            # se usa el índice nuevo
+            await Response(status_code=503, headers={"Retry-After": "0"})(scope, receive, send)
+            return
+        try:
+            await self._send_start(send)
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif self.entry.compress_type == zipfile.ZIP_STORED:
+                await send_file_range(scope, send, handle.fd,
+                                      self.entry.data_offset + self.start, self.end - self.start)
+            elif self.entry.compress_type == zipfile.ZIP_DEFLATED:
+                await send_chunks(send, iter_deflated(handle, self.entry, self.start, self.end))
+            elif self.entry.compress_type == EXTERNAL:
+                body = await page_io.call(read_external, self.path, self.entry.name)
+                await send({"type": "http.response.body", "body": body[self.start:self.end], "more_body": False})
+            else:
+                body = await page_io.call(handle.read_member, self.entry.name)
+                await send({"type": "http.response.body", "body": body[self.start:self.end], "more_body": False})
+        finally:
+            await page_io.call(archive_pool.release, handle)
+
+        if self.background is not None:
+            await self.background()
+
+
+class FileRangeResponse(RangeResponse):
+    """Como FileResponse, pero con soporte de Range y envío zero-copy."""
+
+    def __init__(self, path: str, media_type: str, headers: dict | None = None,
+                 byte_range: tuple[int, int] | None = None, st: os.stat_result | None = None):
+        st = st or os.stat(path)
+        super().__init__(st.st_size, media_type, headers, byte_range)
+        self.path = path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        fd = await page_io.call(os.open, self.path, os.O_RDONLY)
+        try:
+            await self._send_start(send)
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            else:
+                await send_file_range(scope, send, fd, self.start, self.end - self.start)
+        finally:
+            os.close(fd)
+
+        if self.background is not None:
+            await self.background()
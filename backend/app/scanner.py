@@ -0,0 +1,434 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import models
+from .archive_pool import archive_pool
+from .config import COMICS_DIR, SCAN_BATCH_SIZE, SCAN_EXECUTOR, SCAN_WORKERS
+from .database import SessionLocal
+from .metrics import SCAN_SECONDS
+from .page_index import INDEX_VERSION, forget_page_index, write_page_indexes
+from .process_lock import library_scan_lock
+from .progress_store import progress_store
+from .thumbnails import schedule_covers, schedule_missing_covers
+from .utils import (ARCHIVE_EXTENSIONS, comic_path, extraction_dir, is_page_name, scan_pages,
+                    stat_comic)
+
+
+SCAN_EXTENSIONS = ARCHIVE_EXTENSIONS
+
+
+def extract_volume(filename: str):
+    patterns = [
+        r"(?i)(?:vol\.?|volume|tomo)[\s._-]*(\d+)",
+        r"(?i)#?(\d+)",
+        r"(?i)cap[\s._-]*(\d+)",
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, filename)
+        if match:
+            return int(match.group(1))
+    return 9999
+
+
+def series_from_path(relative: str) -> str:
+    # Serie = nombre de la carpeta padre
+    parent = Path(relative).parent.name
+    return parent if parent else "Sin serie"
+
+
+def list_library(root: Path, top: Path | None = None) -> dict[str, tuple[int, int]]:
+    """
+    Recorre la biblioteca con os.scandir y devuelve
+    {ruta relativa: (tamaño, mtime_ns)} de todos los cómics: archivos y
+    carpetas de imágenes sueltas (con imágenes y sin archivos de cómic dentro,
+    ni subcarpetas con cómics o imágenes: una carpeta de serie con cover.jpg y
+    los tomos en subcarpetas no es un cómic, se sigue bajando).
+    Con top solo se recorre esa carpeta (rutas siempre relativas a root).
+    """
+    root = str(root)
+    found = {}
+    stack = [str(top) if top is not None else root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = [entry for entry in it if not entry.name.startswith(".")]
+            archives = [e for e in entries if e.is_file() and e.name.lower().endswith(SCAN_EXTENSIONS)]
+            subdirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+            if directory != root and not archives and any(
+                    e.is_file() and is_page_name(e.name) for e in entries) and not _holds_comics(subdirs):
+                st = stat_comic(directory)
+                relative = os.path.relpath(directory, root).replace(os.sep, "/")
+                found[relative] = (st.st_size, st.st_mtime_ns)
+                continue
+            stack.extend(subdirs)
+            for entry in archives:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                relative = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                found[relative] = (st.st_size, st.st_mtime_ns)
+        except (PermissionError, FileNotFoundError) as e:
+            print(f"⚠️  No se pudo leer {directory}: {e}")
+    return found
+
+
+def _holds_comics(directories: list[str]) -> bool:
+    """Si hay archivos de cómic o imágenes en esas carpetas (a cualquier profundidad)."""
+    stack = list(directories)
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(SCAN_EXTENSIONS) or is_page_name(entry.name):
+                        return True
+        except (PermissionError, FileNotFoundError):
+            continue
+    return False
+
+
+def list_scope(root: Path, scope: str) -> dict[str, tuple[int, int]]:
+    """Como list_library, pero solo de un cómic o de una carpeta (ruta relativa)."""
+    path = Path(root) / scope
+    try:
+        if path.is_dir():
+            return list_library(root, path)
+        if path.name.lower().endswith(SCAN_EXTENSIONS) and not path.name.startswith("."):
+            st = path.stat()
+            return {scope: (st.st_size, st.st_mtime_ns)}
+    except FileNotFoundError:
+        pass
+    return {}
+
+
+def index_archive(relative: str):
+    """
+    Trabajo del pool: lee el índice de un cómic (los sólidos se extraen aquí)
+    y el hash del archivo, con el que se detectan las subidas duplicadas.
+    Devuelve (relative, tamaño, mtime_ns, ArchiveScan) o (relative, None, None, error).
+    """
+    path = comic_path(relative)
+    try:
+        st = stat_comic(path)
+        # Hash del archivo y de las páginas en una sola lectura
+        scan = scan_pages(path, str(extraction_dir(path, st.st_size, st.st_mtime_ns)), file_hash=True)
+        return relative, st.st_size, st.st_mtime_ns, scan
+    except Exception as e:
+        return relative, None, None, e
+
+
+def comic_title(relative: str, is_dir: bool) -> str:
+    # Las carpetas no tienen extensión que quitar ("Vol.1" se queda entero)
+    return Path(relative).name if is_dir else Path(relative).stem
+
+
+@dataclass
+class ScanStatus:
+    state: str = "idle"  # idle | listing | indexing | done | error
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    files_on_disk: int = 0
+    to_index: int = 0
+    processed: int = 0
+    added: int = 0
+    updated: int = 0
+    renamed: int = 0
+    removed: int = 0
+    failed: list[str] = field(default_factory=list)
+    error: str | None = None
+    _t0: float = 0.0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        del data["_t0"]
+        data["failed"] = len(self.failed)
+        elapsed = (time.monotonic() - self._t0) if self._t0 else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.to_index - self.processed)
+        data.update({
+            "files_per_sec": round(rate, 1),
+            "remaining": remaining,
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+        })
+        return data
+
+
+class LibraryScanner:
+    """
+    Escaneo incremental de la biblioteca.
+
+    1. Lista los archivos con su huella (tamaño, mtime) y la compara con un
+       único mapa precargado de los cómics conocidos.
+    2. Solo abre los archivos nuevos o modificados, en un pool de hilos o de
+       procesos (SCAN_EXECUTOR / SCAN_WORKERS).
+    3. Escribe en lotes (SCAN_BATCH_SIZE) y elimina los cómics cuyo archivo
+       ya no existe. Un archivo que desaparece y otro nuevo con la misma
+       huella son un renombrado: se conserva el cómic (id, progreso, portada).
+
+    sync() hace lo mismo solo sobre algunas rutas (lo que usa el watcher).
+    Escaneos y syncs no se solapan, tampoco entre workers (library_scan_lock).
+    """
+
+    def __init__(self, root: Path, workers: int, executor: str, batch_size: int):
+        self.root = Path(root)
+        self.workers = workers
+        self.executor = executor
+        self.batch_size = batch_size
+        self._status = ScanStatus()
+        # Huellas de archivos que fallaron: no se reintentan hasta que cambien
+        self._failed: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread = None
+
+    def status(self) -> dict:
+        return self._status.as_dict()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Lanza un escaneo en un hilo de fondo. False si ya hay uno en curso."""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._thread = threading.Thread(target=self.run, name="library-scan", daemon=True)
+            self._thread.start()
+            return True
+
+    def run(self) -> ScanStatus:
+        status = ScanStatus(state="listing", started_at=datetime.utcnow(), _t0=time.monotonic())
+        self._status = status
+        if not self.root.exists():
+            print("⚠️  Carpeta /comics no existe - crea el volumen Docker")
+            status.state = "error"
+            status.error = "La carpeta de cómics no existe"
+            return status
+
+        with self._run_lock, library_scan_lock:
+            db = SessionLocal()
+            try:
+                on_disk = list_library(self.root)
+                if not on_disk and db.query(models.Comic.id).first() is not None:
+                    # Carpeta vacía pero cómics en la base: casi seguro un volumen sin montar
+                    print("⚠️  No se encontró ningún archivo; no se eliminan cómics")
+                else:
+                    self._reconcile(db, status, on_disk, self._known(db))
+                status.state = "done"
+                SCAN_SECONDS.observe(time.monotonic() - status._t0)
+            except Exception as e:
+                db.rollback()
+                status.state = "error"
+                status.error = str(e)
+                raise
+            finally:
+                status.finished_at = datetime.utcnow()
+                db.close()
+
+        if status.added or status.updated or status.renamed or status.removed:
+            print(f"✅ Escaneo: {self._summary(status)}")
+        else:
+            print("ℹ️  No hay cómics nuevos")
+        return status
+
+    def sync(self, scopes: list[str]) -> ScanStatus:
+        """
+        Escaneo incremental de solo esas rutas relativas: cada una es un cómic
+        (archivo o carpeta de imágenes) o una carpeta con cómics dentro. Lo
+        que ya no existe se elimina; lo nuevo o cambiado se indexa.
+        """
+        status = ScanStatus(state="listing", started_at=datetime.utcnow(), _t0=time.monotonic())
+        with self._run_lock, library_scan_lock:
+            db = SessionLocal()
+            try:
+                on_disk = {}
+                for scope in scopes:
+                    on_disk.update(list_scope(self.root, scope))
+                filename = models.Comic.filename
+                known = self._known(db, or_(*(
+                    or_(filename == scope, filename.startswith(f"{scope}/", autoescape=True))
+                    for scope in scopes
+                )))
+                self._reconcile(db, status, on_disk, known)
+                status.state = "done"
+            except Exception as e:
+                db.rollback()
+                status.state = "error"
+                status.error = str(e)
+                raise
+            finally:
+                status.finished_at = datetime.utcnow()
+                db.close()
+
+        if status.added or status.updated or status.renamed or status.removed:
+            print(f"🔄 Biblioteca: {self._summary(status)}")
+        return status
+
+    @staticmethod
+    def _summary(status: ScanStatus) -> str:
+        return (f"{status.added} nuevos, {status.updated} actualizados, {status.renamed} renombrados, "
+                f"{status.removed} eliminados, {len(status.failed)} con errores")
+
+    @staticmethod
+    def _known(db, *where) -> dict[str, tuple]:
+        return {
+            filename: (comic_id, file_size, file_mtime, version)
+            for comic_id, filename, file_size, file_mtime, version in db.execute(
+                select(models.Comic.id, models.Comic.filename, models.ArchiveIndex.file_size,
+                       models.ArchiveIndex.file_mtime, models.ArchiveIndex.version)
+                .outerjoin(models.ArchiveIndex, models.ArchiveIndex.comic_id == models.Comic.id)
+                .where(*where)
+            )
+        }
+
+    def _reconcile(self, db, status: ScanStatus, on_disk, known):
+        status.files_on_disk = len(on_disk)
+
+        pending = []
+        for relative, (size, mtime) in on_disk.items():
+            current = known.get(relative)
+            if current is None or current[1:] != (size, mtime, INDEX_VERSION):
+                if self._failed.get(relative) == (size, mtime):
+                    status.failed.append(relative)
+                    continue
+                pending.append(relative)
+
+        deleted = [filename for filename in known if filename not in on_disk]
+        renames = self._renames(deleted, pending, on_disk, known)
+        if renames:
+            self._rename(db, renames, known, status)
+            moved = {old for old, _ in renames} | {new for _, new in renames}
+            deleted = [filename for filename in deleted if filename not in moved]
+            pending = [relative for relative in pending if relative not in moved]
+        self._remove(db, [known[filename][0] for filename in deleted], status)
+
+        status.state = "indexing"
+        status.to_index = len(pending)
+        if pending:
+            self._index(db, pending, on_disk, known, status)
+        schedule_missing_covers()
+
+    @staticmethod
+    def _renames(deleted, pending, on_disk, known) -> list[tuple[str, str]]:
+        """
+        Parejas (ruta vieja, ruta nueva) con la misma huella: renombrar o mover
+        conserva tamaño y mtime. Solo si la pareja es única por ambos lados.
+        """
+        gone: dict[tuple[int, int], list[str]] = {}
+        for filename in deleted:
+            _, size, mtime, version = known[filename]
+            if size is not None and version == INDEX_VERSION:
+                gone.setdefault((size, mtime), []).append(filename)
+        new: dict[tuple[int, int], list[str]] = {}
+        for relative in pending:
+            if relative not in known:
+                new.setdefault(on_disk[relative], []).append(relative)
+        return [
+            (old[0], new[fingerprint][0])
+            for fingerprint, old in gone.items()
+            if len(old) == 1 and len(new.get(fingerprint, ())) == 1
+        ]
+
+    def _rename(self, db, renames: list[tuple[str, str]], known, status: ScanStatus):
+        db.execute(update(models.Comic), [{
+            "id": known[old][0],
+            "filename": new,
+            "title": comic_title(new, os.path.isdir(comic_path(new))),
+            "series": series_from_path(new),
+            "volume": extract_volume(comic_title(new, os.path.isdir(comic_path(new)))),
+        } for old, new in renames])
+        db.commit()
+        for old, _ in renames:
+            forget_page_index(known[old][0])
+            archive_pool.invalidate(comic_path(old))
+        status.renamed += len(renames)
+
+    def _index(self, db, pending, on_disk, known, status: ScanStatus):
+        pool_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        with pool_class(max_workers=self.workers) as pool:
+            batch = []
+            for result in pool.map(index_archive, pending, chunksize=8 if self.executor == "process" else 1):
+                status.processed += 1
+                relative, size, _, scan = result
+                if size is None:
+                    print(f"⚠️  Cómic con errores, se omite: {relative} ({scan})")
+                    status.failed.append(relative)
+                    self._failed[relative] = on_disk[relative]
+                    continue
+                batch.append(result)
+                if len(batch) >= self.batch_size:
+                    self._write(db, batch, known, status)
+                    batch = []
+            self._write(db, batch, known, status)
+
+    def _write(self, db, batch, known, status: ScanStatus):
+        if not batch:
+            return
+        new = [result for result in batch if result[0] not in known]
+        if new:
+            # Si otro escritor (una subida) ya creó el cómic, el suyo se queda
+            rows = db.execute(
+                sqlite_insert(models.Comic).on_conflict_do_nothing(index_elements=["filename"])
+                .returning(models.Comic.id, models.Comic.filename),
+                [{
+                    "filename": relative,
+                    "title": comic_title(relative, scan.format == "dir"),
+                    "series": series_from_path(relative),
+                    "volume": extract_volume(comic_title(relative, scan.format == "dir")),
+                    "pages": len(scan.pages),
+                    "uploaded_at": datetime.utcnow(),
+                } for relative, _, _, scan in new],
+            ).all()
+            ids = {filename: comic_id for comic_id, filename in rows}
+        else:
+            ids = {}
+
+        indexes = []
+        changed = []
+        for relative, size, mtime, scan in batch:
+            comic_id = ids.get(relative)
+            if comic_id is None:
+                if relative not in known:
+                    continue
+                comic_id = known[relative][0]
+                forget_page_index(comic_id)
+                archive_pool.invalidate(comic_path(relative))
+                if known[relative][1:3] != (size, mtime):
+                    changed.append(comic_id)
+            indexes.append((comic_id, size, mtime, scan))
+        write_page_indexes(db, indexes)
+        db.commit()
+        # Portadas: las nuevas salen de schedule_missing_covers() al terminar
+        schedule_covers(changed)
+        status.added += len(ids)
+        status.updated += len(batch) - len(new)
+
+    def _remove(self, db, comic_ids: list[int], status: ScanStatus):
+        progress_store.discard_comics(comic_ids)
+        for start in range(0, len(comic_ids), self.batch_size):
+            chunk = comic_ids[start:start + self.batch_size]
+            db.execute(delete(models.ReadingProgress).where(models.ReadingProgress.comic_id.in_(chunk)))
+            db.execute(delete(models.ComicPage).where(models.ComicPage.comic_id.in_(chunk)))
+            db.execute(delete(models.ArchiveIndex).where(models.ArchiveIndex.comic_id.in_(chunk)))
+            db.execute(delete(models.Comic).where(models.Comic.id.in_(chunk)))
+            db.commit()
+            for comic_id in chunk:
+                forget_page_index(comic_id)
+            status.removed += len(chunk)
+
+
+library_scanner = LibraryScanner(COMICS_DIR, SCAN_WORKERS, SCAN_EXECUTOR, SCAN_BATCH_SIZE)
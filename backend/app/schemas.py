@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
 
 class ComicBase(BaseModel):
@@ -22,6 +22,42 @@ class ComicResponse(ComicBase):
         from_attributes = True
 
 
+class ComicGridItem(BaseModel):
+    """Proyección ligera para la cuadrícula de la biblioteca."""
+    id: int
+    title: str
+    series: Optional[str] = None
+    volume: Optional[int] = None
+    pages: int
+    cover_path: str | None
+
+    class Config:
+        from_attributes = True
+
+
+class ProgressUpdate(BaseModel):
+    current: int = Field(0, ge=0)
+    reading_mode: Literal["single", "double", "webtoon"] = "double"
+    reading_direction: Literal["ltr", "rtl"] = "ltr"
+
+
+class SearchResult(BaseModel):
+    kind: str  # comic | manga | manhwa
+    id: int
+    title: str
+    series: Optional[str] = None
+    filename: str
+    pages: Optional[int] = None
+    cover_path: str | None
+    score: float
+
+
+class SearchResponse(BaseModel):
+    items: list[SearchResult]
+    next_offset: Optional[int] = None
+    mode: str  # exact | fuzzy
+
+
 class UserBase(BaseModel):
     email: EmailStr
 
@@ -0,0 +1,201 @@
+"""
+Búsqueda en la biblioteca con un índice FTS5 de SQLite (tokenizer trigram)
+sobre título, serie y nombre de archivo de comics, manga y manhwa.
+
+- El índice se mantiene con triggers sobre las tres tablas, así que cualquier
+  alta, cambio o baja (escáner, subidas) lo actualiza en la misma transacción.
+- rowid = id * 4 + tipo: borrar o actualizar una fila del índice es una
+  búsqueda por clave, no un recorrido.
+- Con trigramas cualquier fragmento de 3 o más caracteres coincide (prefijos
+  incluidos). Si la búsqueda exacta no encuentra nada, se buscan los
+  trigramas sueltos y se reordenan los mejores candidatos por parecido, lo
+  que tolera errores de escritura.
+"""
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+SEARCH_TABLE = "library_search"
+KINDS = {"comic": (0, models.Comic), "manga": (1, models.Manga), "manhwa": (2, models.Manhwa)}
+KIND_BY_CODE = {code: kind for kind, (code, _) in KINDS.items()}
+KIND_SLOTS = 4
+
+# Pesos de bm25 por columna: title, series, filename
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+# Búsqueda tolerante: candidatos que se reordenan y parecido mínimo para aparecer
+FUZZY_CANDIDATES = 200
+FUZZY_MIN_SIMILARITY = 0.4
+
+
+def _series(model, prefix: str = "") -> str:
+    # manga y manhwa no tienen serie
+    return f"coalesce({prefix}series, '')" if hasattr(model, "series") else "''"
+
+
+def _triggers(model, code: int) -> list[str]:
+    table = model.__tablename__
+    watched = "title, series, filename" if hasattr(model, "series") else "title, filename"
+    row = f"new.id * {KIND_SLOTS} + {code}, coalesce(new.title, ''), {_series(model, 'new.')}, coalesce(new.filename, '')"
+    insert = f"INSERT INTO {SEARCH_TABLE}(rowid, title, series, filename) VALUES ({row});"
+    delete = f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * {KIND_SLOTS} + {code};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {watched} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def ensure_search_index(engine):
+    """
+    Crea la tabla FTS5 y sus triggers si no existen. La primera vez se llena
+    con lo que ya haya en la base.
+    """
+    created = not inspect(engine).has_table(SEARCH_TABLE)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(title, series, filename, tokenize='trigram')"
+        ))
+        for code, model in KINDS.values():
+            for statement in _triggers(model, code):
+                conn.execute(text(statement))
+        if created:
+            for code, model in KINDS.values():
+                conn.execute(text(
+                    f"INSERT INTO {SEARCH_TABLE}(rowid, title, series, filename) "
+                    f"SELECT id * {KIND_SLOTS} + {code}, coalesce(title, ''), {_series(model)}, "
+                    f"coalesce(filename, '') "
+                    f"FROM {model.__tablename__}"
+                ))
+
+
+def _tokens(query: str) -> list[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def trigrams(value: str) -> set[str]:
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def similarity(query_trigrams: set[str], row) -> float:
+    """Fracción de los trigramas de la búsqueda presentes en el mejor campo."""
+    if not query_trigrams:
+        return 0.0
+    title, series, filename = (trigrams(value or "") for value in row)
+    return max(
+        len(query_trigrams & title) / len(query_trigrams),
+        len(query_trigrams & series) / len(query_trigrams),
+        0.8 * len(query_trigrams & filename) / len(query_trigrams),
+    )
+
+
+def _where(kind: str | None, short: list[str], params: dict) -> str:
+    clauses = []
+    if kind is not None:
+        clauses.append(f"rowid % {KIND_SLOTS} = :kind_code")
+        params["kind_code"] = KINDS[kind][0]
+    # Términos de 1-2 caracteres: el índice de trigramas no los cubre; se
+    # buscan como inicio de palabra en título y serie (en el nombre de archivo
+    # coincidirían con casi todo, p. ej. "b" con ".cbz")
+    for i, term in enumerate(short):
+        clauses.append(f"(title LIKE :start{i} OR title LIKE :word{i} "
+                       f"OR series LIKE :start{i} OR series LIKE :word{i})")
+        params[f"start{i}"] = f"{term}%"
+        params[f"word{i}"] = f"% {term}%"
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def search_library(db: Session, query: str, kind: str | None = None, limit: int = 20,
+                   offset: int = 0) -> tuple[list[dict], int | None, str]:
+    """
+    Returns:
+        (resultados, siguiente offset o None, modo "exact" | "fuzzy")
+    """
+    tokens = _tokens(query)
+    long_terms = [term for term in tokens if len(term) >= 3]
+    short = [term for term in tokens if len(term) < 3]
+    if not tokens:
+        return [], None, "exact"
+    weights = ", ".join(str(weight) for weight in RANK_WEIGHTS)
+
+    params: dict = {"limit": limit + 1, "offset": offset}
+    if long_terms:
+        params["match"] = " AND ".join(_quote(term) for term in long_terms)
+        sql = (f"SELECT rowid, bm25({SEARCH_TABLE}, {weights}) AS score FROM {SEARCH_TABLE} "
+               f"WHERE {SEARCH_TABLE} MATCH :match{_where(kind, short, params)} "
+               f"ORDER BY score, rowid LIMIT :limit OFFSET :offset")
+    else:
+        sql = (f"SELECT rowid, 0.0 AS score FROM {SEARCH_TABLE} "
+               f"WHERE 1{_where(kind, short, params)} ORDER BY title, rowid LIMIT :limit OFFSET :offset")
+    rows = db.execute(text(sql), params).all()
+    mode = "exact"
+
+    if not rows and long_terms:
+        # Solo es "sin resultados" si tampoco los hay en páginas anteriores
+        exists_params = {"match": params["match"]}
+        exists = db.execute(text(
+            f"SELECT 1 FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match"
+            f"{_where(kind, short, exists_params)} LIMIT 1"
+        ), exists_params).first()
+        if exists is None:
+            mode = "fuzzy"
+            rows = _fuzzy(db, long_terms, kind, short, weights)[offset:offset + limit + 1]
+
+    next_offset = offset + limit if len(rows) > limit else None
+    return _load(db, rows[:limit], mode), next_offset, mode
+
+
+def _fuzzy(db: Session, terms: list[str], kind: str | None, short: list[str], weights: str) -> list:
+    query_trigrams = set().union(*(trigrams(term) for term in terms))
+    params: dict = {"match": " OR ".join(_quote(trigram) for trigram in sorted(query_trigrams)),
+                    "candidates": FUZZY_CANDIDATES}
+    candidates = db.execute(text(
+        f"SELECT rowid, title, series, filename FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH :match{_where(kind, short, params)} "
+        f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :candidates"
+    ), params).all()
+    scored = [(rowid, similarity(query_trigrams, (title, series, filename)))
+              for rowid, title, series, filename in candidates]
+    scored = [(rowid, score) for rowid, score in scored if score >= FUZZY_MIN_SIMILARITY]
+    # Más parecido primero; a igualdad, el orden del índice
+    return sorted(scored, key=lambda item: -item[1])
+
+
+def _load(db: Session, rows, mode: str) -> list[dict]:
+    by_kind: dict[str, list[int]] = {}
+    for rowid, _ in rows:
+        by_kind.setdefault(KIND_BY_CODE[rowid % KIND_SLOTS], []).append(rowid // KIND_SLOTS)
+    loaded = {}
+    for kind, ids in by_kind.items():
+        model = KINDS[kind][1]
+        for item in db.query(model).filter(model.id.in_(ids)):
+            loaded[(kind, item.id)] = item
+
+    results = []
+    for rowid, score in rows:
+        kind = KIND_BY_CODE[rowid % KIND_SLOTS]
+        item = loaded.get((kind, rowid // KIND_SLOTS))
+        if item is None:
+            continue
+        results.append({
+            "kind": kind,
+            "id": item.id,
+            "title": item.title,
+            "series": getattr(item, "series", None),
+            "filename": item.filename,
+            "pages": item.pages,
+            "cover_path": item.cover_path,
+            # bm25 de SQLite es negativo (menor es mejor); el parecido va de 0 a 1
+            "score": round(-score if mode == "exact" else score, 4) or 0.0,
+        })
+    return results
@@ -0,0 +1,497 @@
+"""
+Caché en disco compartida por todos los procesos de un host (workers de
+uvicorn, optimizador) bajo CACHE_DIR, que sobrevive a los reinicios.
+
+- Cada entrada es un archivo (CACHE_DIR/<espacio>/<clave>) y un índice SQLite
+  (CACHE_DIR/cache.db, en WAL) guarda su tamaño y su último uso. El límite
+  CACHE_MAX_BYTES y el orden LRU son globales: no hay una caché por worker.
+- Escrituras atómicas (temporal + os.replace). Los cambios de archivos y del
+  índice se hacen bajo el bloqueo de escritura de SQLite, así que nunca
+  quedan desalineados entre procesos; quien ya tenga abierto o mapeado un
+  archivo expulsado lo sigue leyendo.
+- Los bytes se leen con mmap: viven una sola vez en la caché de páginas del
+  sistema para todos los workers y se sirven sin copiarlos al heap de cada
+  uno. Renditions y tiles se envían por ruta (sendfile).
+- Los aciertos se apuntan en memoria y se vuelcan al índice en lote cada
+  CACHE_TOUCH_INTERVAL segundos; solo el primer acierto de una clave en
+  cada intervalo se escribe en el momento. Junto con el margen de
+  EVICT_GRACE_SECONDS, lo que se acaba de devolver no se expulsa.
+- Al arrancar, un solo proceso repasa el disco: borra temporales abandonados,
+  olvida entradas sin archivo y adopta archivos sin entrada (la caché de
+  renditions de versiones anteriores, o escrituras cortadas por un reinicio).
+"""
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: el mantenimiento no se coordina entre procesos
+    fcntl = None
+
+from .config import CACHE_DIR, CACHE_MAPPED_FILES, CACHE_MAX_BYTES, CACHE_TOUCH_INTERVAL, DB_BUSY_TIMEOUT_MS
+
+
+INDEX_NAME = "cache.db"
+MAINTENANCE_LOCK = "cache.db.maintenance"
+TEMP_SUFFIX = ".tmp"
+# Temporales más viejos que esto son de un proceso que murió escribiendo
+STALE_TEMP_SECONDS = 3600
+# Entradas que se expulsan por consulta
+EVICT_BATCH = 64
+# Lo usado hace menos de esto (o de dos CACHE_TOUCH_INTERVAL) no se expulsa:
+# una ruta recién devuelta se puede abrir sin que otro worker la borre antes
+EVICT_GRACE_SECONDS = 5
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " key TEXT PRIMARY KEY, space TEXT NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_used ON entries(used)",
+    "CREATE INDEX IF NOT EXISTS entries_space ON entries(space)",
+    # Totales por espacio mantenidos por triggers: stats() y la expulsión no recorren el índice
+    "CREATE TABLE IF NOT EXISTS totals ("
+    " space TEXT PRIMARY KEY, files INTEGER NOT NULL DEFAULT 0, bytes INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN"
+    " UPDATE totals SET files = files + 1, bytes = bytes + new.size WHERE space = new.space; END",
+    "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN"
+    " UPDATE totals SET files = files - 1, bytes = bytes - old.size WHERE space = old.space; END",
+    "CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN"
+    " UPDATE totals SET bytes = bytes - old.size + new.size WHERE space = new.space; END",
+)
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    # IMMEDIATE: el bloqueo de escritura se toma al empezar, no a mitad
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SharedCache:
+    """Índice y archivos de la caché compartida; cada uso va en un CacheSpace."""
+
+    def __init__(self, root: Path, max_bytes: int, touch_interval: float, mapped_files: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.mapped_files = mapped_files
+        self._spaces: list[str] = []
+        self._conn: sqlite3.Connection | None = None
+        self._pid = None
+        # _db_lock: la conexión (puede esperar al bloqueo de SQLite);
+        # _lock: estado en memoria (siempre breve)
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Clave -> (mapeo, inodo del archivo mapeado)
+        self._maps: "OrderedDict[str, tuple[mmap.mmap | bytes, int]]" = OrderedDict()
+        self._touched: dict[str, int] = {}
+        # Clave -> cuándo se escribió su último acceso en el índice (monotonic)
+        self._written: dict[str, float] = {}
+        self._flushed = time.monotonic()
+        self.grace_seconds = max(2 * touch_interval, EVICT_GRACE_SECONDS)
+        self._maintenance = None
+        self.evictions = 0
+        self.errors = 0
+
+    def space(self, name: str) -> "CacheSpace":
+        with self._db_lock:
+            self._spaces.append(name)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR IGNORE INTO totals(space) VALUES (?)", (name,))
+        return CacheSpace(self, name)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Llamar con self._db_lock tomado. Una conexión por proceso: tras un
+        # fork se abre otra
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        self.root.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.root / INDEX_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _transaction(conn):
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.executemany("INSERT OR IGNORE INTO totals(space) VALUES (?)",
+                             [(name,) for name in self._spaces])
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def lookup(self, key: str) -> Path | None:
+        """Ruta del archivo de key si está en caché (y se apunta el acceso)."""
+        path = self.root / key
+        if not path.exists():
+            return None
+        self._touch(key)
+        return path
+
+    def read(self, key: str) -> memoryview | None:
+        """
+        Contenido de key mapeado en memoria, sin copiarlo. Cada proceso
+        mantiene abiertos los últimos CACHE_MAPPED_FILES mapeos.
+
+        Un mapeo retiene el archivo aunque se borre: en cada acierto se
+        comprueba que la ruta sigue siendo el mismo inodo, y si otro worker
+        lo expulsó (o lo regeneró) se suelta el mapeo viejo.
+        """
+        path = self.root / key
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            inode = None
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached is not None and cached[1] == inode:
+                self._maps.move_to_end(key)
+                mapped = cached[0]
+            else:
+                mapped = None
+                if cached is not None:
+                    del self._maps[key]
+        if inode is None:
+            return None
+        if mapped is None:
+            try:
+                with open(path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    # mmap no admite longitud 0
+                    mapped = mmap.mmap(f.fileno(), st.st_size, access=mmap.ACCESS_READ) if st.st_size else b""
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                self._maps[key] = (mapped, st.st_ino)
+                while len(self._maps) > self.mapped_files:
+                    # Sin close(): puede haber respuestas enviando desde el mapeo;
+                    # se libera cuando suelten la última vista
+                    self._maps.popitem(last=False)
+        self._touch(key)
+        return memoryview(mapped)
+
+    def put(self, key: str, space: str, data: bytes) -> Path:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}{TEMP_SUFFIX}")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            with self._db_lock:
+                conn = self._connect()
+                with _transaction(conn):
+                    os.replace(tmp, path)
+                    conn.execute(
+                        "INSERT INTO entries(key, space, size, used) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET size = excluded.size, used = excluded.used",
+                        (key, space, len(data), time.time_ns()),
+                    )
+                    self._evict(conn, keep=key)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        return path
+
+    def _evict(self, conn: sqlite3.Connection, keep: str | None = None):
+        # Llamar dentro de una transacción: se borran filas y archivos juntos
+        total = conn.execute("SELECT coalesce(sum(bytes), 0) FROM totals").fetchone()[0]
+        # Si todo lo que sobra está en uso se supera el límite hasta la siguiente escritura
+        recent = time.time_ns() - int(self.grace_seconds * 1e9)
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM entries WHERE key != ? AND used < ? ORDER BY used LIMIT ?",
+                (keep or "", recent, EVICT_BATCH),
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+            for key in evicted:
+                try:
+                    os.unlink(self.root / key)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self.evictions += len(evicted)
+                for key in evicted:
+                    self._maps.pop(key, None)
+
+    def _touch(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            self._touched[key] = time.time_ns()
+            # Primer acierto de la clave en este intervalo: se escribe ya, para
+            # que el índice no la siga viendo como la más vieja
+            first = now - self._written.get(key, -self.touch_interval) >= self.touch_interval
+            periodic = now - self._flushed >= self.touch_interval
+            if not (first or periodic):
+                return
+            touched, self._touched = self._touched, {}
+            for written in touched:
+                self._written[written] = now
+            if periodic:
+                self._flushed = now
+                self._written = {k: t for k, t in self._written.items() if now - t < self.touch_interval}
+        if periodic:
+            self._drop_stale_maps()
+        self._flush(touched)
+
+    def _drop_stale_maps(self):
+        """Suelta los mapeos de archivos que otro worker borró o reemplazó."""
+        with self._lock:
+            maps = [(key, inode) for key, (_, inode) in self._maps.items()]
+        stale = []
+        for key, inode in maps:
+            try:
+                if os.stat(self.root / key).st_ino != inode:
+                    stale.append((key, inode))
+            except FileNotFoundError:
+                stale.append((key, inode))
+        with self._lock:
+            for key, inode in stale:
+                cached = self._maps.get(key)
+                if cached is not None and cached[1] == inode:
+                    del self._maps[key]
+
+    def _flush(self, touched: dict[str, int]):
+        if not touched:
+            return
+        try:
+            with self._db_lock:
+                conn = self._connect()
+                with _transaction(conn):
+                    conn.executemany("UPDATE entries SET used = max(used, ?) WHERE key = ?",
+                                     [(used, key) for key, used in touched.items()])
+        except sqlite3.Error as e:
+            # Solo se pierde precisión en el orden LRU
+            with self._lock:
+                self.errors += 1
+            print(f"⚠️  No se pudieron apuntar los accesos a la caché: {e}")
+
+    def sizes(self, space: str) -> list[tuple[str, int]]:
+        with self._db_lock:
+            return self._connect().execute("SELECT key, size FROM entries WHERE space = ?", (space,)).fetchall()
+
+    def totals(self, space: str | None = None) -> tuple[int, int]:
+        """(archivos, bytes) de un espacio, o de toda la caché."""
+        with self._db_lock:
+            conn = self._connect()
+            if space is None:
+                return conn.execute("SELECT coalesce(sum(files), 0), coalesce(sum(bytes), 0) FROM totals").fetchone()
+            return conn.execute("SELECT files, bytes FROM totals WHERE space = ?", (space,)).fetchone() or (0, 0)
+
+    def start(self):
+        """Repasa el disco en segundo plano (ver maintain)."""
+        if self._maintenance is not None:
+            return
+        self._maintenance = threading.Thread(target=self._maintain_job, name="cache-maintenance", daemon=True)
+        self._maintenance.start()
+
+    def _maintain_job(self):
+        try:
+            self.maintain()
+        except Exception as e:
+            print(f"⚠️  Error en el mantenimiento de la caché: {e}")
+
+    def maintain(self) -> bool:
+        """
+        Alinea índice y disco. Con varios workers solo lo hace uno; False si
+        ya lo estaba haciendo otro proceso.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / MAINTENANCE_LOCK, "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            t0 = time.monotonic()
+            adopted = forgotten = 0
+            for space in self._spaces:
+                found = self._walk(space)
+                a, f = self._reconcile(space, found)
+                adopted += a
+                forgotten += f
+            with self._db_lock:
+                conn = self._connect()
+                with _transaction(conn):
+                    # Por si se bajó CACHE_MAX_BYTES
+                    self._evict(conn)
+            files, total = self.totals()
+            print(f"🗄️  Caché compartida: {files} archivos, {total / 1024 ** 2:.1f} MB "
+                  f"({adopted} adoptados, {forgotten} olvidados, {time.monotonic() - t0:.1f}s)")
+        return True
+
+    def _walk(self, space: str) -> dict[str, tuple[int, int]]:
+        """Archivos del espacio en disco: clave -> (tamaño, mtime); borra temporales abandonados."""
+        found = {}
+        stale = time.time() - STALE_TEMP_SECONDS
+        for dirpath, _, filenames in os.walk(self.root / space):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith(TEMP_SUFFIX):
+                        if st.st_mtime < stale:
+                            os.unlink(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                found[os.path.relpath(path, self.root).replace(os.sep, "/")] = (st.st_size, st.st_mtime_ns)
+        return found
+
+    def _reconcile(self, space: str, found: dict[str, tuple[int, int]]) -> tuple[int, int]:
+        with self._db_lock:
+            conn = self._connect()
+            known = {key for key, in conn.execute("SELECT key FROM entries WHERE space = ?", (space,))}
+            with _transaction(conn):
+                # Se vuelve a mirar el disco dentro de la transacción: otro
+                # proceso pudo escribir o expulsar después del recorrido
+                missing = [(key,) for key in known - found.keys() if not (self.root / key).exists()]
+                new = [(key, space, size, used) for key, (size, used) in found.items()
+                       if key not in known and (self.root / key).exists()]
+                conn.executemany("DELETE FROM entries WHERE key = ?", missing)
+                # El mtime del archivo hace de último uso
+                conn.executemany("INSERT OR IGNORE INTO entries(key, space, size, used) VALUES (?, ?, ?, ?)", new)
+        return len(new), len(missing)
+
+    def close(self):
+        """Vuelca los accesos pendientes (al parar el servidor)."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        self._flush(touched)
+
+    def stats(self) -> dict:
+        files, total = self.totals()
+        with self._lock:
+            return {
+                "files": files,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "mapped": len(self._maps),
+                "pending_touches": len(self._touched),
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
+
+
+class CacheSpace:
+    """
+    Una parte de la caché compartida (CACHE_DIR/<nombre>/), con su propio
+    recuento de aciertos y fallos; el límite de tamaño es el de toda la caché.
+    """
+
+    def __init__(self, store: SharedCache, name: str):
+        self.store = store
+        self.name = name
+        self.root = store.root / name
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.name}/{key}"
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.path(self._key(key)).exists()
+
+    def read(self, key: str) -> memoryview | None:
+        data = self.store.read(self._key(key))
+        self._count(data is not None)
+        return data
+
+    def put(self, key: str, data: bytes) -> Path:
+        return self.store.put(self._key(key), self.name, data)
+
+    def get_or_create(self, key: str, produce: Callable[[], bytes]) -> Path:
+        """
+        Devuelve la ruta del archivo cacheado para key, generándolo con
+        produce() si no existe. Dentro de un proceso, peticiones simultáneas
+        de la misma clave comparten una sola generación (single-flight); entre
+        procesos, como mucho se genera dos veces y gana la última escritura.
+        """
+        path = self.store.lookup(self._key(key))
+        if path is not None:
+            self._count(True)
+            return path
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            path = self.put(key, produce())
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def sizes(self) -> list[tuple[str, int]]:
+        """(clave, bytes) de cada archivo del espacio."""
+        prefix = len(self.name) + 1
+        return [(key[prefix:], size) for key, size in self.store.sizes(self.name)]
+
+    def stats(self) -> dict:
+        files, total = self.store.totals(self.name)
+        with self._lock:
+            return {
+                "files": files,
+                "bytes": total,
+                "max_bytes": self.store.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def read_cached(get_path: Callable[[], Path]) -> bytes:
+    """
+    Bytes de un archivo de la caché compartida que devuelve get_path (y que
+    genera si no existe). Si otro worker lo expulsa entre la búsqueda y la
+    lectura, se pide otra vez y get_path lo regenera.
+    """
+    try:
+        return Path(get_path()).read_bytes()
+    except FileNotFoundError:
+        return Path(get_path()).read_bytes()
+
+
+shared_cache = SharedCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_TOUCH_INTERVAL, CACHE_MAPPED_FILES)
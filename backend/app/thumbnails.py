@@ -0,0 +1,125 @@
+import hashlib
+import json
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from . import models
+from .config import CACHE_DIR, COVER_WIDTH, THUMBNAIL_WIDTH, THUMBNAIL_WORKERS
+from .database import SessionLocal
+from .page_index import PageIndex, get_page_index
+from .renditions import CONTENT_PREFIX, RenditionParams, get_page_rendition, rendition_cache
+from .shared_cache import read_cached
+
+
+COVER_PARAMS = RenditionParams(COVER_WIDTH, "webp", 80)
+THUMBNAIL_PARAMS = RenditionParams(THUMBNAIL_WIDTH, "webp", 60)
+
+# Formato del paquete de miniaturas (una sola petición para toda la tira):
+#   b"CVTP" + uint32 big-endian con la longitud del manifiesto
+#   + manifiesto JSON {"media_type", "width", "pages": [[offset, length, w, h], ...]}
+#   + las imágenes concatenadas (offsets relativos al final del manifiesto)
+THUMBPACK_MAGIC = b"CVTP"
+THUMBPACK_MEDIA_TYPE = "application/vnd.comicviewer.thumbpack"
+
+# Portadas en segundo plano; las miniaturas bajo demanda van en otro pool para
+# no quedar detrás de la cola de portadas de un escaneo grande
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="covers")
+_on_demand = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+_scheduled: set[int] = set()
+_scheduled_lock = threading.Lock()
+
+
+def generate_cover(comic_id: int) -> Path | None:
+    """
+    Genera la portada (primera página reducida) y la guarda en cover_path,
+    relativa a CACHE_DIR. Es una rendition más: los cómics que empiezan por la
+    misma página comparten portada.
+    """
+    db = SessionLocal()
+    try:
+        comic = db.get(models.Comic, comic_id)
+        if comic is None:
+            return None
+        index = get_page_index(db, comic)
+        if not index.pages:
+            return None
+        path = get_page_rendition(index, index.pages[0], COVER_PARAMS)
+        comic.cover_path = path.relative_to(CACHE_DIR).as_posix()
+        db.commit()
+        return path
+    finally:
+        db.close()
+
+
+def _cover_job(comic_id: int):
+    try:
+        generate_cover(comic_id)
+    except Exception as e:
+        print(f"⚠️  No se pudo generar la portada del cómic {comic_id}: {e}")
+    finally:
+        with _scheduled_lock:
+            _scheduled.discard(comic_id)
+
+
+def schedule_covers(comic_ids):
+    """Encola la generación de portadas en el pool de miniaturas."""
+    for comic_id in comic_ids:
+        with _scheduled_lock:
+            if comic_id in _scheduled:
+                continue
+            _scheduled.add(comic_id)
+        _executor.submit(_cover_job, comic_id)
+
+
+def schedule_missing_covers():
+    db = SessionLocal()
+    try:
+        ids = [comic_id for (comic_id,) in db.query(models.Comic.id).filter(models.Comic.cover_path.is_(None))]
+    finally:
+        db.close()
+    schedule_covers(ids)
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _on_demand.shutdown(wait=False, cancel_futures=True)
+
+
+def _thumbnail(index: PageIndex, number: int) -> tuple[bytes, int, int]:
+    # Una sola lectura del archivo cacheado, que otro worker puede expulsar
+    # en cualquier momento: las dimensiones salen de esos mismos bytes
+    data = read_cached(lambda: get_page_rendition(index, index.pages[number], THUMBNAIL_PARAMS))
+    with Image.open(BytesIO(data)) as img:
+        return data, img.width, img.height
+
+
+def build_thumbpack(index: PageIndex) -> bytes:
+    # Cada miniatura queda también en la caché de renditions (?width=THUMBNAIL_WIDTH)
+    thumbs = list(_on_demand.map(lambda number: _thumbnail(index, number), range(len(index.pages))))
+    pages = []
+    offset = 0
+    for data, width, height in thumbs:
+        pages.append([offset, len(data), width, height])
+        offset += len(data)
+    manifest = json.dumps({
+        "media_type": THUMBNAIL_PARAMS.media_type,
+        "width": THUMBNAIL_PARAMS.width,
+        "pages": pages,
+    }, separators=(",", ":")).encode()
+    return b"".join([THUMBPACK_MAGIC, struct.pack(">I", len(manifest)), manifest] + [data for data, _, _ in thumbs])
+
+
+def get_thumbpack(index: PageIndex) -> Path:
+    # Por contenido: dos archivos con las mismas páginas comparten paquete
+    if index.pages and all(page.content_hash for page in index.pages):
+        digest = hashlib.blake2b("".join(page.content_hash for page in index.pages).encode(),
+                                 digest_size=16).hexdigest()
+        key = f"{CONTENT_PREFIX}/thumbs/{digest}-w{THUMBNAIL_PARAMS.width}.pack"
+    else:
+        key = f"{index.comic_id}/thumbs-{index.file_size:x}-{index.file_mtime:x}-w{THUMBNAIL_PARAMS.width}.pack"
+    return rendition_cache.get_or_create(key, lambda: build_thumbpack(index))
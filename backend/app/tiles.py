@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from PIL import Image
+
+from .config import TILE_HEIGHT, TILE_STRIP_CACHE_BYTES
+from .metrics import stage
+from .page_index import PageIndex
+from .renditions import RenditionParams, content_key, decode_scaled, encode_image, rendition_cache
+from .utils import PageEntry, read_page_entry
+
+
+def target_width(entry: PageEntry, params: RenditionParams) -> int:
+    # Igual que en las renditions: solo se reduce, nunca se amplía
+    return min(params.width, entry.width) if entry.width else params.width
+
+
+def strip_size(entry: PageEntry, width: int) -> tuple[int, int]:
+    if entry.width <= width:
+        return entry.width, entry.height
+    return width, max(1, round(entry.height * width / entry.width))
+
+
+class StripCache:
+    """
+    Caché LRU en memoria de tiras ya decodificadas (y reducidas al ancho
+    pedido), acotada por el tamaño de los píxeles. Así, pedir el tile k de una
+    tira de 20000 px no vuelve a decodificar la imagen entera.
+
+    Decodificaciones simultáneas de la misma tira se comparten (single-flight).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._strips: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._inflight: dict[tuple, Future] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(img: Image.Image) -> int:
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, index: PageIndex, entry: PageEntry, width: int) -> Image.Image:
+        key = (content_key(index, entry), width)
+        with self._lock:
+            img = self._strips.get(key)
+            if img is not None:
+                self._strips.move_to_end(key)
+                self.hits += 1
+                return img
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            data = read_page_entry(index, entry).getvalue()
+            with stage("transcode"):
+                img = decode_scaled(data, width)
+            size = self._size(img)
+            with self._lock:
+                # Una tira mayor que toda la caché se usa y se descarta
+                if size <= self.max_bytes:
+                    self._strips[key] = img
+                    self._total += size
+                    while self._total > self.max_bytes:
+                        _, oldest = self._strips.popitem(last=False)
+                        self._total -= self._size(oldest)
+                        self.evictions += 1
+            future.set_result(img)
+            return img
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "strips": len(self._strips),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+strip_cache = StripCache(TILE_STRIP_CACHE_BYTES)
+
+
+def tile_layout(index: PageIndex, entry: PageEntry, params: RenditionParams) -> dict:
+    """
+    Dimensiones de la tira al ancho pedido y sus tiles de TILE_HEIGHT px (el
+    último puede ser más bajo). Sale del índice, sin decodificar nada, salvo
+    que no se conozcan las dimensiones de la página.
+    """
+    width = target_width(entry, params)
+    if entry.width and entry.height:
+        width, height = strip_size(entry, width)
+    else:
+        img = strip_cache.get(index, entry, width)
+        width, height = img.size
+    count = -(-height // TILE_HEIGHT)
+    return {
+        "page": entry.number,
+        "width": width,
+        "height": height,
+        "source_width": entry.width,
+        "source_height": entry.height,
+        "format": params.format,
+        "tile_height": TILE_HEIGHT,
+        "tiles": [
+            {"index": k, "y": k * TILE_HEIGHT, "height": min(TILE_HEIGHT, height - k * TILE_HEIGHT)}
+            for k in range(count)
+        ],
+    }
+
+
+def check_tile(entry: PageEntry, params: RenditionParams, tile: int):
+    """
+    Comprueba con las dimensiones del índice que el tile existe, antes de
+    decodificar una tira que puede medir decenas de miles de píxeles. Sin
+    dimensiones conocidas lo comprueba render_tile.
+
+    Raises:
+        IndexError: si el tile no existe
+    """
+    if tile < 0:
+        raise IndexError(f"Tile {tile} fuera de rango")
+    if entry.width and entry.height:
+        _, height = strip_size(entry, target_width(entry, params))
+        if tile >= -(-height // TILE_HEIGHT):
+            raise IndexError(f"Tile {tile} fuera de rango")
+
+
+def render_tile(index: PageIndex, entry: PageEntry, params: RenditionParams, tile: int) -> bytes:
+    """
+    Raises:
+        IndexError: si el tile no existe
+    """
+    check_tile(entry, params, tile)
+    img = strip_cache.get(index, entry, target_width(entry, params))
+    top = tile * TILE_HEIGHT
+    if tile < 0 or top >= img.height:
+        raise IndexError(f"Tile {tile} fuera de rango")
+    with stage("transcode"), img.crop((0, top, img.width, min(img.height, top + TILE_HEIGHT))) as part:
+        return encode_image(part, params)
+
+
+def get_page_tile(index: PageIndex, entry: PageEntry, params: RenditionParams, tile: int) -> Path:
+    """Tile cacheado en disco junto a las renditions (misma clave de contenido y mismo límite)."""
+    check_tile(entry, params, tile)
+    key = f"{content_key(index, entry)}-t{TILE_HEIGHT}-{tile}-{params.suffix()}"
+    return rendition_cache.get_or_create(key, lambda: render_tile(index, entry, params, tile))
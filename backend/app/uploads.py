@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from .config import UPLOAD_MAX_BYTES
+from .utils import COMICS_DIR
+
+
+UPLOAD_FIELD = "file"
+UPLOAD_TEMP_PREFIX = ".upload-"
+
+
+@dataclass
+class ReceivedUpload:
+    filename: str
+    temp_path: str
+    size: int
+    sha256: str
+
+    def discard(self):
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class _FilePart:
+    """Estado del campo de archivo mientras llega el cuerpo multipart."""
+
+    def __init__(self):
+        self.headers: dict[bytes, bytes] = {}
+        self.field_name = ""
+        self.filename = None
+        self.is_target = False
+        self.header_name = b""
+        self.header_value = b""
+
+
+async def receive_upload(request: Request, max_bytes: int = UPLOAD_MAX_BYTES) -> ReceivedUpload:
+    """
+    Recibe un multipart/form-data escribiendo el campo "file" por bloques en un
+    temporal dentro de la carpeta de cómics (mismo sistema de archivos, para
+    poder renombrarlo de forma atómica), calculando el SHA-256 y el tamaño al
+    vuelo. La memoria usada no depende del tamaño del archivo.
+
+    Raises:
+        HTTPException 400 si el cuerpo no es un multipart con un archivo
+        HTTPException 413 si se supera max_bytes
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(400, "Se esperaba multipart/form-data")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        raise HTTPException(413, "Archivo demasiado grande")
+
+    part = _FilePart()
+    pending: list[bytes] = []
+    found: list[_FilePart] = []
+
+    def on_part_begin():
+        nonlocal part
+        part = _FilePart()
+
+    def on_header_field(data, start, end):
+        part.header_name += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.header_value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.header_name.lower()] = part.header_value
+        part.header_name = b""
+        part.header_value = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part.headers.get(b"content-disposition", b""))
+        part.field_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in disposition:
+            part.filename = disposition[b"filename"].decode("utf-8", "replace")
+        part.is_target = part.field_name == UPLOAD_FIELD and part.filename is not None and not found
+        if part.is_target:
+            found.append(part)
+
+    def on_part_data(data, start, end):
+        if part.is_target:
+            pending.append(data[start:end])
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+
+    fd, temp_path = await run_in_threadpool(
+        tempfile.mkstemp, prefix=UPLOAD_TEMP_PREFIX, suffix=".part", dir=COMICS_DIR
+    )
+    out = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if not pending:
+                continue
+            data = b"".join(pending)
+            pending.clear()
+            size += len(data)
+            if size > max_bytes:
+                raise HTTPException(413, "Archivo demasiado grande")
+            digest.update(data)
+            await run_in_threadpool(out.write, data)
+        parser.finalize()
+        await run_in_threadpool(out.close)
+    except BaseException:
+        out.close()
+        os.unlink(temp_path)
+        raise
+
+    if not found:
+        os.unlink(temp_path)
+        raise HTTPException(400, f"Falta el campo '{UPLOAD_FIELD}'")
+    filename = os.path.basename(found[0].filename.replace("\\", "/"))
+    return ReceivedUpload(filename, temp_path, size, digest.hexdigest())
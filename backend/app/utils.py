@@ -1,25 +1,331 @@
 import zipfile
+import hashlib
+import mimetypes
 import os
+import shutil
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
 from PIL import Image
 from io import BytesIO
-from typing import Optional
+from typing import NamedTuple, Optional
 
+from .archive_pool import archive_pool
+from .archives import (ARCHIVE_EXTENSIONS, EXTERNAL, EXTRACTED_MARKER, IMAGE_EXTENSIONS,
+                       ArchiveError, is_page_name, natural_key, open_archive, read_external)
+from .config import CACHE_DIR, COMICS_DIR as _COMICS_DIR, PAGE_CONTENT_HASH
+from .metrics import stage
 
-COMICS_DIR = os.path.join(os.path.dirname(__file__), "../../comics")
+
+COMICS_DIR = str(_COMICS_DIR)
 os.makedirs(COMICS_DIR, exist_ok=True)
-SUPPORTED_ZIP_FORMATS=set({'cbr', 'cbz', 'pdf', 'zip', 'rar'})
+SUPPORTED_ZIP_FORMATS = {extension.lstrip(".") for extension in ARCHIVE_EXTENSIONS}
+
+# Hash de contenido de cada página (clave de las cachés derivadas, compartidas
+# entre cómics) y de cada archivo (subidas duplicadas)
+PAGE_HASH_BYTES = 16
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Archivos sólidos (RAR sólido, tar comprimido) extraídos una vez
+EXTRACTED_DIR = CACHE_DIR / "extracted"
+
+# Bytes del principio de cada imagen que se leen al indexar para sacar su
+# formato y dimensiones; si la cabecera no cabe (EXIF grande) se lee entera
+PAGE_HEADER_BYTES = 16 * 1024
+
+
+@dataclass(frozen=True)
+class PageEntry:
+    """
+    Página de un cómic con lo necesario para leerla directamente del archivo,
+    sin volver a parsear el directorio central.
+    """
+    number: int
+    name: str
+    header_offset: int
+    data_offset: int
+    compress_size: int
+    file_size: int
+    compress_type: int
+    crc: int
+    media_type: str
+    width: int = 0
+    height: int = 0
+    is_spread: bool = False
+    content_hash: str = ""  # BLAKE2b de los bytes de la imagen (PAGE_HASH_BYTES)
+
+
+@dataclass(frozen=True)
+class ArchiveScan:
+    """Resultado de indexar un cómic: formato y páginas en orden de lectura."""
+    format: str
+    extracted: bool
+    pages: list[PageEntry]
+    content_hash: str | None = None  # SHA-256 del archivo, si se calculó
+
+
+class FolderStat(NamedTuple):
+    """Huella de una carpeta de imágenes, con los mismos campos que os.stat_result."""
+    st_size: int
+    st_mtime_ns: int
+
+
+def comic_path(filename: str) -> str:
+    return os.path.join(COMICS_DIR, filename)
+
+def stat_comic(path: str):
+    """
+    os.stat del archivo; para una carpeta de imágenes, la suma de los tamaños
+    y el mtime más reciente, para detectar imágenes añadidas o cambiadas.
+    """
+    st = os.stat(path)
+    if not os.path.isdir(path):
+        return st
+    size, mtime = 0, st.st_mtime_ns
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for filename in files:
+            if is_page_name(filename):
+                file_st = os.stat(os.path.join(root, filename))
+                size += file_st.st_size
+                mtime = max(mtime, file_st.st_mtime_ns)
+    return FolderStat(size, mtime)
+
+def extraction_dir(path: str, file_size: int, file_mtime: int) -> Path:
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return EXTRACTED_DIR / f"{key}-{file_size:x}-{file_mtime:x}"
+
+def page_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=PAGE_HASH_BYTES).hexdigest()
+
+def file_sha256(path: str) -> str:
+    """SHA-256 de un archivo, el mismo que se calcula al recibir una subida."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def sniff_media_type(head: bytes, name: str) -> str:
+    """Tipo MIME a partir de los primeros bytes; si no se reconoce, por la extensión."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+def _image_size(data: bytes) -> tuple[int, int] | None:
+    try:
+        with Image.open(BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
 
 def save_comic_file(file_content: bytes, filename: str) -> str:
-    filepath = os.path.join(COMICS_DIR, filename)
+    filepath = comic_path(filename)
     with open(filepath, "wb") as f:
         f.write(file_content)
     return filepath
 
 def extract_pages_list(filepath: str):
-    with zipfile.ZipFile(filepath) as z:
-        files = [f for f in z.namelist() if not f.startswith("__MACOSX") and f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))]
-        files.sort()  # orden natural
-        return files
+    return [entry.name for entry in scan_pages(filepath).pages]
+
+def scan_pages(filepath: str, extract_dir: str | None = None, file_hash: bool = False) -> ArchiveScan:
+    """
+    Indexa un cómic en cualquiera de los formatos de archives.open_archive:
+    offsets de cada página, formato y dimensiones (de los primeros
+    PAGE_HEADER_BYTES: Pillow solo lee la cabecera de la imagen) y hash de
+    contenido.
+
+    Con PAGE_CONTENT_HASH cada página se recorre entera, por bloques, para su
+    hash (y el CRC, que en ZIP se comprueba y en el resto de formatos se
+    calcula); sin él solo se leen las cabeceras.
+
+    Con file_hash también se calcula el SHA-256 del archivo (content_hash del
+    ArchiveScan) en la misma lectura secuencial que los hashes de las páginas:
+    ver _hash_archive.
+
+    Args:
+        filepath: Ruta al archivo o a la carpeta
+        extract_dir: Dónde extraer los archivos sólidos (None: temporal)
+        file_hash: Calcular también el hash del archivo entero
+
+    Returns:
+        ArchiveScan con las páginas en orden de lectura (orden natural de los nombres)
+    """
+    with stage("archive_open"):
+        reader = open_archive(filepath, extract_dir)
+    with reader:
+        pages = []
+        archive_hash, page_hashes = None, {}
+        if file_hash and reader.format != "dir":
+            archive_hash, page_hashes = _hash_archive(reader)
+        for number, member in enumerate(reader.members):
+            head = reader.read_prefix(number, PAGE_HEADER_BYTES)
+            media_type = sniff_media_type(head[:16], member.name)
+            size = _image_size(head)
+            if size is None and member.file_size > len(head):
+                size = _image_size(reader.read(number))
+            width, height = size or (0, 0)
+            crc, content_hash = member.crc, ""
+            if number in page_hashes:
+                crc, content_hash = page_hashes[number]
+            elif PAGE_CONTENT_HASH or crc is None:
+                crc, content_hash = _hash_page(reader, number)
+            pages.append(PageEntry(
+                number=number,
+                name=member.name,
+                header_offset=member.header_offset,
+                data_offset=member.data_offset,
+                compress_size=member.compress_size,
+                file_size=member.file_size,
+                compress_type=member.compress_type,
+                crc=crc,
+                media_type=media_type,
+                width=width,
+                height=height,
+                # Página apaisada: en doble página ocupa el pliego entero
+                is_spread=width > height > 0,
+                content_hash=content_hash if PAGE_CONTENT_HASH else "",
+            ))
+        if extract_dir is not None and reader.extracted:
+            _drop_stale_extractions(Path(extract_dir))
+        return ArchiveScan(reader.format, reader.extracted, pages, archive_hash)
+
+class _PageDigest:
+    """CRC-32 y hash de contenido de una página que llega por trozos."""
+
+    def __init__(self, reader, number: int):
+        self.reader = reader
+        self.number = number
+        self.member = member = reader.members[number]
+        self.start = member.data_offset
+        self.end = member.data_offset + member.compress_size
+        self.inflate = zlib.decompressobj(-15) if member.compress_type == zipfile.ZIP_DEFLATED else None
+        self.digest = hashlib.blake2b(digest_size=PAGE_HASH_BYTES)
+        self.crc = 0
+
+    def update(self, data: bytes, compressed: bool = True):
+        if compressed and self.inflate is not None:
+            try:
+                data = self.inflate.decompress(data)
+            except zlib.error as e:
+                raise ArchiveError(f"Error al descomprimir '{self.member.name}' en {self.reader.path}") from e
+        self.digest.update(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+    def result(self) -> tuple[int, str]:
+        if self.inflate is not None:
+            self.update(self.inflate.flush(), compressed=False)
+        if self.member.crc is not None and self.crc != self.member.crc:
+            raise ArchiveError(f"CRC incorrecto para '{self.member.name}' en {self.reader.path}")
+        return self.crc, self.digest.hexdigest()
+
+def _hash_page(reader, number: int) -> tuple[int, str]:
+    """(CRC-32, hash de contenido) de una página, leída por bloques."""
+    page = _PageDigest(reader, number)
+    for chunk in reader.iter_chunks(number, HASH_CHUNK_BYTES):
+        page.update(chunk, compressed=False)
+    return page.result()
+
+def _hash_archive(reader) -> tuple[str, dict[int, tuple[int, str]]]:
+    """
+    SHA-256 del archivo y (CRC-32, hash de contenido) de sus páginas leyendo
+    el archivo una sola vez, de principio a fin: las páginas guardadas o en
+    deflate se hashean según pasan sus bytes. Las que no están dentro del
+    archivo tal cual (RAR, extraídas) no van en el resultado.
+    """
+    regions, end = [], 0
+    for number in sorted(range(len(reader.members)), key=lambda n: reader.members[n].data_offset):
+        member = reader.members[number]
+        if (member.source == reader.path and member.data_offset >= end
+                and member.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)):
+            regions.append(_PageDigest(reader, number))
+            end = member.data_offset + member.compress_size
+
+    digest = hashlib.sha256()
+    pending = iter(regions)
+    page = next(pending, None)
+    offset = 0
+    with open(reader.path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+            chunk_end = offset + len(chunk)
+            while page is not None and page.start < chunk_end:
+                page.update(chunk[max(page.start - offset, 0):page.end - offset])
+                if page.end > chunk_end:
+                    break
+                page = next(pending, None)
+            offset = chunk_end
+    if page is not None:
+        raise ArchiveError(f"Datos truncados en {reader.path}")
+    return digest.hexdigest(), {page.number: page.result() for page in regions}
+
+def _drop_stale_extractions(folder: Path):
+    # Extracciones de versiones anteriores del mismo archivo (misma ruta)
+    prefix = folder.name.split("-", 1)[0]
+    for stale in folder.parent.glob(f"{prefix}-*"):
+        if stale != folder:
+            shutil.rmtree(stale, ignore_errors=True)
+
+_extract_lock = threading.Lock()
+
+def ensure_extracted(index) -> Path:
+    """
+    Carpeta con el archivo sólido ya extraído; se vuelve a extraer si se
+    borró. Al extraer se eliminan las extracciones de versiones anteriores.
+    """
+    folder = extraction_dir(index.path, index.file_size, index.file_mtime)
+    if (folder / EXTRACTED_MARKER).exists():
+        return folder
+    with _extract_lock:
+        if not (folder / EXTRACTED_MARKER).exists():
+            open_archive(index.path, str(folder)).close()
+            _drop_stale_extractions(folder)
+    return folder
+
+def read_page_entry(index, entry: PageEntry) -> BytesIO:
+    """
+    Lee una página usando los offsets del índice y un descriptor del pool, sin
+    abrir el archivo con zipfile. Solo los métodos poco comunes (bzip2, lzma)
+    pasan por zipfile, y los RAR no sólidos por la herramienta externa.
+    """
+    with stage("read"):
+        return _read_page_entry(index, entry)
+
+def _read_page_entry(index, entry: PageEntry) -> BytesIO:
+    filepath = index.source(entry)
+    if entry.compress_type == EXTERNAL:
+        image_data = read_external(filepath, entry.name)
+    else:
+        if index.extracted:
+            ensure_extracted(index)
+        # Se lee la versión indexada aunque el archivo se reemplace mientras tanto
+        fingerprint = (index.file_size, index.file_mtime) if filepath == index.path else None
+        with archive_pool.acquire(filepath, fingerprint) as handle:
+            if entry.compress_type == zipfile.ZIP_STORED or entry.compress_type == zipfile.ZIP_DEFLATED:
+                raw = handle.pread(entry.compress_size, entry.data_offset)
+                if len(raw) != entry.compress_size:
+                    raise zipfile.BadZipFile(f"Datos truncados para '{entry.name}' en {filepath}")
+                try:
+                    image_data = raw if entry.compress_type == zipfile.ZIP_STORED else zlib.decompress(raw, -15)
+                except zlib.error as e:
+                    raise zipfile.BadZipFile(f"Error al descomprimir '{entry.name}' en {filepath}") from e
+            else:
+                image_data = handle.read_member(entry.name)
+
+    if zlib.crc32(image_data) != entry.crc:
+        raise zipfile.BadZipFile(f"CRC incorrecto para '{entry.name}' en {filepath}")
+    if not image_data:
+        raise ValueError(f"El archivo '{entry.name}' está vacío")
+    return BytesIO(image_data)
 
 #def get_page_image(filepath: str, page_name: str) -> BytesIO:
 #    with zipfile.ZipFile(filepath) as z:
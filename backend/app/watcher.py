@@ -0,0 +1,330 @@
+"""
+Sincronización de la biblioteca al vuelo: los cómics que se copian, cambian,
+mueven o borran en COMICS_DIR se aplican al catálogo sin reiniciar ni llamar
+a /scan.
+
+- inotify (Linux, con ctypes, sin dependencias): un watch por carpeta; las
+  carpetas nuevas se vigilan al aparecer.
+- Sondeo (resto de sistemas, o si se agota fs.inotify.max_user_watches):
+  list_library cada WATCH_POLL_INTERVAL segundos y diferencia con la anterior.
+
+Los eventos se traducen a rutas de cómic (el archivo, o la carpeta si es una
+imagen suelta) y se agrupan hasta que cada ruta lleva WATCH_DEBOUNCE_SECONDS
+sin eventos: una copia larga es un solo cambio. Luego LibraryScanner.sync()
+añade, actualiza, renombra (misma huella) o elimina. Si la cola de inotify se
+desborda se lanza un escaneo completo.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import posixpath
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .archives import is_page_name
+from .config import COMICS_DIR, LIBRARY_WATCH, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL
+from .scanner import SCAN_EXTENSIONS, library_scanner, list_library
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+# struct inotify_event: wd, mask, cookie, len (+ nombre de len bytes)
+EVENT = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+def comic_scope(relative: str, is_dir: bool) -> str | None:
+    """
+    Ruta de cómic (o carpeta de cómics) afectada por un evento sobre relative;
+    None si no afecta a ninguno (ocultos, temporales de subidas, otros archivos).
+    """
+    if not relative or any(part.startswith(".") for part in relative.split("/")):
+        return None
+    if is_dir or relative.lower().endswith(SCAN_EXTENSIONS):
+        return relative
+    if is_page_name(relative):
+        # Imagen suelta: el cómic es su carpeta (las imágenes en la raíz no son cómics)
+        return posixpath.dirname(relative) or None
+    return None
+
+
+def _parents(relative: str):
+    while "/" in relative:
+        relative = relative.rsplit("/", 1)[0]
+        yield relative
+
+
+class InotifyBackend:
+    """Eventos de inotify leídos con ctypes; poll() devuelve las rutas de cómic tocadas."""
+
+    name = "inotify"
+
+    def __init__(self, root: Path):
+        self.root = str(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._paths: dict[int, str] = {}  # wd -> carpeta relativa ("" es la raíz)
+        try:
+            self.watch_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    @property
+    def watches(self) -> int:
+        return len(self._paths)
+
+    def describe(self) -> str:
+        return f"inotify, {self.watches} carpetas"
+
+    def watch_tree(self, relative: str):
+        """Vigila una carpeta y todas sus subcarpetas (no ocultas)."""
+        top = os.path.join(self.root, relative) if relative else self.root
+        for dirpath, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            current = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            self._add_watch("" if current == "." else current)
+
+    def _add_watch(self, relative: str):
+        path = os.path.join(self.root, relative) if relative else self.root
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code in (errno.ENOENT, errno.ENOTDIR):
+                return  # Borrada mientras se recorría
+            raise OSError(code, f"inotify_add_watch {path}: {os.strerror(code)}")
+        # Re-vigilar una carpeta movida devuelve el mismo wd con la ruta nueva
+        self._paths[wd] = relative
+
+    def poll(self, timeout: float) -> list[str] | None:
+        """Rutas de cómic con eventos; None si se perdieron eventos (hay que escanear todo)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        scopes = []
+        overflow = False
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            directory = self._paths.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # La carpeta vigilada ya no existe (o se movió fuera)
+                self._paths.pop(wd, None)
+                continue
+            if not name:
+                # Eventos sobre la propia carpeta: los cubre el de su carpeta padre
+                continue
+            relative = posixpath.join(directory, os.fsdecode(name)) if directory else os.fsdecode(name)
+            is_dir = bool(mask & IN_ISDIR)
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO) and not relative.rsplit("/", 1)[-1].startswith("."):
+                try:
+                    self.watch_tree(relative)
+                except OSError as e:
+                    print(f"⚠️  No se puede vigilar {relative}: {e}")
+            scope = comic_scope(relative, is_dir)
+            if scope is not None:
+                scopes.append(scope)
+        return None if overflow else scopes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingBackend:
+    """Sondeo periódico de la biblioteca, para cuando no hay inotify."""
+
+    name = "poll"
+
+    def __init__(self, root: Path, interval: float):
+        self.root = root
+        self.interval = interval
+        self._snapshot = list_library(root)
+        self._next = time.monotonic() + interval
+
+    @property
+    def watches(self) -> int:
+        return 0
+
+    def describe(self) -> str:
+        return f"sondeo cada {self.interval:g}s"
+
+    def poll(self, timeout: float) -> list[str] | None:
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self._next = time.monotonic() + self.interval
+        current = list_library(self.root)
+        changed = [
+            relative for relative in current.keys() | self._snapshot.keys()
+            if current.get(relative) != self._snapshot.get(relative)
+        ]
+        self._snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class LibraryWatcher:
+    """
+    Hilo que recibe los eventos del backend, los agrupa por ruta y, pasado el
+    debounce, los aplica con library_scanner.sync().
+    """
+
+    # Cada cuánto se revisan las rutas pendientes aunque no lleguen eventos
+    TICK_SECONDS = 0.25
+
+    def __init__(self, root: Path, mode: str, debounce: float, poll_interval: float):
+        self.root = Path(root)
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._backend = None
+        self._pending: dict[str, float] = {}  # ruta -> último evento (monotonic)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.events = 0
+        self.syncs = 0
+        self.overflows = 0
+        self.errors = 0
+        self.added = 0
+        self.updated = 0
+        self.renamed = 0
+        self.removed = 0
+
+    def _open_backend(self):
+        if self.mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                return InotifyBackend(self.root)
+            except OSError as e:
+                print(f"⚠️  inotify no disponible ({e}); se sondea cada {self.poll_interval:g}s")
+        elif self.mode == "inotify":
+            print(f"⚠️  inotify solo existe en Linux; se sondea cada {self.poll_interval:g}s")
+        return PollingBackend(self.root, self.poll_interval)
+
+    def start(self) -> bool:
+        """Empieza a vigilar en segundo plano. False si está desactivado o no hay biblioteca."""
+        if self.mode == "off" or self._thread is not None:
+            return False
+        if not self.root.exists():
+            print("⚠️  Carpeta /comics no existe - no se vigilan cambios")
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="library-watch", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        try:
+            self._backend = self._open_backend()
+        except OSError as e:
+            print(f"⚠️  No se puede vigilar la biblioteca: {e}")
+            return
+        print(f"👀 Vigilando la biblioteca ({self._backend.describe()})")
+        try:
+            while not self._stop.is_set():
+                scopes = self._backend.poll(self.TICK_SECONDS)
+                now = time.monotonic()
+                with self._lock:
+                    if scopes is None:
+                        self.overflows += 1
+                    else:
+                        self.events += len(scopes)
+                        for scope in scopes:
+                            self._pending[scope] = now
+                    due = [scope for scope, last in self._pending.items() if now - last >= self.debounce]
+                    for scope in due:
+                        del self._pending[scope]
+                if scopes is None:
+                    print("⚠️  Cola de eventos desbordada; escaneo completo")
+                    library_scanner.start()
+                if due:
+                    self._sync(due)
+        finally:
+            self._backend.close()
+
+    def _sync(self, scopes: list[str]):
+        # Una carpeta incluye lo que hay dentro: no hace falta sincronizar ambas
+        unique = set(scopes)
+        scopes = sorted(
+            scope for scope in unique
+            if not any(parent in unique for parent in _parents(scope))
+        )
+        try:
+            status = library_scanner.sync(scopes)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️  Error al sincronizar {', '.join(scopes[:5])}: {e}")
+            return
+        with self._lock:
+            self.syncs += 1
+            self.added += status.added
+            self.updated += status.updated
+            self.renamed += status.renamed
+            self.removed += status.removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self._backend.name if self._backend is not None else "off",
+                "watches": self._backend.watches if self._backend is not None else 0,
+                "pending": len(self._pending),
+                "events": self.events,
+                "syncs": self.syncs,
+                "overflows": self.overflows,
+                "errors": self.errors,
+                "added": self.added,
+                "updated": self.updated,
+                "renamed": self.renamed,
+                "removed": self.removed,
+            }
+
+
+library_watcher = LibraryWatcher(COMICS_DIR, LIBRARY_WATCH, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL)
@@ -0,0 +1,11 @@
+"""
+Benchmarks de rendimiento reproducibles.
+
+    cd backend
+    python -m benchmarks --archives 50 --pages 30 -o resultados.json
+
+Genera una biblioteca sintética determinista (library.py), arranca la
+aplicación en el mismo proceso y mide lectura de páginas (secuencial y
+aleatoria), listado, guardado de progreso, subidas y escaneos en frío y en
+caliente. Requiere httpx (ver benchmarks/requirements.txt).
+"""
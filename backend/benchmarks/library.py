@@ -0,0 +1,117 @@
+"""
+Generador determinista de bibliotecas sintéticas.
+
+Con la misma semilla y los mismos parámetros produce exactamente los mismos
+bytes (contenido de las imágenes, orden de las entradas, fechas dentro del
+ZIP y mtime de los archivos), así que los resultados de dos commits se
+pueden comparar.
+"""
+import io
+import os
+import random
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+
+# Fecha fija dentro del ZIP y mtime fijo en disco
+ZIP_DATE_TIME = (2024, 1, 1, 0, 0, 0)
+FILE_MTIME = 1704067200
+
+PIL_FORMATS = {"jpeg": ("JPEG", "jpg"), "png": ("PNG", "png"), "webp": ("WEBP", "webp")}
+COMPRESSION = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+
+@dataclass(frozen=True)
+class LibrarySpec:
+    archives: int = 20
+    pages: int = 24
+    page_width: int = 800
+    page_height: int = 1200
+    formats: tuple[str, ...] = ("jpeg", "png", "webp")
+    compression: tuple[str, ...] = ("stored", "deflated")
+    # Tiras de webtoon: un archivo por tira, cada página muy alta
+    strips: int = 2
+    strip_pages: int = 3
+    strip_width: int = 800
+    strip_height: int = 20000
+    seed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def render_page(rng: random.Random, width: int, height: int) -> Image.Image:
+    """Imagen con fondo degradado y bloques de color: comprime como una página real."""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12 + height // 400):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(20, width // 2), y0 + rng.randrange(20, min(height, 1200) // 2)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), outline=color, width=6)
+    return img
+
+
+def encode_page(img: Image.Image, fmt: str) -> tuple[bytes, str]:
+    pil_format, extension = PIL_FORMATS[fmt]
+    out = io.BytesIO()
+    if pil_format == "PNG":
+        img.save(out, pil_format, optimize=False)
+    else:
+        img.save(out, pil_format, quality=85)
+    return out.getvalue(), extension
+
+
+def build_archive(rng: random.Random, pages: int, width: int, height: int,
+                  formats: tuple[str, ...], compression: str) -> bytes:
+    """CBZ en memoria con pages imágenes de los formatos dados (rotando)."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as z:
+        for number in range(pages):
+            data, extension = encode_page(render_page(rng, width, height), formats[number % len(formats)])
+            info = zipfile.ZipInfo(f"page{number + 1}.{extension}", ZIP_DATE_TIME)
+            info.compress_type = COMPRESSION[compression]
+            z.writestr(info, data)
+    return out.getvalue()
+
+
+def _write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, (FILE_MTIME, FILE_MTIME))
+
+
+def generate_library(root: Path, spec: LibrarySpec) -> dict:
+    """
+    Genera la biblioteca en root: spec.archives cómics de spec.pages páginas
+    repartidos en series de 10 volúmenes, más spec.strips tiras de webtoon.
+
+    Returns:
+        Resumen con el número de archivos, páginas y bytes generados
+    """
+    root = Path(root)
+    rng = random.Random(spec.seed)
+    files = 0
+    pages = 0
+    total = 0
+    for number in range(spec.archives):
+        series = f"Serie {number // 10 + 1:03d}"
+        compression = spec.compression[number % len(spec.compression)]
+        data = build_archive(rng, spec.pages, spec.page_width, spec.page_height, spec.formats, compression)
+        _write(root / series / f"{series} v{number % 10 + 1:02d}.cbz", data)
+        files += 1
+        pages += spec.pages
+        total += len(data)
+    for number in range(spec.strips):
+        data = build_archive(rng, spec.strip_pages, spec.strip_width, spec.strip_height, ("jpeg",), "stored")
+        _write(root / "Webtoon" / f"Webtoon c{number + 1:03d}.cbz", data)
+        files += 1
+        pages += spec.strip_pages
+        total += len(data)
+    return {"files": files, "total_pages": pages, "bytes": total}
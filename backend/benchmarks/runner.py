@@ -0,0 +1,284 @@
+"""
+Ejecuta los benchmarks contra la aplicación FastAPI real, en el mismo proceso
+(httpx.ASGITransport, sin red), sobre una biblioteca sintética recién generada.
+
+Por cada operación se reportan latencias p50/p95/p99 (ms), throughput
+(operaciones/s) y el pico de memoria residente del proceso hasta ese momento.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .library import LibrarySpec, build_archive, generate_library
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(samples: list[float], errors: int, wall: float) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+        "throughput_per_sec": round(len(samples) / wall, 2) if wall > 0 else 0.0,
+        "wall_seconds": round(wall, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def measure(jobs, concurrency: int) -> dict:
+    """
+    Ejecuta las corrutinas que devuelven los jobs con como mucho concurrency
+    a la vez. Una respuesta HTTP >= 400 o una excepción cuentan como error.
+    """
+    samples: list[float] = []
+    errors = 0
+    pending = iter(jobs)
+
+    async def worker():
+        nonlocal errors
+        for job in pending:
+            t0 = time.perf_counter()
+            try:
+                response = await job()
+                failed = response is not None and response.status_code >= 400
+            except Exception:
+                failed = True
+            samples.append((time.perf_counter() - t0) * 1000)
+            errors += failed
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(samples, errors, time.perf_counter() - t0)
+
+
+def measure_sync(fn, repeats: int) -> dict:
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples, 0, time.perf_counter() - t0)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmarks(args, spec: LibrarySpec) -> dict:
+    # La aplicación se importa aquí: COMICS_DIR, CACHE_DIR y el directorio de
+    # trabajo (comics.db) ya apuntan a la biblioteca sintética
+    import httpx
+
+    from app import models
+    from app.auth import create_access_token
+    from app.database import SessionLocal
+    from app.main import app
+    from app.scanner import library_scanner
+
+    results = {}
+    log = lambda message: print(f"⏱️  {message}", file=sys.stderr)  # noqa: E731
+
+    log("escaneo en frío")
+    results["scan_cold"] = measure_sync(library_scanner.run, 1)
+
+    async with app.router.lifespan_context(app):
+        log("escaneo en caliente")
+        results["scan_warm"] = await asyncio.to_thread(measure_sync, library_scanner.run, args.scan_repeats)
+
+        db = SessionLocal()
+        try:
+            user = models.User(email="benchmark@example.com", hashed_password="!")
+            db.add(user)
+            db.commit()
+            # El token se firma directamente: no se mide el coste de bcrypt
+            headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+        finally:
+            db.close()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            comics = []
+            cursor = None
+            while True:
+                params = {"limit": args.list_limit, **({"cursor": cursor} if cursor else {})}
+                page = (await client.get("/comics", params=params)).json()
+                comics.extend((item["id"], item["pages"]) for item in page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            rng = random.Random(spec.seed)
+
+            log("listado")
+            state = {"cursor": None}
+
+            async def list_page():
+                params = {"limit": args.list_limit}
+                if state["cursor"]:
+                    params["cursor"] = state["cursor"]
+                response = await client.get("/comics", params=params)
+                # Se recorre el listado con su cursor, volviendo al principio al acabar
+                state["cursor"] = response.json().get("next_cursor")
+                return response
+
+            results["listing"] = await measure([list_page] * args.requests, 1)
+
+            log("lectura secuencial de páginas")
+            sequential = [
+                (comic_id, number) for comic_id, pages in comics for number in range(pages)
+            ][:args.requests]
+            results["page_sequential"] = await measure(
+                (lambda c=c, n=n: client.get(f"/comics/{c}/page/{n}") for c, n in sequential), 1
+            )
+
+            log("acceso aleatorio a páginas")
+            random_pages = [
+                (comic_id, rng.randrange(pages))
+                for comic_id, pages in (rng.choice(comics) for _ in range(args.requests))
+            ]
+            results["page_random"] = await measure(
+                (lambda c=c, n=n: client.get(f"/comics/{c}/page/{n}") for c, n in random_pages),
+                args.concurrency,
+            )
+
+            log("guardado de progreso")
+            progress = [
+                (comic_id, rng.randrange(pages))
+                for comic_id, pages in (rng.choice(comics) for _ in range(args.requests))
+            ]
+            results["progress_save"] = await measure(
+                (lambda c=c, n=n: client.post(f"/progress/{c}", json={"current": n}, headers=headers)
+                 for c, n in progress),
+                args.concurrency,
+            )
+
+            log("subidas")
+            uploads = [
+                (f"Upload {number + 1:04d}.cbz",
+                 build_archive(rng, args.upload_pages, spec.page_width, spec.page_height, spec.formats, "stored"))
+                for number in range(args.uploads)
+            ]
+            results["upload"] = await measure(
+                (lambda name=name, data=data: client.post(
+                    "/upload", files={"file": (name, io.BytesIO(data), "application/zip")}
+                ) for name, data in uploads),
+                args.concurrency,
+            )
+
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks de rendimiento sobre una biblioteca sintética (salida JSON)",
+    )
+    defaults = LibrarySpec()
+    parser.add_argument("--archives", type=int, default=defaults.archives, help="cómics a generar")
+    parser.add_argument("--pages", type=int, default=defaults.pages, help="páginas por cómic")
+    parser.add_argument("--strips", type=int, default=defaults.strips, help="cómics webtoon (tiras muy altas)")
+    parser.add_argument("--strip-height", type=int, default=defaults.strip_height)
+    parser.add_argument("--formats", default=",".join(defaults.formats), help="jpeg,png,webp")
+    parser.add_argument("--compression", default=",".join(defaults.compression), help="stored,deflated")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--requests", type=int, default=500, help="peticiones por operación")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--list-limit", type=int, default=50)
+    parser.add_argument("--scan-repeats", type=int, default=5, help="escaneos en caliente")
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--upload-pages", type=int, default=8)
+    parser.add_argument("--workdir", help="carpeta de trabajo (por defecto una temporal)")
+    parser.add_argument("--keep", action="store_true", help="no borrar la carpeta de trabajo")
+    parser.add_argument("--output", "-o", help="archivo JSON de resultados (por defecto, stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec = LibrarySpec(
+        archives=args.archives,
+        pages=args.pages,
+        formats=tuple(args.formats.split(",")),
+        compression=tuple(args.compression.split(",")),
+        strips=args.strips,
+        strip_height=args.strip_height,
+        seed=args.seed,
+    )
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="comicviewer-bench-")).resolve()
+    output = Path(args.output).resolve() if args.output else None
+    workdir.mkdir(parents=True, exist_ok=True)
+    comics_dir = workdir / "comics"
+
+    print(f"📚 Generando biblioteca en {comics_dir}", file=sys.stderr)
+    t0 = time.perf_counter()
+    library = generate_library(comics_dir, spec)
+    library["generate_seconds"] = round(time.perf_counter() - t0, 3)
+
+    os.environ["COMICS_DIR"] = str(comics_dir)
+    os.environ["CACHE_DIR"] = str(workdir / "cache")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # Los print() de la aplicación van a stderr para no mezclarse con el JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run_benchmarks(args, spec))
+    finally:
+        os.chdir(previous_cwd)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "library": {**spec.as_dict(), **library},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output is not None:
+        output.write_text(text + "\n")
+        print(f"✅ Resultados en {output}", file=sys.stderr)
+    else:
+        print(text)
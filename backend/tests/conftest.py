@@ -0,0 +1,86 @@
+"""
+Las pruebas usan una biblioteca, una caché y una base de datos temporales:
+config.py lee COMICS_DIR y CACHE_DIR al importarse y la base es ./comics.db,
+así que se preparan antes de importar la aplicación.
+"""
+import io
+import itertools
+import os
+import tempfile
+import zipfile
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="comicviewer-tests-")
+os.environ["COMICS_DIR"] = os.path.join(WORKDIR, "comics")
+os.environ["CACHE_DIR"] = os.path.join(WORKDIR, "cache")
+os.environ.setdefault("LIBRARY_WATCH", "off")
+os.chdir(WORKDIR)
+
+from PIL import Image  # noqa: E402
+
+from app import main, models  # noqa: E402  (main crea las tablas)
+from app.config import COMICS_DIR  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    # Sin lifespan: ni escaneo, ni watcher, ni hilos de volcado
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_user(db):
+    def make() -> models.User:
+        user = models.User(email=f"user{next(_ids)}@example.com", hashed_password="-")
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_comic(db):
+    def make(pages: int = 10, series: str | None = None, volume: int = 9999) -> models.Comic:
+        n = next(_ids)
+        comic = models.Comic(filename=f"comic-{n}.cbz", title=f"Comic {n}", series=series,
+                             volume=volume, pages=pages)
+        db.add(comic)
+        db.commit()
+        return comic
+    return make
+
+
+@pytest.fixture
+def auth_headers():
+    from app.auth import create_access_token
+
+    def headers(user: models.User) -> dict:
+        return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+    return headers
+
+
+@pytest.fixture
+def comic_file(make_comic):
+    """Cómic de 6 páginas PNG (20x30, de color distinto) con su .cbz en COMICS_DIR."""
+    comic = make_comic(pages=6)
+    os.makedirs(COMICS_DIR, exist_ok=True)
+    with zipfile.ZipFile(os.path.join(COMICS_DIR, comic.filename), "w") as z:
+        for number in range(6):
+            out = io.BytesIO()
+            Image.new("RGB", (20, 30), (number * 40, 0, 0)).save(out, "PNG")
+            z.writestr(f"{number:02}.png", out.getvalue(), zipfile.ZIP_DEFLATED)
+    return comic
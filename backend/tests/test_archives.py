@@ -0,0 +1,168 @@
+import io
+import json
+import os
+import shutil
+import stat
+import struct
+import sys
+import tarfile
+import zlib
+
+import pytest
+from PIL import Image
+
+from app.archives import EXTERNAL, FolderReader, TarReader, open_archive
+from app.config import COMICS_DIR
+
+
+def png(size: tuple[int, int], color=(0, 0, 0)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+def rar4(pages: dict[str, bytes]) -> bytes:
+    """RAR 4 no sólido, sin compresión (método 0x30): lo leen unrar y bsdtar."""
+    def block(kind: int, flags: int, body: bytes) -> bytes:
+        rest = struct.pack("<BHH", kind, flags, 7 + len(body)) + body
+        return struct.pack("<H", zlib.crc32(rest) & 0xFFFF) + rest
+
+    out = b"Rar!\x1a\x07\x00" + block(0x73, 0, bytes(6))
+    for name, data in pages.items():
+        encoded = name.encode()
+        header = struct.pack("<IIBIIBBHI", len(data), len(data), 3, zlib.crc32(data), 0x5A000000,
+                             20, 0x30, len(encoded), 0o100644 << 16) + encoded
+        out += block(0x74, 0x8000, header) + data
+    return out + block(0x7B, 0x4000, b"")
+
+
+@pytest.fixture
+def fake_unrar(tmp_path, monkeypatch):
+    """
+    unrar de mentira (no hay unrar en el entorno de pruebas): "lt" lista las
+    páginas con los tamaños y CRC que se le den y "p" devuelve sus bytes.
+    """
+    def install(pages: dict[str, bytes], sizes: dict[str, int] | None = None) -> str:
+        listing = ["", "Archive: comic.cbr", "Details: RAR 4", ""]
+        for name, data in pages.items():
+            listing += [f"        Name: {name}", "        Type: File",
+                        f"        Size: {(sizes or {}).get(name, len(data))}",
+                        f"       CRC32: {zlib.crc32(data):08X}", ""]
+        (tmp_path / "pages.json").write_text(json.dumps({
+            "listing": "\n".join(listing), "pages": {name: data.hex() for name, data in pages.items()},
+        }))
+        tool = tmp_path / "unrar"
+        tool.write_text(f"""#!{sys.executable}
+import json, sys
+state = json.load(open({str(tmp_path / "pages.json")!r}))
+if sys.argv[1] == "lt":
+    print(state["listing"])
+else:
+    sys.stdout.buffer.write(bytes.fromhex(state["pages"][sys.argv[-1]]))
+""")
+        tool.chmod(tool.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("RAR_TOOL", str(tool))
+        return str(tool)
+    return install
+
+
+def test_rar_page_larger_than_the_archive_is_served(client, make_comic, fake_unrar):
+    # La página se comprime muy bien: su tamaño real supera al del .cbr entero
+    page = png((600, 600))
+    packed = zlib.compress(page)
+    comic = make_comic(pages=1)
+    path = os.path.join(COMICS_DIR, comic.filename)
+    os.makedirs(COMICS_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(rar4({"01.png": packed}))
+    fake_unrar({"01.png": page})
+    assert len(page) > os.path.getsize(path)
+
+    response = client.get(f"/comics/{comic.id}/page/0")
+
+    assert response.status_code == 200
+    assert response.content == page
+
+
+def test_rar_members_are_external(tmp_path, fake_unrar):
+
+    pages = {"10.png": png((8, 8)), "9.png": png((4, 4)), "notas.txt": b"x"}
+    path = tmp_path / "comic.cbr"
+    path.write_bytes(rar4(pages))
+    fake_unrar(pages)
+
+    with open_archive(str(path)) as reader:
+        assert reader.names() == ["9.png", "10.png"]
+        assert [(m.data_offset, m.compress_type, m.crc) for m in reader.members] == [
+            (-1, EXTERNAL, zlib.crc32(pages["9.png"])), (-1, EXTERNAL, zlib.crc32(pages["10.png"]))]
+        assert reader.read(1) == pages["10.png"]
+
+
+def test_tar_members_are_ranges_of_the_file(tmp_path):
+
+    pages = {"p10.png": png((8, 8), (10, 0, 0)), "p2.png": png((4, 4), (20, 0, 0))}
+    path = tmp_path / "comic.cbt"
+    with tarfile.open(path, "w") as tar:
+        for name, data in [*pages.items(), ("ComicInfo.xml", b"<ComicInfo/>")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    raw = path.read_bytes()
+
+    with open_archive(str(path)) as reader:
+        assert isinstance(reader, TarReader)
+        assert reader.names() == ["p2.png", "p10.png"]
+        for number, member in enumerate(reader.members):
+            data = pages[member.name]
+            assert (member.source, member.compress_size, member.file_size) == (str(path), len(data), len(data))
+            assert raw[member.data_offset:member.data_offset + member.compress_size] == data
+            assert reader.read(number) == data
+
+
+def test_compressed_tar_is_extracted(tmp_path):
+
+    data = png((6, 6))
+    path = tmp_path / "comic.cbt"
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo("01.png")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    with open_archive(str(path), str(tmp_path / "extract")) as reader:
+        assert (reader.format, reader.extracted, reader.names()) == ("tar", True, ["01.png"])
+        assert reader.read(0) == data
+
+
+def test_folder_members_are_loose_files(tmp_path):
+
+    folder = tmp_path / "Vol 1"
+    (folder / "cap 2").mkdir(parents=True)
+    (folder / ".ocultas").mkdir()
+    pages = {"01.png": png((5, 5)), "cap 2/10.png": png((6, 6)), "cap 2/9.png": png((7, 7))}
+    for name, data in pages.items():
+        (folder / name).write_bytes(data)
+    (folder / ".ocultas" / "00.png").write_bytes(png((1, 1)))
+    (folder / "notas.txt").write_bytes(b"x")
+
+    with open_archive(str(folder)) as reader:
+        assert isinstance(reader, FolderReader)
+        assert reader.names() == ["01.png", "cap 2/9.png", "cap 2/10.png"]
+        for number, member in enumerate(reader.members):
+            assert member.source == str(folder / member.name)
+            assert (member.data_offset, member.file_size) == (0, len(pages[member.name]))
+            assert reader.read(number) == pages[member.name]
+
+
+def test_rar_without_unrar_is_extracted_with_bsdtar(tmp_path, monkeypatch):
+
+    bsdtar = shutil.which("bsdtar")
+    if bsdtar is None:
+        pytest.skip("sin bsdtar")
+    monkeypatch.setenv("RAR_TOOL", bsdtar)
+    pages = {"2.png": png((3, 3)), "10.png": png((4, 4))}
+    path = tmp_path / "comic.cbr"
+    path.write_bytes(rar4(pages))
+
+    with open_archive(str(path), str(tmp_path / "extract")) as reader:
+        assert (reader.format, reader.extracted, reader.names()) == ("rar", True, ["2.png", "10.png"])
+        assert [reader.read(number) for number in range(2)] == [pages["2.png"], pages["10.png"]]
@@ -0,0 +1,90 @@
+import io
+import os
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.config import COMICS_DIR
+from app.http_cache import cache_headers, is_not_modified, requested_range
+
+ETAG = '"abc123"'
+MTIME_NS = 1_700_000_000 * 1_000_000_000
+
+
+def request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 10)),
+    ("bytes=90-", (90, 100)),
+    ("bytes=95-200", (95, 100)),
+    ("bytes=-10", (90, 100)),
+    ("bytes=-500", (0, 100)),
+    ("bytes=0-0", (0, 1)),
+])
+def test_single_range(header, expected):
+    assert requested_range(request(range=header), ETAG, 100) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-9", "bytes=0-9,20-29", "bytes=abc", "bytes=9-5", "bytes=--5",
+])
+def test_ignored_ranges_send_everything(header):
+    assert requested_range(request(range=header), ETAG, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-160", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as error:
+        requested_range(request(range=header), ETAG, 100)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */100"
+
+
+def test_if_range_needs_strong_match():
+    assert requested_range(request(range="bytes=0-9", if_range=ETAG), ETAG, 100) == (0, 10)
+    assert requested_range(request(range="bytes=0-9", if_range='"old"'), ETAG, 100) is None
+    assert requested_range(request(range="bytes=0-9", if_range=f"W/{ETAG}"), ETAG, 100) is None
+
+
+def test_if_none_match():
+    assert is_not_modified(request(if_none_match=ETAG), ETAG, MTIME_NS)
+    assert is_not_modified(request(if_none_match=f'"x", W/{ETAG}'), ETAG, MTIME_NS)
+    assert is_not_modified(request(if_none_match="*"), ETAG, MTIME_NS)
+    assert not is_not_modified(request(if_none_match='"x"'), ETAG, MTIME_NS)
+
+
+def test_if_modified_since_only_without_if_none_match():
+    date = cache_headers(ETAG, MTIME_NS)["last-modified"]
+    assert is_not_modified(request(if_modified_since=date), ETAG, MTIME_NS)
+    assert not is_not_modified(request(if_modified_since=date), ETAG, MTIME_NS + 2_000_000_000)
+    assert not is_not_modified(request(if_modified_since="ayer"), ETAG, MTIME_NS)
+    # If-None-Match manda aunque la fecha coincida
+    assert not is_not_modified(request(if_none_match='"x"', if_modified_since=date), ETAG, MTIME_NS)
+
+
+def test_page_endpoint_304_and_206(client, make_comic):
+    comic = make_comic(pages=1)
+    data = bytes(range(256)) * 4
+    os.makedirs(COMICS_DIR, exist_ok=True)
+    with zipfile.ZipFile(os.path.join(COMICS_DIR, comic.filename), "w") as z:
+        z.writestr("01.png", b"\x89PNG\r\n\x1a\n" + data)
+    url = f"/comics/{comic.id}/page/0"
+
+    full = client.get(url)
+    etag = full.headers["etag"]
+    assert full.status_code == 200
+    assert full.headers["accept-ranges"] == "bytes"
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    part = client.get(url, headers={"Range": "bytes=8-15", "If-Range": etag})
+    assert part.status_code == 206
+    assert part.headers["content-range"] == f"bytes 8-15/{len(full.content)}"
+    assert part.content == full.content[8:16]
+
+    assert client.get(url, headers={"Range": f"bytes={len(full.content)}-"}).status_code == 416
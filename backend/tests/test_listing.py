@@ -0,0 +1,71 @@
+from app import crud
+
+
+def walk(client, limit: int, **params) -> list[dict]:
+    items, cursor = [], None
+    while True:
+        query = {"limit": limit, **params, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/comics", params=query).json()
+        assert len(body["items"]) <= limit
+        items += body["items"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def order(item: dict) -> tuple:
+    # Orden de SQLite: series NULL primero
+    return (item["series"] is not None, item["series"] or "", item["volume"], item["id"])
+
+
+def test_cursor_pages_cover_library_once_in_order(client, make_comic):
+    created = {make_comic(series=None, volume=v).id for v in (2, 1, 1)}
+    created |= {make_comic(series=s, volume=v).id for s, v in
+                (("Beta", 1), ("Alfa", 3), ("Alfa", 1), ("Alfa", 1), ("Beta", 9999))}
+
+    for limit in (1, 2, 3):
+        items = walk(client, limit)
+        ids = [item["id"] for item in items]
+        assert len(ids) == len(set(ids))
+        assert created <= set(ids)
+        assert items == sorted(items, key=order)
+
+
+def test_cursor_crosses_from_null_series(client, db, make_comic):
+    make_comic(series=None, volume=1)
+    make_comic(series="Gamma", volume=1)
+    rows, _ = crud.get_comics(db, limit=1000)
+    last_null = max((row for row in rows if row.series is None), key=lambda row: (row.volume, row.id))
+
+    after, _ = crud.get_comics(db, limit=1000, cursor=crud.encode_cursor(None, last_null.volume, last_null.id))
+
+    assert [row.id for row in after] == [row.id for row in rows[rows.index(last_null) + 1:]]
+    assert after and after[0].series is not None
+
+
+def test_series_filter_and_invalid_cursor(client, make_comic):
+    ids = [make_comic(series="Delta", volume=v).id for v in (3, 1, 2)]
+
+    items = walk(client, 2, series="Delta")
+
+    assert [item["id"] for item in items] == [ids[1], ids[2], ids[0]]
+    assert client.get("/comics", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def test_status_read_is_being_on_last_page(client, make_user, make_comic, auth_headers):
+    user = make_user()
+    single = make_comic(pages=1, series="Estado")
+    last = make_comic(pages=10, series="Estado")
+    middle = make_comic(pages=10, series="Estado")
+    fresh = make_comic(pages=10, series="Estado")
+    for comic, current in ((last, 9), (middle, 5)):
+        client.post(f"/progress/{comic.id}", json={"current": current, "reading_mode": "single"},
+                    headers=auth_headers(user))
+
+    def listed(status: str) -> set[int]:
+        body = client.get("/comics", params={"status": status, "series": "Estado"}, headers=auth_headers(user)).json()
+        return {item["id"] for item in body["items"]}
+
+    assert listed("read") == {single.id, last.id}
+    assert listed("reading") == {middle.id}
+    assert listed("unread") == {fresh.id}
@@ -0,0 +1,90 @@
+import io
+import zipfile
+
+from PIL import Image
+
+from app.optimize import OptimizeOptions, optimize_archive
+
+
+def png(color, size=(64, 64)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+PAGES = {"p1.png": png((255, 0, 0)), "p2.png": png((0, 255, 0)), "p10.png": png((0, 0, 255))}
+
+
+def messy_archive(path):
+    # Páginas comprimidas y desordenadas, basura y un ComicInfo.xml por medio
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("p10.png", PAGES["p10.png"])
+        z.writestr("__MACOSX/._p10.png", b"basura")
+        z.writestr("ComicInfo.xml", b"<ComicInfo><Title>x</Title></ComicInfo>")
+        z.writestr("p2.png", PAGES["p2.png"])
+        z.writestr(".DS_Store", b"basura")
+        z.writestr("p1.png", PAGES["p1.png"])
+        z.comment = b"comentario"
+
+
+def test_dry_run_reports_without_touching_the_file(tmp_path):
+    path = tmp_path / "comic.cbz"
+    messy_archive(path)
+    before = path.read_bytes()
+
+    report = optimize_archive(str(path), OptimizeOptions(), dry_run=True)
+
+    assert path.read_bytes() == before
+    assert list(tmp_path.iterdir()) == [path]
+    assert (report.rewritten, report.junk, report.deflated, report.reordered, report.error) == (
+        True, 2, 3, True, None)
+    rewritten = optimize_archive(str(path), OptimizeOptions())
+    assert report.size_after == rewritten.size_after == path.stat().st_size
+
+
+def test_rewrite_keeps_pages_in_order_and_content(tmp_path):
+    path = tmp_path / "comic.cbz"
+    messy_archive(path)
+
+    result = optimize_archive(str(path), OptimizeOptions())
+
+    assert result.rewritten and result.error is None
+    assert list(tmp_path.iterdir()) == [path]  # sin temporales
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert z.namelist() == ["p1.png", "p2.png", "p10.png", "ComicInfo.xml"]
+        assert [z.read(name) for name in ["p1.png", "p2.png", "p10.png"]] == [
+            PAGES["p1.png"], PAGES["p2.png"], PAGES["p10.png"]]
+        assert [info.compress_type for info in z.infolist()] == [zipfile.ZIP_STORED] * 3 + [zipfile.ZIP_DEFLATED]
+        assert z.comment == b"comentario"
+
+    # Ya optimizado: no se vuelve a escribir
+    again = optimize_archive(str(path), OptimizeOptions())
+    assert not again.rewritten and again.size_after == again.size_before
+
+
+def test_png_to_lossless_webp_keeps_pixels(tmp_path):
+    noisy = Image.effect_noise((256, 256), 40).convert("RGB")
+    out = io.BytesIO()
+    noisy.save(out, "PNG", compress_level=0)
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("01.png", out.getvalue())
+
+    result = optimize_archive(str(path), OptimizeOptions(webp="lossless", png_min_bytes=0))
+
+    assert result.webp == 1
+    with zipfile.ZipFile(path) as z:
+        assert z.namelist() == ["01.webp"]
+        with Image.open(io.BytesIO(z.read("01.webp"))) as img:
+            assert img.convert("RGB").tobytes() == noisy.tobytes()
+
+
+def test_broken_archive_is_reported_and_left_alone(tmp_path):
+    path = tmp_path / "roto.cbz"
+    path.write_bytes(b"PK\x03\x04 no es un zip")
+
+    result = optimize_archive(str(path), OptimizeOptions())
+
+    assert result.error and not result.rewritten
+    assert path.read_bytes() == b"PK\x03\x04 no es un zip"
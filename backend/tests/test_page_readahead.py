@@ -0,0 +1,32 @@
+import pytest
+
+from app import main
+from app.progress_store import Progress, progress_store
+
+
+@pytest.fixture
+def warmed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.readahead, "warm",
+                        lambda index, center, mode="double", backwards=False, params=None:
+                        calls.append((center, mode)))
+    return calls
+
+
+def test_page_readahead_uses_stored_reading_mode(client, make_user, auth_headers, comic_file, warmed):
+    user = make_user()
+    progress_store.put(user.id, comic_file.id, Progress(1, "webtoon", "ltr"))
+    try:
+        response = client.get(f"/comics/{comic_file.id}/page/2", headers=auth_headers(user))
+    finally:
+        progress_store.discard_user(user.id)
+
+    assert response.status_code == 200
+    assert warmed == [(2, "webtoon")]
+
+
+def test_page_readahead_default_mode_without_session(client, comic_file, warmed):
+    assert client.get(f"/comics/{comic_file.id}/page/0").status_code == 200
+    assert client.get(f"/comics/{comic_file.id}/pages/batch?from=2&count=2").status_code == 200
+
+    assert warmed == [(0, "double"), (3, "double")]
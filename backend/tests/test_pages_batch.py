@@ -0,0 +1,66 @@
+import io
+import os
+import zipfile
+
+from PIL import Image
+
+from app import main
+from app.config import COMICS_DIR
+from app.http_cache import REVALIDATE_CACHE_CONTROL
+from app.shared_cache import read_cached
+
+
+def parts(response) -> list[tuple[dict, bytes]]:
+    boundary = response.headers["content-type"].split("boundary=")[1].encode()
+    result = []
+    for chunk in response.content.split(b"--" + boundary)[1:-1]:
+        head, _, body = chunk.strip(b"\r\n").partition(b"\r\n\r\n")
+        headers = dict(line.decode().split(": ", 1) for line in head.split(b"\r\n"))
+        result.append((headers, body))
+    return result
+
+
+def test_batch_parts_and_revalidation(client, comic_file):
+    url = f"/comics/{comic_file.id}/pages/batch?from=1&count=3"
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    with zipfile.ZipFile(os.path.join(COMICS_DIR, comic_file.filename)) as z:
+        expected = [z.read(f"{number:02}.png") for number in (1, 2, 3)]
+    got = parts(response)
+    assert [headers["X-Page-Index"] for headers, _ in got] == ["1", "2", "3"]
+    assert [body for _, body in got] == expected
+
+    revalidated = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+    other = client.get(f"/comics/{comic_file.id}/pages/batch?from=2&count=3")
+    assert other.headers["etag"] != response.headers["etag"]
+
+
+def test_batch_renditions(client, comic_file):
+    response = client.get(f"/comics/{comic_file.id}/pages/batch?from=4&count=5&width=16&format=jpeg")
+
+    got = parts(response)
+    assert [headers["Content-Type"] for headers, _ in got] == ["image/jpeg", "image/jpeg"]
+    assert Image.open(io.BytesIO(got[0][1])).size == (16, 24)
+
+
+def test_read_cached_regenerates_evicted_file(tmp_path):
+    path = tmp_path / "entry"
+    calls = []
+
+    def get_path():
+        # La primera ruta ya la borró otro worker; la segunda es la regenerada
+        calls.append(1)
+        if len(calls) == 2:
+            path.write_bytes(b"regenerada")
+        return path
+
+    assert read_cached(get_path) == b"regenerada"
+    assert len(calls) == 2
+
+
+def test_batch_out_of_range(client, comic_file):
+    assert client.get(f"/comics/{comic_file.id}/pages/batch?from=6").status_code == 404
+    assert main.page_io.pending == 0
@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.process_lock import ProcessLock
+
+
+def test_only_one_holder(tmp_path):
+    first, second = ProcessLock(tmp_path / "leader"), ProcessLock(tmp_path / "leader")
+
+    assert first.acquire(blocking=False)
+    assert not second.acquire(blocking=False)
+    first.release()
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+@pytest.fixture
+def lifespan(monkeypatch):
+    # Que el apagado no pare los executors que usan las demás pruebas
+    for target in (main.page_io, main.readahead, main.thumbnails):
+        monkeypatch.setattr(target, "shutdown", lambda: None)
+    return lambda: TestClient(main.app)
+
+
+def test_only_the_leader_watches_and_scans(monkeypatch, lifespan):
+    started = []
+    monkeypatch.setattr(main.library_watcher, "start", lambda: started.append("watcher"))
+    monkeypatch.setattr(main.library_scanner, "start", lambda: started.append("scanner"))
+    other_worker = ProcessLock(main.library_leader.path)
+    assert other_worker.acquire(blocking=False)
+    try:
+        with lifespan():
+            assert not main.library_leader.held
+    finally:
+        other_worker.release()
+    assert started == []
+
+    with lifespan():
+        assert main.library_leader.held
+    assert started == ["watcher", "scanner"]
+    assert not main.library_leader.held
@@ -0,0 +1,105 @@
+from app import models
+from app.progress_store import Progress, ProgressStore, progress_store
+
+
+def saved(db, user_id: int, comic_id: int):
+    db.expire_all()
+    return db.query(models.ReadingProgress).filter_by(user_id=user_id, comic_id=comic_id).first()
+
+
+def test_read_after_write_before_flush(db, make_user, make_comic):
+    store = ProgressStore(interval=60, batch_size=10)
+    user, comic = make_user(), make_comic()
+    store.put(user.id, comic.id, Progress(3, "single", "rtl"))
+
+    assert store.get(db, user.id, comic.id) == Progress(3, "single", "rtl")
+    assert saved(db, user.id, comic.id) is None
+
+    assert store.flush() == 1
+    row = saved(db, user.id, comic.id)
+    assert (row.current_page, row.reading_mode, row.reading_direction) == (3, "single", "rtl")
+    assert store.stats()["pending"] == 0
+
+
+def test_bad_entry_does_not_block_the_batch(db, make_user, make_comic):
+    store = ProgressStore(interval=60, batch_size=10)
+    good, bad, comic = make_user(), make_user(), make_comic()
+    store.put(bad.id, comic.id, Progress({"x": 1}))  # type: ignore[arg-type]
+    store.put(good.id, comic.id, Progress(4))
+
+    assert store.flush() == 1
+    assert saved(db, good.id, comic.id).current_page == 4
+    assert saved(db, bad.id, comic.id) is None
+    stats = store.stats()
+    assert stats["pending"] == 0
+    assert stats["errors"] >= 1
+    assert stats["rows_flushed"] == 1
+
+
+def test_flush_single_user(db, make_user, make_comic):
+    store = ProgressStore(interval=60, batch_size=10)
+    first, second, comic = make_user(), make_user(), make_comic()
+    store.put(first.id, comic.id, Progress(1))
+    store.put(second.id, comic.id, Progress(2))
+
+    assert store.flush(first.id) == 1
+    assert saved(db, first.id, comic.id).current_page == 1
+    assert saved(db, second.id, comic.id) is None
+    assert store.stats()["pending"] == 1
+
+
+def test_stop_flushes_pending(db, make_user, make_comic):
+    store = ProgressStore(interval=60, batch_size=10)
+    user, comic = make_user(), make_comic()
+    store.start()
+    store.put(user.id, comic.id, Progress(7))
+    store.stop()
+
+    assert saved(db, user.id, comic.id).current_page == 7
+    assert store.stats()["pending"] == 0
+
+
+def test_stale_flush_does_not_overwrite_newer_position(db, make_user, make_comic):
+    # Dos workers con su propio buffer: el que vuelca tarde tiene la posición vieja
+    stale, fresh = ProgressStore(interval=60, batch_size=10), ProgressStore(interval=60, batch_size=10)
+    user, comic = make_user(), make_comic()
+    stale.put(user.id, comic.id, Progress(2))
+    fresh.put(user.id, comic.id, Progress(8))
+
+    fresh.flush()
+    stale.flush()
+
+    rows = db.query(models.ReadingProgress).filter_by(user_id=user.id, comic_id=comic.id).all()
+    assert [row.current_page for row in rows] == [8]
+
+
+def test_write_through_without_write_behind(db, make_user, make_comic):
+    store = ProgressStore(interval=60, batch_size=10, write_behind=False)
+    user, comic = make_user(), make_comic()
+    store.put(user.id, comic.id, Progress(5, "webtoon"))
+
+    assert saved(db, user.id, comic.id).reading_mode == "webtoon"
+    assert store.stats()["pending"] == 0
+
+
+def test_invalid_payload_is_rejected(client, make_user, make_comic, auth_headers):
+    user, comic = make_user(), make_comic()
+    pending = progress_store.stats()["pending"]
+    for body in ({"current": {"x": 1}}, {"current": -1}, {"reading_mode": "sideways"},
+                 {"reading_direction": "up"}):
+        response = client.post(f"/progress/{comic.id}", json=body, headers=auth_headers(user))
+        assert response.status_code == 422, body
+    assert progress_store.stats()["pending"] == pending
+
+
+def test_status_filter_sees_unflushed_progress(client, make_user, make_comic, auth_headers):
+    user = make_user()
+    comic = make_comic(pages=10, series="Status filter")
+    response = client.post(f"/progress/{comic.id}", json={"current": 5, "reading_mode": "single"},
+                           headers=auth_headers(user))
+    assert response.status_code == 200
+
+    listing = client.get("/comics", params={"status": "reading", "series": "Status filter"},
+                         headers=auth_headers(user))
+    assert [item["id"] for item in listing.json()["items"]] == [comic.id]
+    assert client.get(f"/progress/{comic.id}", headers=auth_headers(user)).json()["current"] == 5
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+import zlib
+
+import pytest
+from PIL import Image
+
+from app import utils
+from app.archives import ArchiveError
+from app.utils import page_hash, scan_pages
+
+
+def image(fmt: str, size: tuple[int, int]) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(out, fmt)
+    return out.getvalue()
+
+
+def test_dimensions_and_format_from_headers(tmp_path):
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("page10.jpg", image("JPEG", (300, 400)), zipfile.ZIP_DEFLATED)
+        z.writestr("page2.png", image("PNG", (800, 500)), zipfile.ZIP_STORED)
+        z.writestr("notes.txt", b"no es una pagina")
+
+    pages = scan_pages(str(path)).pages
+
+    assert [page.name for page in pages] == ["page2.png", "page10.jpg"]
+    assert [(page.media_type, page.width, page.height, page.is_spread) for page in pages] == [
+        ("image/png", 800, 500, True),
+        ("image/jpeg", 300, 400, False),
+    ]
+
+
+def test_content_hash_streamed_matches_full_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "HASH_CHUNK_BYTES", 4096)
+    big = image("PNG", (600, 600)) + bytes(range(256)) * 64
+    small = image("JPEG", (40, 60))
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("01.png", big, zipfile.ZIP_DEFLATED)
+        z.writestr("02.jpg", small, zipfile.ZIP_STORED)
+
+    pages = scan_pages(str(path)).pages
+
+    assert [page.content_hash for page in pages] == [page_hash(big), page_hash(small)]
+    assert [page.crc for page in pages] == [zlib.crc32(big), zlib.crc32(small)]
+
+
+def test_without_content_hash_only_headers(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "PAGE_CONTENT_HASH", False)
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("01.png", image("PNG", (80, 50)))
+
+    page, = scan_pages(str(path)).pages
+
+    assert (page.content_hash, page.width, page.height) == ("", 80, 50)
+
+
+@pytest.mark.parametrize("chunk", [7, 4096, 1 << 20])
+def test_file_and_page_hashes_in_one_pass(tmp_path, monkeypatch, chunk):
+    monkeypatch.setattr(utils, "HASH_CHUNK_BYTES", chunk)
+    monkeypatch.setattr(utils, "_hash_page", lambda *args: pytest.fail("página leída aparte"))
+    pages = {"01.png": image("PNG", (300, 200)) + bytes(5000), "02.jpg": image("JPEG", (40, 60)),
+             "03.png": image("PNG", (10, 10))}
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("02.jpg", pages["02.jpg"], zipfile.ZIP_STORED)
+        z.writestr("01.png", pages["01.png"], zipfile.ZIP_DEFLATED)
+        z.writestr("03.png", pages["03.png"], zipfile.ZIP_DEFLATED)
+
+    scan = scan_pages(str(path), file_hash=True)
+
+    assert scan.content_hash == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert [page.content_hash for page in scan.pages] == [page_hash(pages[name]) for name in sorted(pages)]
+
+
+def test_file_hash_of_tar(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "HASH_CHUNK_BYTES", 100)
+    data = image("PNG", (30, 20))
+    path = tmp_path / "comic.cbt"
+    with tarfile.open(path, "w") as tar:
+        info = tarfile.TarInfo("01.png")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    scan = scan_pages(str(path), file_hash=True)
+
+    assert scan.content_hash == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert [(page.content_hash, page.crc) for page in scan.pages] == [(page_hash(data), zlib.crc32(data))]
+
+
+def test_corrupt_page_fails_the_scan(tmp_path):
+    data = image("PNG", (30, 20))
+    path = tmp_path / "comic.cbz"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("01.png", data, zipfile.ZIP_STORED)
+    raw = bytearray(path.read_bytes())
+    raw[raw.index(data) + len(data) - 1] ^= 0xFF
+    path.write_bytes(bytes(raw))
+
+    with pytest.raises(ArchiveError):
+        scan_pages(str(path), file_hash=True)
@@ -0,0 +1,32 @@
+import zipfile
+
+from app.scanner import list_library
+
+
+def touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def cbz(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("01.jpg", b"x")
+
+
+def test_series_folder_with_cover_keeps_its_volumes(tmp_path):
+    touch(tmp_path / "Serie" / "cover.jpg")
+    touch(tmp_path / "Serie" / "Vol 1" / "01.jpg")
+    touch(tmp_path / "Serie" / "Vol 1" / "02.jpg")
+    cbz(tmp_path / "Otra" / "Tomos" / "Otra v01.cbz")
+    touch(tmp_path / "Otra" / "folder.jpg")
+    touch(tmp_path / "Suelto" / "01.png")
+    touch(tmp_path / "Suelto" / ".thumbs" / "01.png")
+    touch(tmp_path / "Suelto" / "extras" / "notas.txt")
+    cbz(tmp_path / "Mixta" / "Mixta v01.cbz")
+    touch(tmp_path / "Mixta" / "cover.jpg")
+
+    found = list_library(tmp_path)
+
+    assert sorted(found) == ["Mixta/Mixta v01.cbz", "Otra/Tomos/Otra v01.cbz", "Serie/Vol 1", "Suelto"]
+    assert found["Serie/Vol 1"][0] == 2
@@ -0,0 +1,115 @@
+import os
+import time
+
+from app.shared_cache import SharedCache
+
+
+def make_store(root, max_bytes=100, touch_interval=0.0, grace=0.0):
+    store = SharedCache(root, max_bytes, touch_interval, mapped_files=8)
+    store.grace_seconds = grace
+    return store, store.space("test")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store, space = make_store(tmp_path)
+    space.put("a", b"a" * 40)
+    space.put("b", b"b" * 40)
+    assert bytes(space.read("a")) == b"a" * 40  # a pasa a ser la más reciente
+    space.put("c", b"c" * 40)
+
+    assert "a" in space and "c" in space
+    assert "b" not in space
+    assert store.stats()["bytes"] == 80
+    assert store.stats()["evictions"] == 1
+
+
+def test_recently_returned_entries_are_not_evicted(tmp_path):
+    first, first_space = make_store(tmp_path, touch_interval=60, grace=60)
+    first_space.put("a", b"a" * 60)
+    path = first_space.get_or_create("a", lambda: b"")
+
+    # Otro proceso (otra conexión al mismo índice) llena la caché
+    other, other_space = make_store(tmp_path, touch_interval=60, grace=60)
+    other_space.put("b", b"b" * 60)
+
+    assert path.exists()
+    assert other.stats()["bytes"] == 120  # por encima del límite hasta que a deje de estar en uso
+    other.grace_seconds = 0
+    other_space.put("c", b"c" * 10)
+    assert not path.exists()
+
+
+def test_first_hit_is_written_immediately(tmp_path):
+    store, space = make_store(tmp_path, touch_interval=60)
+    space.put("a", b"a" * 40)
+    space.put("b", b"b" * 40)
+    time.sleep(0.01)
+    space.get_or_create("a", lambda: b"")
+
+    # Otro proceso ya ve el acceso a a: expulsa b
+    other, other_space = make_store(tmp_path)
+    other_space.put("c", b"c" * 40)
+    assert "a" in other_space and "b" not in other_space
+
+
+def test_get_or_create_regenerates_missing_files(tmp_path):
+    store, space = make_store(tmp_path)
+    path = space.get_or_create("k", lambda: b"one")
+    os.unlink(path)
+    assert space.get_or_create("k", lambda: b"two").read_bytes() == b"two"
+    assert space.stats()["misses"] == 2
+
+
+def test_state_survives_restart(tmp_path):
+    store, space = make_store(tmp_path)
+    space.put("a", b"a" * 30)
+    store.close()
+
+    again, again_space = make_store(tmp_path)
+    assert bytes(again_space.read("a")) == b"a" * 30
+    assert again.stats()["files"] == 1
+    assert again_space.stats()["hits"] == 1
+
+
+def test_maintain_reconciles_index_and_disk(tmp_path):
+    store, space = make_store(tmp_path, max_bytes=1000)
+    space.put("gone", b"x" * 10)
+    os.unlink(tmp_path / "test" / "gone")
+    (tmp_path / "test" / "orphan").write_bytes(b"y" * 20)
+    stale = tmp_path / "test" / "half.123-4.tmp"
+    stale.write_bytes(b"z")
+    os.utime(stale, (0, 0))
+
+    assert store.maintain()
+    assert "orphan" in space and space.sizes() == [("orphan", 20)]
+    assert store.stats()["bytes"] == 20
+    assert not stale.exists()
+
+
+def test_maps_of_files_removed_by_another_worker_are_dropped(tmp_path):
+    store, space = make_store(tmp_path, max_bytes=1000)
+    space.put("a", b"a" * 40)
+    space.put("b", b"b" * 40)
+    assert bytes(space.read("a")) == b"a" * 40
+    assert bytes(space.read("b")) == b"b" * 40
+
+    # Otro worker expulsa a y regenera b con otro contenido (otro inodo)
+    os.unlink(store.path("test/a"))
+    other, other_space = make_store(tmp_path, max_bytes=1000)
+    other_space.put("b", b"B" * 30)
+
+    assert space.read("a") is None
+    assert bytes(space.read("b")) == b"B" * 30
+    assert store.stats()["mapped"] == 1
+
+
+def test_periodic_sweep_drops_unread_stale_maps(tmp_path):
+    store, space = make_store(tmp_path, max_bytes=1000)
+    space.put("a", b"a" * 40)
+    space.put("c", b"c" * 40)
+    space.read("a")
+    os.unlink(store.path("test/a"))
+
+    space.read("c")  # touch_interval=0: cada acceso es un volcado periódico
+
+    assert store.stats()["mapped"] == 1
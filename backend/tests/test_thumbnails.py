@@ -0,0 +1,58 @@
+import json
+import os
+import struct
+import zipfile
+
+from app import thumbnails
+from app.config import COMICS_DIR
+from app.thumbnails import THUMBNAIL_PARAMS, THUMBPACK_MAGIC
+
+
+def read_manifest(pack: bytes) -> dict:
+    assert pack[:4] == THUMBPACK_MAGIC
+    (length,) = struct.unpack(">I", pack[4:8])
+    return json.loads(pack[8:8 + length])
+
+
+def test_thumbpack_endpoint(client, comic_file):
+    response = client.get(f"/comics/{comic_file.id}/thumbnails")
+
+    assert response.status_code == 200
+    manifest = read_manifest(response.content)
+    assert manifest["width"] == THUMBNAIL_PARAMS.width
+    assert [page[2:] for page in manifest["pages"]] == [[20, 30]] * 6
+
+
+def test_thumbnail_survives_eviction_between_produce_and_read(db, comic_file, monkeypatch):
+    index = thumbnails.get_page_index(db, comic_file)
+    produced = []
+    real = thumbnails.get_page_rendition
+
+    def evicting_rendition(index, entry, params):
+        path = real(index, entry, params)
+        produced.append(path)
+        if len(produced) == 1:
+            os.unlink(path)  # otro worker la expulsa justo después de devolverla
+        return path
+
+    monkeypatch.setattr(thumbnails, "get_page_rendition", evicting_rendition)
+    data, width, height = thumbnails._thumbnail(index, 2)
+
+    assert len(produced) == 2
+    assert data[:4] == b"RIFF"
+    assert (width, height) == (20, 30)
+
+
+def test_cover_is_regenerated_and_missing_cover_is_404(client, db, comic_file, make_comic):
+    response = client.get(f"/comics/{comic_file.id}/cover")
+    assert response.status_code == 200
+    db.refresh(comic_file)
+    os.unlink(thumbnails.CACHE_DIR / comic_file.cover_path)
+
+    assert client.get(f"/comics/{comic_file.id}/cover").content == response.content
+
+    # Sin páginas no hay portada: 404, no un error al hacer stat de None
+    empty = make_comic(pages=0)
+    with zipfile.ZipFile(os.path.join(COMICS_DIR, empty.filename), "w") as z:
+        z.writestr("notas.txt", b"sin paginas")
+    assert client.get(f"/comics/{empty.id}/cover").status_code == 404
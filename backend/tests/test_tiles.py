@@ -0,0 +1,46 @@
+import io
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+from app import tiles
+from app.config import COMICS_DIR, TILE_HEIGHT
+
+
+@pytest.fixture
+def strip(make_comic):
+    """Cómic de una página alta: 2,5 tiles a su ancho original."""
+    comic = make_comic(pages=1)
+    out = io.BytesIO()
+    Image.new("RGB", (40, TILE_HEIGHT * 5 // 2), (0, 90, 0)).save(out, "PNG")
+    os.makedirs(COMICS_DIR, exist_ok=True)
+    with zipfile.ZipFile(os.path.join(COMICS_DIR, comic.filename), "w") as z:
+        z.writestr("01.png", out.getvalue())
+    return comic
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    calls = []
+    real = tiles.strip_cache.get
+    monkeypatch.setattr(tiles.strip_cache, "get", lambda *args: calls.append(args) or real(*args))
+    return calls
+
+
+def test_out_of_range_tile_is_rejected_without_decoding(client, strip, decodes):
+    for tile in (3, 100, -1):
+        assert client.get(f"/comics/{strip.id}/page/0/tiles/{tile}").status_code == 404
+    # A la mitad del ancho la tira mide 1,25 tiles: solo existen el 0 y el 1
+    assert client.get(f"/comics/{strip.id}/page/0/tiles/2?width=20").status_code == 404
+    assert decodes == []
+
+
+def test_last_tile_is_shorter(client, strip, decodes):
+    response = client.get(f"/comics/{strip.id}/page/0/tiles/2?format=webp")
+
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.content)) as img:
+        assert img.size == (40, TILE_HEIGHT // 2)
+    assert len(decodes) == 1
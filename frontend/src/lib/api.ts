@@ -12,9 +12,19 @@ export async function uploadComic(file: File) {
   return res.json();
 }
 
-export async function getComics() {
-  const res = await fetch(`${API_URL}/comics`);
-  return res.json();
+// El listado va paginado por cursor; aquí se recorren todas las páginas
+export async function getComics(params: Record<string, string> = {}) {
+  const comics = [];
+  let cursor = null;
+  do {
+    const query = new URLSearchParams({ view: "grid", limit: "500", ...params });
+    if (cursor) query.set("cursor", cursor);
+    const res = await fetch(`${API_URL}/comics?${query}`);
+    const page = await res.json();
+    comics.push(...page.items);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return comics;
 }
 
 export async function getComicPages(comicId: number) {
@@ -26,6 +36,26 @@ export function getPageUrl(comicId: number, pageIndex: number) {
   return `${API_URL}/comics/${comicId}/page/${pageIndex}`;
 }
 
+export function getCoverUrl(comicId: number) {
+  return `${API_URL}/comics/${comicId}/cover`;
+}
+
+// Todas las miniaturas en una sola petición:
+// "CVTP" + uint32 (longitud del manifiesto) + manifiesto JSON + imágenes concatenadas
+export async function getThumbnails(comicId: number) {
+  const res = await fetch(`${API_URL}/comics/${comicId}/thumbnails`);
+  const buffer = await res.arrayBuffer();
+  const view = new DataView(buffer);
+  const manifestLength = view.getUint32(4);
+  const manifest = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, manifestLength)));
+  const dataStart = 8 + manifestLength;
+  return manifest.pages.map(([offset, length, width, height]: number[]) => ({
+    url: URL.createObjectURL(new Blob([buffer.slice(dataStart + offset, dataStart + offset + length)], { type: manifest.media_type })),
+    width,
+    height
+  }));
+}
+
 export let token = "";
 
 export function setToken(t: string) {
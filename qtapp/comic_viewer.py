@@ -1,18 +1,131 @@
+import os
 import sys
-import zipfile
-#import rarfile
+from collections import OrderedDict
+from io import BytesIO
 from PIL import Image
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QRunnable
+from PyQt5.QtCore import QSize
 from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QThreadPool
+from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtGui import QImage
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QAction
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtWidgets import QMainWindow
+from PyQt5.QtWidgets import QSizePolicy
 from PyQt5.QtWidgets import QToolBar
 from PyQt5.QtWidgets import QVBoxLayout
 from PyQt5.QtWidgets import QWidget
 
+# Lectores de archivos compartidos con el backend (solo biblioteca estándar)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from app.archives import ArchiveError, open_archive
+
+
+# Páginas que se decodifican por adelantado a cada lado de la actual
+PREFETCH_PAGES = int(os.getenv("PREFETCH_PAGES", "3"))
+# Memoria máxima de las páginas ya escaladas
+PIXMAP_CACHE_MB = int(os.getenv("PIXMAP_CACHE_MB", "256"))
+# Espera tras el último evento de redimensionado antes de volver a escalar
+RESIZE_DEBOUNCE_MS = int(os.getenv("RESIZE_DEBOUNCE_MS", "150"))
+
+
+def decode_image(data):
+    """
+    Decodifica la página directamente desde memoria. Qt cubre JPEG/PNG/GIF (y
+    WebP con el plugin de imageformats); lo demás pasa por PIL.
+    """
+    image = QImage.fromData(data)
+    if not image.isNull():
+        return image
+    img = Image.open(BytesIO(data)).convert("RGBA")
+    # copy(): el QImage no debe apuntar al buffer de PIL, que se libera al salir
+    return QImage(img.tobytes(), img.width, img.height, 4 * img.width, QImage.Format_RGBA8888).copy()
+
+
+class PixmapCache:
+    """
+    LRU de páginas ya escaladas, por (generación, página, ancho, alto) y
+    limitado en bytes. Solo se usa desde el hilo de la GUI.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pixmaps = OrderedDict()
+
+    @staticmethod
+    def _size(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        previous = self._pixmaps.pop(key, None)
+        if previous is not None:
+            self.bytes -= self._size(previous)
+        self._pixmaps[key] = pixmap
+        self.bytes += self._size(pixmap)
+        # Siempre se conserva la última página, aunque sola supere el límite
+        while self.bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, oldest = self._pixmaps.popitem(last=False)
+            self.bytes -= self._size(oldest)
+
+    def __contains__(self, key):
+        return key in self._pixmaps
+
+    def clear(self):
+        self._pixmaps.clear()
+        self.bytes = 0
+
+
+class RenderSignals(QObject):
+    # (generación, página, tamaño, imagen escalada, suavizada) / (generación, página, error)
+    rendered = pyqtSignal(int, int, QSize, QImage, bool)
+    failed = pyqtSignal(int, int, str)
+
+
+class RenderTask(QRunnable):
+    """
+    Lee, decodifica y escala una página en el QThreadPool, fuera del hilo de
+    la GUI. La imagen a resolución completa solo vive dentro de la tarea: a la
+    GUI llega ya escalada al tamaño de la vista.
+
+    Con preview se envía antes un escalado rápido (sin suavizar) para mostrar
+    algo cuanto antes, y después la versión suavizada que la sustituye.
+    """
+
+    def __init__(self, reader, generation, number, size, signals, preview=False):
+        super().__init__()
+        self.reader = reader
+        self.generation = generation
+        self.number = number
+        self.size = size
+        self.signals = signals
+        self.preview = preview
+
+    def run(self):
+        try:
+            image = decode_image(self.reader.read(self.number))
+            if self.preview:
+                fast = image.scaled(self.size, Qt.KeepAspectRatio, Qt.FastTransformation)
+                self.signals.rendered.emit(self.generation, self.number, self.size, fast, False)
+            smooth = image.scaled(self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            del image
+        except Exception as e:
+            self.signals.failed.emit(self.generation, self.number, str(e))
+            return
+        self.signals.rendered.emit(self.generation, self.number, self.size, smooth, True)
+
 
 class ComicViewer(QMainWindow):
     def __init__(self):
@@ -24,10 +137,28 @@ class ComicViewer(QMainWindow):
         self.current_page = 0
         self.pages = []
         self.folder_path = ""
+        self.reader = None
+        # Cada cómic abierto es una generación nueva: se descartan los
+        # resultados que lleguen tarde del anterior
+        self.generation = 0
+        self.pending = set()
+        self.cache = PixmapCache(PIXMAP_CACHE_MB * 1024 * 1024)
+        self.pool = QThreadPool(self)
+        self.signals = RenderSignals()
+        self.signals.rendered.connect(self.on_page_rendered)
+        self.signals.failed.connect(self.on_page_failed)
+        # Lo que hay en pantalla, para reescalarlo al vuelo mientras se redimensiona
+        self.shown = None
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_DEBOUNCE_MS)
+        self.resize_timer.timeout.connect(self.show_page)
         
         # Widgets
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignCenter)
+        # Que el pixmap no fije el tamaño mínimo de la ventana
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         
         # Layout
         layout = QVBoxLayout()
@@ -48,6 +179,10 @@ class ComicViewer(QMainWindow):
         open_action.triggered.connect(self.open_comic)
         toolbar.addAction(open_action)
         
+        open_folder_action = QAction("Abrir carpeta", self)
+        open_folder_action.triggered.connect(self.open_folder)
+        toolbar.addAction(open_folder_action)
+        
         prev_action = QAction("Anterior", self)
         prev_action.triggered.connect(self.prev_page)
         toolbar.addAction(prev_action)
@@ -59,54 +194,111 @@ class ComicViewer(QMainWindow):
     def open_comic(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, "Abrir archivo", "", 
-            "Archivos de cómic (*.cbz *.cbr *.zip *.rar);;Imágenes (*.jpg *.png)"
+            "Archivos de cómic (*.cbz *.cbr *.cbt *.zip *.rar *.tar)"
         )
         
         if file_path:
-            self.folder_path = file_path
-            self.pages = self.extract_images(file_path)
-            self.current_page = 0
-            self.show_page()
+            self.load_comic(file_path)
     
-    def extract_images(self, file_path):
-        pages = []
-        
-        if file_path.endswith(".cbz") or file_path.endswith(".zip"):
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        pages.append(file)
-        
-        elif file_path.endswith(".cbr") or file_path.endswith(".rar"):
-            with rarfile.RarFile(file_path, 'r') as rar_ref:
-                for file in rar_ref.namelist():
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        pages.append(file)
-        
-        return sorted(pages)
+    def open_folder(self):
+        folder_path = QFileDialog.getExistingDirectory(self, "Abrir carpeta de imágenes")
+        if folder_path:
+            self.load_comic(folder_path)
+    
+    def load_comic(self, path):
+        try:
+            reader = open_archive(path)
+        except (ArchiveError, OSError) as e:
+            self.statusBar().showMessage(f"No se pudo abrir {path}: {e}")
+            return
+        self.close_reader()
+        self.reader = reader
+        self.folder_path = path
+        self.pages = reader.names()
+        self.current_page = 0
+        self.show_page()
+    
+    def close_reader(self):
+        # Lo que no ha empezado se cancela; lo que está en curso se espera
+        # antes de cerrar el archivo que están leyendo
+        self.generation += 1
+        self.pool.clear()
+        self.pool.waitForDone()
+        self.pending.clear()
+        self.cache.clear()
+        self.shown = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+    
+    def viewport(self):
+        size = self.image_label.size()
+        return QSize(max(size.width(), 1), max(size.height(), 1))
+    
+    def page_key(self, number, size):
+        return (self.generation, number, size.width(), size.height())
     
     def show_page(self):
         if not self.pages:
             return
         
-        if self.folder_path.endswith(".cbz") or self.folder_path.endswith(".zip"):
-            with zipfile.ZipFile(self.folder_path, 'r') as zip_ref:
-                with zip_ref.open(self.pages[self.current_page]) as page:
-                    img = Image.open(page)
-                    img.save("temp_page.png")  # Guardamos temporalmente
-                    
-        elif self.folder_path.endswith(".cbr") or self.folder_path.endswith(".rar"):
-            with rarfile.RarFile(self.folder_path, 'r') as rar_ref:
-                with rar_ref.open(self.pages[self.current_page]) as page:
-                    img = Image.open(page)
-                    img.save("temp_page.png")
-        
-        pixmap = QPixmap("temp_page.png")
-        self.image_label.setPixmap(pixmap.scaled(
-            self.image_label.width(), 
-            self.image_label.height(), 
-            Qt.KeepAspectRatio
-        ))
+        size = self.viewport()
+        pixmap = self.cache.get(self.page_key(self.current_page, size))
+        if pixmap is not None:
+            # Ya está al tamaño de la vista: no hay que escalar nada
+            self.display(pixmap)
+        else:
+            self.statusBar().showMessage(f"Cargando página {self.current_page + 1}...")
+            self.request_page(self.current_page, size, priority=1)
+        self.prefetch(size)
+    
+    def display(self, pixmap):
+        self.shown = pixmap
+        self.statusBar().showMessage(f"Página {self.current_page + 1} de {len(self.pages)}")
+        self.image_label.setPixmap(pixmap)
+    
+    def request_page(self, number, size, priority=0):
+        key = self.page_key(number, size)
+        if key in self.cache or key in self.pending:
+            return
+        self.pending.add(key)
+        self.pool.start(RenderTask(self.reader, self.generation, number, size, self.signals,
+                                   preview=priority > 0), priority)
+    
+    def prefetch(self, size):
+        # Primero las siguientes (sentido de lectura), después las anteriores
+        for distance in range(1, PREFETCH_PAGES + 1):
+            for number in (self.current_page + distance, self.current_page - distance):
+                if 0 <= number < len(self.pages):
+                    self.request_page(number, size)
+    
+    def on_page_rendered(self, generation, number, size, image, smooth):
+        if generation != self.generation:
+            return
+        key = (generation, number, size.width(), size.height())
+        # QPixmap solo se puede crear en el hilo de la GUI
+        pixmap = QPixmap.fromImage(image)
+        if smooth:
+            self.pending.discard(key)
+            self.cache.put(key, pixmap)
+        if number == self.current_page and size == self.viewport():
+            self.display(pixmap)
+    
+    def on_page_failed(self, generation, number, error):
+        self.pending = {key for key in self.pending if key[:2] != (generation, number)}
+        if generation == self.generation and number == self.current_page:
+            self.statusBar().showMessage(f"No se pudo leer la página {number + 1}: {error}")
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.shown is not None:
+            # Mientras se arrastra: escalado rápido de lo que ya está en
+            # pantalla (tamaño de la vista, no la página original)
+            self.image_label.setPixmap(self.shown.scaled(
+                self.viewport(), Qt.KeepAspectRatio, Qt.FastTransformation
+            ))
+        # Al terminar: versión suavizada al tamaño final
+        self.resize_timer.start()
     
     def prev_page(self):
         if self.current_page > 0:
@@ -118,6 +310,10 @@ class ComicViewer(QMainWindow):
             self.current_page += 1
             self.show_page()
 
+    def closeEvent(self, event):
+        self.close_reader()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     viewer = ComicViewer()